@@ -0,0 +1,200 @@
+"""CPU core sets and thread budgets of the detector processes."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import os
+
+# Thread pool sizes read by the BLAS and OpenMP libraries when they load.
+# They only take effect in processes started after they are set, or in this
+# process before NumPy and OpenCV are imported, see preset_threads().
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def parse_cores(text):
+    """
+    Parse a core list such as "0-3,6".
+
+    :param text: core list, "all" for all the cores this process may use,
+                 or "none" to leave the scheduling to the system
+    :return: sorted tuple of cores, None for "none"
+    """
+    if text == "none":
+        return None
+    if text == "all":
+        return tuple(sorted(os.sched_getaffinity(0)))
+    cores = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        cores.update(range(int(first), int(last or first) + 1))
+    return tuple(sorted(cores))
+
+
+def format_cores(cores):
+    """
+    Format a core set as a core list such as "0-3,6".
+
+    :param cores: iterable of cores
+    :return: core list
+    """
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(first) if first == last else
+                    "{}-{}".format(first, last) for first, last in ranges)
+
+
+def plan_layout(cores, workers):
+    """
+    Split a core set between the processes of the detector.
+    Step 1: Without workers the only process gets all cores.
+    Step 2: The capture process gets the first core, which it shares with
+            the main process that only collects the results.
+    Step 3: The other cores are split evenly between the workers. With
+            fewer cores than workers, each worker gets one core and workers
+            share cores in turn.
+
+    :param cores: cores the detector may use
+    :param workers: number of worker processes, 0 for a single process
+    :return: list of (name, cores) pairs, main process first
+    """
+    cores = tuple(cores)
+    if not workers:
+        return [("main", cores)]
+    layout = [("main", cores[:1]), ("capture", cores[:1])]
+    rest = cores[1:] or cores
+    if len(rest) >= workers:
+        share = len(rest) // workers
+        for i in range(workers):
+            last = len(rest) if i == workers - 1 else (i + 1) * share
+            layout.append(("worker{}".format(i + 1), rest[i * share: last]))
+    else:
+        for i in range(workers):
+            layout.append(("worker{}".format(i + 1),
+                           (rest[i % len(rest)],)))
+    return layout
+
+
+def print_layout(layout):
+    """
+    Print the cores and threads of every process.
+
+    :param layout: list of (name, cores) pairs
+    :return: None
+    """
+    print("CPU layout:")
+    for name, cores in layout:
+        print("  {:<8} cores {:<8} {} thread{}".format(
+            name, format_cores(cores), len(cores),
+            "" if len(cores) == 1 else "s"))
+
+
+def thread_environment(cores):
+    """
+    Return the thread pool variables matching a core set, for a process
+    about to be started.
+
+    :param cores: cores of the process
+    :return: dictionary of environment variables
+    """
+    return {name: str(len(cores)) for name in THREAD_VARIABLES}
+
+
+def start_process(process, cores):
+    """
+    Start a process with the thread pool variables of its core set, so its
+    BLAS and OpenMP pools are sized for it when they load.
+
+    :param process: multiprocessing Process, not started
+    :param cores: cores of the process, None for the system defaults
+    :return: None
+    """
+    if cores is None:
+        process.start()
+        return
+    saved = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update(thread_environment(cores))
+    try:
+        process.start()
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def preset_threads(argv):
+    """
+    Size the thread pools of the main process from its -cpu and -w
+    arguments. NumPy, OpenCV and their BLAS and OpenMP libraries read the
+    variables once when they load, so this runs before they are imported.
+    Variables already set by the user are kept.
+
+    :param argv: command line arguments of the detector
+    :return: None
+    """
+    # A plain scan, the argument parser of the detector is built later
+    values = {"-cpu": "none", "-w": "0"}
+    names = {"-cpu": "-cpu", "--cores": "-cpu", "-w": "-w",
+             "--workers": "-w"}
+    for i, arg in enumerate(argv):
+        name, equals, value = arg.partition("=")
+        if name not in names:
+            continue
+        if not equals:
+            value = argv[i + 1] if i + 1 < len(argv) else ""
+        values[names[name]] = value
+    try:
+        cores = parse_cores(values["-cpu"])
+        workers = int(values["-w"])
+    except ValueError:
+        # The argument parser of the detector reports it
+        return
+    if not cores:
+        return
+    main_cores = plan_layout(cores, workers)[0][1]
+    for name, value in thread_environment(main_cores).items():
+        os.environ.setdefault(name, value)
+
+
+def apply_budget(cores):
+    """
+    Pin the calling process to a core set and size the OpenCV thread pool
+    to it.
+
+    :param cores: cores of the process, None to change nothing
+    :return: None
+    """
+    # OpenCV is only loaded here, the module is imported before it
+    import cv2
+
+    if cores is None:
+        return
+    os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(len(cores))
@@ -0,0 +1,191 @@
+"""Per-camera calibration profiles."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import hashlib
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+
+class CalibrationProfile:
+    """
+    Calibration of one input: camera intrinsics, lens distortion,
+    millimeters per pixel and an optional perspective correction of the
+    belt plane.
+
+    The undistortion maps are computed once with initUndistortRectifyMap,
+    saved as .npy files in cache_dir and memory-mapped afterwards, so only
+    the pages covering an object ROI are ever read.
+
+    Contours and frames given to the profile may be cropped from the
+    captured frame; origin is the position of the crop in the captured frame.
+    """
+
+    def __init__(self, frame_size, mm_per_pixel, camera_matrix=None,
+                 dist_coeffs=None, perspective=None, cache_dir=None,
+                 origin=(0, 0)):
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.mm_per_pixel = mm_per_pixel
+        self.origin = np.array(origin, dtype=np.int16)
+        self.camera_matrix = None
+        self.dist_coeffs = None
+        self.perspective = None
+        if camera_matrix is not None:
+            self.camera_matrix = np.array(camera_matrix, dtype=np.float64)
+            self.dist_coeffs = np.array(dist_coeffs if dist_coeffs else [],
+                                        dtype=np.float64)
+        if perspective is not None:
+            self.perspective = np.array(perspective, dtype=np.float64)
+        self.cache_dir = cache_dir
+        self._maps = None
+
+    @property
+    def undistorts(self):
+        return self.camera_matrix is not None
+
+    def _cache_key(self):
+        """
+        Return a key identifying the maps of this lens and frame size.
+
+        :return: hex digest of the intrinsics, distortion and frame size
+        """
+        digest = hashlib.sha1()
+        digest.update(json.dumps(self.frame_size).encode())
+        digest.update(self.camera_matrix.tobytes())
+        digest.update(self.dist_coeffs.tobytes())
+        return digest.hexdigest()[:16]
+
+    def maps(self):
+        """
+        Return the undistortion maps, computing and saving them on first use.
+
+        :return: map1, map2 in CV_16SC2 format
+        """
+        if self._maps is not None:
+            return self._maps
+        paths = None
+        if self.cache_dir:
+            key = self._cache_key()
+            paths = [os.path.join(self.cache_dir,
+                                  "{}_map{}.npy".format(key, i))
+                     for i in (1, 2)]
+            if all(os.path.isfile(path) for path in paths):
+                self._maps = tuple(np.load(path, mmap_mode='r')
+                                   for path in paths)
+                return self._maps
+        map1, map2 = cv2.initUndistortRectifyMap(
+            self.camera_matrix, self.dist_coeffs, None, self.camera_matrix,
+            self.frame_size, cv2.CV_16SC2)
+        if paths:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            np.save(paths[0], map1)
+            np.save(paths[1], map2)
+        self._maps = (map1, map2)
+        return self._maps
+
+    def undistort_points(self, points):
+        """
+        Map contour points of the captured frame to the corrected image.
+
+        :param points: contour points, shape (N, 1, 2)
+        :return: corrected points, shape (N, 1, 2), float32
+        """
+        points = points.astype(np.float32) + self.origin
+        if self.undistorts:
+            points = cv2.undistortPoints(points, self.camera_matrix,
+                                         self.dist_coeffs,
+                                         P=self.camera_matrix)
+        if self.perspective is not None:
+            points = cv2.perspectiveTransform(points, self.perspective)
+        return points
+
+    def measure(self, contour):
+        """
+        Return the length and width of the object in millimeters.
+
+        :param contour: contour of the object in the captured frame
+        :return: length, width
+        """
+        box = cv2.boxPoints(cv2.minAreaRect(self.undistort_points(contour)))
+        (tl, tr, br, bl) = np.array(box, dtype='int')
+        x = int(math.hypot(bl[0] - tl[0], bl[1] - tl[1]))
+        y = int(math.hypot(tl[0] - tr[0], tl[1] - tr[1]))
+        length, width = max(x, y), min(x, y)
+        return (round(length * self.mm_per_pixel, 2),
+                round(width * self.mm_per_pixel, 2))
+
+    def undistort_roi(self, frame, contour):
+        """
+        Return the undistorted image of the object only. The maps are remapped
+        over the bounding box of the corrected contour, the rest of the frame
+        is never touched.
+
+        :param frame: captured frame, or crop of it at origin
+        :param contour: contour of the object in frame
+        :return: undistorted crop of the object
+        """
+        if not self.undistorts:
+            x, y, w, h = cv2.boundingRect(contour)
+            return frame[y: y + h, x: x + w]
+        points = cv2.undistortPoints(contour.astype(np.float32) + self.origin,
+                                     self.camera_matrix, self.dist_coeffs,
+                                     P=self.camera_matrix)
+        x, y, w, h = cv2.boundingRect(points)
+        x, y = max(x, 0), max(y, 0)
+        map1, map2 = self.maps()
+        # Source positions of the maps are in the captured frame
+        roi_map1 = map1[y: y + h, x: x + w] - self.origin
+        roi_map2 = np.ascontiguousarray(map2[y: y + h, x: x + w])
+        return cv2.remap(frame, roi_map1, roi_map2, cv2.INTER_LINEAR)
+
+
+def load_profile(item, frame_size, one_pixel_length, cache_dir=None,
+                 origin=(0, 0)):
+    """
+    Build the calibration profile of an input from its config entry.
+
+    :param item: entry of the input in the "inputs" list of config.json
+    :param frame_size: width and height of the captured frames
+    :param one_pixel_length: length of one pixel in centimeters, used when
+                             the entry has no "mm_per_pixel"
+    :param cache_dir: directory in which the undistortion maps are saved
+    :param origin: position in the captured frame of the frames given to the
+                   profile, when they are cropped
+    :return: CalibrationProfile
+    """
+    calibration = item.get('calibration', {})
+    return CalibrationProfile(
+        frame_size,
+        calibration.get('mm_per_pixel', one_pixel_length * 10),
+        camera_matrix=calibration.get('camera_matrix'),
+        dist_coeffs=calibration.get('dist_coeffs'),
+        perspective=calibration.get('perspective'),
+        cache_dir=cache_dir,
+        origin=origin)
@@ -0,0 +1,244 @@
+"""Periodic checkpoints of offline runs, to resume them after a stop."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from result_buffer import ResultBuffer
+
+# Name of the checkpoint in the output directory. The results are
+# appended to a file of the same name with the ".rows" extension.
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+class Checkpoint:
+    """
+    Checkpoint of the position in the input and of the state of the run.
+
+    The state is a small JSON file, written to a temporary file and
+    renamed over the previous one, so a stop while saving leaves the
+    previous checkpoint. The results only grow, so each save appends the
+    rows added since the last one to the ".rows" file instead of writing
+    them all again, and the checkpoint keeps the number of rows it covers.
+    Rows appended after it by a stopped run are cut off on resume.
+
+    InfluxDB points are sent as soon as their objects are measured. The
+    checkpoint keeps its time, which is after the timestamp of every
+    object it holds and before the ones of the objects measured after it,
+    so a resumed run deletes the points after that time before it
+    inspects their frames again, see `delete_after`.
+    """
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.rows_path = os.path.splitext(path)[0] + ".rows"
+        # Seconds between two checkpoints
+        self.interval = interval
+        # Time of the last checkpoint in microseconds since the epoch
+        self.time = None
+        # Time every save took, in seconds
+        self.times = []
+        self._rows = 0
+        self._last = time.time()
+
+    def due(self):
+        """
+        Tell if the interval since the last checkpoint is over.
+
+        :return: True if a checkpoint should be saved
+        """
+        return time.time() - self._last >= self.interval
+
+    def save(self, state, results):
+        """
+        Save a checkpoint.
+
+        :param state: JSON-serializable dictionary of the state of the run
+        :param results: ResultBuffer of the run
+        :return: None
+        """
+        start = time.time()
+        with open(self.rows_path, "ab") as f:
+            f.write(results.to_records(self._rows).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._rows = len(results)
+        self.time = int(start * 1e6)
+        state = dict(state, rows=self._rows, time=self.time)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._last = time.time()
+        self.times.append(self._last - start)
+
+    def delete_after(self, measurement):
+        """
+        Return the InfluxQL query deleting the points sent after the loaded
+        checkpoint, whose frames are inspected again.
+
+        :param measurement: name of the measurement of the points
+        :return: query for InfluxDBClient.query
+        """
+        # Times without a unit are nanoseconds
+        return 'DELETE FROM "{}" WHERE time > {}'.format(measurement,
+                                                         self.time * 1000)
+
+    def load(self, results):
+        """
+        Load the checkpoint into an empty result buffer.
+
+        :param results: ResultBuffer, filled with the rows of the checkpoint
+        :return: state of the run, None if there is no checkpoint
+        """
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path) as f:
+            state = json.load(f)
+        dtype = np.dtype(results.dtypes)
+        records = np.fromfile(self.rows_path, dtype=dtype,
+                              count=state["rows"])
+        if len(records) < state["rows"]:
+            raise ValueError("{} holds {} of the {} rows of the checkpoint"
+                             .format(self.rows_path, len(records),
+                                     state["rows"]))
+        # Drop the rows of the frames after the checkpoint
+        os.truncate(self.rows_path, state["rows"] * dtype.itemsize)
+        results.extend(records)
+        self._rows = state["rows"]
+        self.time = state["time"]
+        return state
+
+    def remove(self):
+        """
+        Remove the checkpoint once the run is complete.
+
+        :return: None
+        """
+        for path in (self.path, self.rows_path):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def describe(self):
+        """
+        Return the number of checkpoints and the time they took.
+
+        :return: text
+        """
+        if not self.times:
+            return "no checkpoint saved"
+        times = np.array(self.times) * 1000
+        return "{} checkpoints, {:.2f} ms on average, {:.2f} ms at most" \
+            .format(len(times), times.mean(), times.max())
+
+
+def seek(cap, frames):
+    """
+    Move an input to a frame.
+    Step 1: Seek with the position property of the capture.
+    Step 2: If the input cannot seek to the exact frame, read it again
+            from the start and skip the frames without retrieving them.
+
+    :param cap: VideoCapture or FrameStoreCapture
+    :param frames: number of frames to skip
+    :return: True if the input could seek, False if the frames were skipped
+    """
+    if cap.set(cv2.CAP_PROP_POS_FRAMES, frames) and \
+            cap.get(cv2.CAP_PROP_POS_FRAMES) == frames:
+        return True
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(frames):
+        if not cap.grab():
+            break
+    return False
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Measure the time of a checkpoint "
+                            "as the results grow")
+    parser.add_argument("-o", "--output",
+                        default=CHECKPOINT_NAME,
+                        help="Path of the checkpoint, removed at the end")
+    parser.add_argument("-n", "--objects",
+                        type=int,
+                        default=100000,
+                        help="Number of results at the end")
+    parser.add_argument("-p", "--per_checkpoint",
+                        type=int,
+                        default=1000,
+                        help="Number of results added between two "
+                        "checkpoints")
+    return parser
+
+
+def benchmark(path, objects, per_checkpoint):
+    """
+    Print the time of checkpoints of a run that records a number of objects
+    between two checkpoints, and check that the last one loads back.
+
+    :param path: path of the checkpoint
+    :param objects: number of results at the end
+    :param per_checkpoint: number of results between two checkpoints
+    :return: None
+    """
+    results = ResultBuffer()
+    checkpoint = Checkpoint(path, 0)
+    checkpoint.remove()
+    state = {"frame_count": 0}
+    while len(results) < objects:
+        for _ in range(per_checkpoint):
+            object_id = len(results) + 1
+            results.append(object_id=object_id, frame_index=object_id * 40,
+                           timestamp=time.time(), no_defect=1)
+        state["frame_count"] = len(results) * 40
+        checkpoint.save(state, results)
+        if len(checkpoint.times) % 20 == 0:
+            print("{:>8} results: {}".format(len(results),
+                                             checkpoint.describe()))
+    loaded = ResultBuffer()
+    state = Checkpoint(path, 0).load(loaded)
+    match = np.array_equal(loaded.to_records(), results.to_records())
+    print("{}, {} results loaded back {}".format(
+        checkpoint.describe(), len(loaded),
+        "identical" if match else "DIFFERENT"))
+    checkpoint.remove()
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    benchmark(args.output, args.objects, args.per_checkpoint)
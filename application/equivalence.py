@@ -0,0 +1,268 @@
+"""Check that the optimized inspection matches the reference one."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import json
+import sys
+from argparse import ArgumentParser
+
+import cv2
+
+from calibration import load_profile
+from fanout import open_capture
+from inspection import inspect_frame
+from lanes import load_lanes
+from parameters import Parameters
+from reference import inspect_frame as reference_frame
+from soak import CONFIG_FILE, SyntheticCapture
+from tiling import Tiler, parse_tile
+
+# Steps of an inspection, in the order they are reported
+STEPS = ["objects", "measure", "orientation", "color", "crack"]
+# Fields of the per-object results that are compared
+FLAGS = ["orientation", "color", "crack", "no_defect"]
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Inspect the same frames with the "
+                            "reference and the optimized inspection, diff "
+                            "their results and compare their speed")
+    parser.add_argument("-c", "--config",
+                        default=CONFIG_FILE,
+                        help="Path of config.json")
+    parser.add_argument("-i", "--input",
+                        type=int,
+                        default=0,
+                        help="Index of the input in config.json")
+    parser.add_argument("-s", "--synthetic",
+                        default=None,
+                        help="Use generated frames of this size, "
+                        "WIDTHxHEIGHT, instead of the input")
+    parser.add_argument("-e", "--every",
+                        type=int,
+                        default=0,
+                        help="Inspect every n-th frame, 0 for the "
+                        "frame_number parameter")
+    parser.add_argument("-n", "--frames",
+                        type=int,
+                        default=0,
+                        help="Number of inspected frames, 0 for the whole "
+                        "input. Required with --synthetic")
+    parser.add_argument("-t", "--tile",
+                        default="0",
+                        help="Size of the tiles of the optimized "
+                        "inspection, 0 for whole frames")
+    parser.add_argument("-th", "--threads",
+                        type=int,
+                        default=None,
+                        help="Number of threads of the tiles, one per core "
+                        "by default")
+    parser.add_argument("-lt", "--length_tolerance",
+                        type=float,
+                        default=0.01,
+                        help="Largest difference of length and width in "
+                        "millimeters")
+    parser.add_argument("-at", "--angle_tolerance",
+                        type=float,
+                        default=1e-6,
+                        help="Largest difference of orientation angle in "
+                        "radians")
+    return parser
+
+
+def read_frames(cap, lanes, every, count):
+    """
+    Read the frames to inspect.
+
+    :param cap: VideoCapture, FrameStoreCapture or SyntheticCapture
+    :param lanes: Lanes of the input, the frames are cropped to them
+    :param every: inspect every n-th frame
+    :param count: number of frames, 0 for all the frames of the input
+    :return: list of (frame index, frame cropped to the lanes)
+    """
+    frames = []
+    frame_index = 0
+    while not count or len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_index += 1
+        if frame_index % every == 0:
+            # apply() reuses its buffer, every frame needs its own copy
+            frames.append((frame_index, lanes.apply(frame).copy()))
+    cap.release()
+    return frames
+
+
+def run(inspect, frames, params, profile, lanes, **options):
+    """
+    Inspect frames and time every step.
+
+    :param inspect: inspect_frame function of the reference or optimized
+                    inspection
+    :param frames: list of (frame index, frame) of read_frames
+    :param params: detector Parameters
+    :param profile: CalibrationProfile of the input
+    :param lanes: Lanes of the input
+    :param options: other keyword arguments of inspect
+    :return: list of the per-object results of every frame, milliseconds
+             per frame of every step
+    """
+    times = {}
+    results = []
+    for frame_index, frame in frames:
+        objects, annotations = inspect(frame, params, profile, lanes,
+                                       times=times, **options)
+        results.append(objects)
+    count = max(len(frames), 1)
+    return results, {step: times.get(step, 0.0) * 1000 / count
+                     for step in STEPS}
+
+
+def position(obj):
+    """
+    Return the position of an object, to pair the objects of both
+    inspections.
+
+    :param obj: per-object result of inspect_frame
+    :return: top left corner of the bounding box of the object
+    """
+    x, y, w, h = cv2.boundingRect(obj["contour"])
+    return y, x
+
+
+def compare(expected, objects, length_tolerance, angle_tolerance):
+    """
+    Diff the objects of a frame found by both inspections.
+
+    :param expected: per-object results of the reference inspection
+    :param objects: per-object results of the optimized inspection
+    :param length_tolerance: largest difference of length and width in
+                             millimeters
+    :param angle_tolerance: largest difference of angle in radians
+    :return: list of (field, reference value, optimized value) that differ
+    """
+    if len(expected) != len(objects):
+        return [("count", len(expected), len(objects))]
+    differences = []
+    for first, second in zip(sorted(expected, key=position),
+                             sorted(objects, key=position)):
+        for field in ("length", "width"):
+            if abs(first[field] - second[field]) > length_tolerance:
+                differences.append((field, first[field], second[field]))
+        if abs(first["angle"] - second["angle"]) > angle_tolerance:
+            differences.append(("angle", first["angle"], second["angle"]))
+        for field in FLAGS:
+            if bool(first[field]) != bool(second[field]):
+                differences.append((field, first[field], second[field]))
+    return differences
+
+
+def check_equivalence(item, parameters, args):
+    """
+    Print the differences between the reference and optimized inspection of
+    the frames of an input, and the time of every step of both.
+
+    :param item: entry of the input in the "inputs" list of config.json
+    :param parameters: parameters block of config.json
+    :param args: command line arguments
+    :return: True if the results are the same within the tolerances
+    """
+    params = Parameters(parameters)
+    if args.synthetic:
+        width, height = (int(value) for value in args.synthetic.split("x"))
+        item = {}
+        cap = SyntheticCapture(width, height)
+    else:
+        cap = open_capture(item['video'])
+        if not cap.isOpened():
+            print("Unable to open {}".format(item['video']))
+            return False
+    frame_size = (cap.get(3), cap.get(4))
+    lanes = load_lanes(item, frame_size)
+    profile = load_profile(item, frame_size, 0.0264583333, None, lanes.origin)
+    frames = read_frames(cap, lanes, args.every or params.frame_number,
+                         args.frames)
+
+    expected, reference_times = run(reference_frame, frames, params,
+                                    profile, lanes)
+    tile = parse_tile(args.tile)
+    tiler = Tiler(tile, args.threads) if tile else None
+    results, times = run(inspect_frame, frames, params, profile, lanes,
+                         tiler=tiler)
+    if tiler:
+        tiler.close()
+
+    differences = []
+    for (frame_index, frame), first, second in zip(frames, expected,
+                                                   results):
+        differences += [(frame_index,) + difference for difference in
+                        compare(first, second, args.length_tolerance,
+                                args.angle_tolerance)]
+
+    print("{} frames of {}x{}, {} objects in the reference, {} optimized"
+          .format(len(frames), lanes.size[0], lanes.size[1],
+                  sum(len(objects) for objects in expected),
+                  sum(len(objects) for objects in results)))
+    print("ms per frame     reference  optimized  speedup")
+    for step in STEPS + ["total"]:
+        if step == "total":
+            first = sum(reference_times.values())
+            second = sum(times.values())
+        else:
+            first, second = reference_times[step], times[step]
+        print("  {:<12} {:10.2f} {:10.2f} {:>8}".format(
+            step, first, second,
+            "{:.1f}x".format(first / second) if second else "-"))
+    if not differences:
+        print("Same results within {} mm and {} rad".format(
+            args.length_tolerance, args.angle_tolerance))
+        return True
+    fields = sorted(set(difference[1] for difference in differences))
+    print("{} differences: {}".format(len(differences), ", ".join(
+        "{} {}".format(field, sum(difference[1] == field
+                                  for difference in differences))
+        for field in fields)))
+    for frame_index, field, first, second in differences[:10]:
+        print("  frame {}: {} {} in the reference, {} optimized".format(
+            frame_index, field, first, second))
+    return False
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    if args.synthetic and not args.frames:
+        print("--synthetic needs a number of frames")
+        sys.exit(1)
+    with open(args.config) as f:
+        config = json.load(f)
+    if not check_equivalence(config['inputs'][args.input],
+                             config.get("parameters", {}), args):
+        sys.exit(1)
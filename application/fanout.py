@@ -0,0 +1,453 @@
+"""Inspection of the frames of one input by several worker processes."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import heapq
+import json
+import multiprocessing
+import os
+import queue
+import time
+from argparse import ArgumentParser
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+
+from affinity import (apply_budget, parse_cores, plan_layout, print_layout,
+                      start_process)
+from calibration import load_profile
+from frame_store import EXTENSION, FrameStoreCapture
+from inspection import (defect_frame, encode_crop, inspect_frame,
+                        object_defects)
+from lanes import load_lanes
+from motion import IdleDetector
+from parameters import ParameterWatcher, Parameters
+from tiling import Tiler
+
+# The header of the ring holds the sequence number and the frame index of
+# the frame in each slot, the frames start after it on a cache line
+HEADER_ALIGNMENT = 64
+
+
+class FrameRing:
+    """
+    Ring of frame slots in shared memory.
+
+    Each slot holds one frame, cropped to the lanes, and is tagged in the
+    header with the sequence number and the video frame index of that
+    frame. A slot belongs to one process at a time: the capture process
+    takes it from the free queue and fills it, a worker inspects the frame
+    in place and gives the slot back. Frames are never copied between
+    processes.
+    """
+
+    def __init__(self, shape, slots, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = -(-slots * 16 // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+        if name is None:
+            self.shm = SharedMemory(create=True,
+                                    size=header_bytes + slots * frame_bytes)
+        else:
+            self.shm = SharedMemory(name=name)
+        self.name = self.shm.name
+        self.header = np.ndarray((slots, 2), dtype=np.int64,
+                                 buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=header_bytes)
+
+    def close(self):
+        """
+        Detach from the shared memory. No view of a slot may be left.
+
+        :return: None
+        """
+        self.header = None
+        self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Free the shared memory, once every process closed the ring.
+
+        :return: None
+        """
+        self.shm.unlink()
+
+
+def open_capture(video):
+    """
+    Open the frame source of an input like the detector does.
+
+    :param video: "video" entry of the input, a camera number or a path
+    :return: cv2.VideoCapture or FrameStoreCapture
+    """
+    if video.isdigit():
+        return cv2.VideoCapture(int(video))
+    if video.endswith(EXTENSION):
+        return FrameStoreCapture(video)
+    return cv2.VideoCapture(video)
+
+
+def capture(setup, cores, free, work, results):
+    """
+    Read the frames of the input and hand the inspected ones to the
+    workers.
+    Step 1: Count the frames and pick the ones to inspect with the current
+            parameters.
+    Step 2: Take a free slot and crop the frame to the lanes directly into
+            it. A camera drops the frame when no slot is free, a file waits.
+    Step 3: Skip the frame while the belt is idle, else tag the slot with
+            the next sequence number and queue it with its parameters.
+
+    :param setup: settings of the fan-out, see FanOut
+    :param cores: cores of the process, None for the system defaults
+    :param free: queue of the free slots
+    :param work: queue of the filled slots
+    :param results: queue to the collector
+    :return: None
+    """
+    apply_budget(cores)
+    cap = open_capture(setup["video"])
+    ring = FrameRing(setup["shape"], setup["slots"], setup["ring"])
+    lanes = load_lanes(setup["item"], setup["frame_size"])
+    watcher = ParameterWatcher(setup["config_file"])
+    watcher.start()
+    idle = IdleDetector()
+    frame_count = 0
+    # A frame store may only hold every n-th frame of the video
+    frame_step = getattr(cap, 'frame_step', 1)
+    sequence = 0
+    dropped = 0
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_count += frame_step
+        params = watcher.current
+        inspect = frame_count % (setup["every"] or params.frame_number) == 0
+        if not inspect and not (params.idle_threshold and idle.idle):
+            continue
+
+        slot = None
+        if inspect:
+            try:
+                slot = free.get(block=not setup["drop"])
+            except queue.Empty:
+                dropped += 1
+        crop = lanes.apply(frame, None if slot is None else ring.frames[slot])
+
+        # Skip the inspection while the belt is stopped
+        if params.idle_threshold:
+            if idle.check(crop, params.idle_threshold):
+                results.put(("state", idle.idle))
+            if idle.idle and inspect:
+                idle.skipped += 1
+                inspect = False
+        crop = None
+        if slot is None:
+            continue
+        if not inspect:
+            free.put(slot)
+            continue
+        idle.inspected()
+        ring.header[slot] = sequence, frame_count
+        work.put((slot, params.values))
+        sequence += 1
+
+    cap.release()
+    watcher.stop()
+    for _ in range(setup["workers"]):
+        work.put(None)
+    results.put(("done", sequence, idle.skipped, dropped))
+    ring.close()
+
+
+def inspect_worker(setup, cores, free, work, results):
+    """
+    Inspect the frames of the ring until the capture process is done.
+    The frame is inspected in its slot, and the images of the objects are
+    encoded here so the collector only has to write them.
+
+    :param setup: settings of the fan-out, see FanOut
+    :param cores: cores of the process, None for the system defaults
+    :param free: queue of the free slots
+    :param work: queue of the filled slots
+    :param results: queue to the collector
+    :return: None
+    """
+    apply_budget(cores)
+    ring = FrameRing(setup["shape"], setup["slots"], setup["ring"])
+    lanes = load_lanes(setup["item"], setup["frame_size"])
+    profile = load_profile(setup["item"], setup["frame_size"],
+                           setup["one_pixel_length"], setup["cache_dir"],
+                           lanes.origin)
+    tiler = Tiler(setup["tile"], cores and len(cores)) \
+        if setup["tile"] else None
+    params = None
+    while True:
+        task = work.get()
+        if task is None:
+            break
+        slot, values = task
+        # Parameters of the frame, as sampled by the capture process
+        if params is None or params.version != values["version"]:
+            params = Parameters(values)
+        sequence, frame_index = (int(value) for value in ring.header[slot])
+        frame = ring.frames[slot]
+        objects, annotations = inspect_frame(frame, params, profile, lanes,
+                                             tiler=tiler)
+        for obj in objects:
+            contour = obj.pop("contour")
+            obj["crops"] = [
+                (defect, encode_crop(defect_frame(frame, defect, annotations),
+                                     contour, profile))
+                for defect in object_defects(obj)]
+        frame = annotations = None
+        free.put(slot)
+        results.put(("frame", sequence, frame_index, params.version, objects))
+    if tiler:
+        tiler.close()
+    ring.close()
+
+
+class FanOut:
+    """
+    Capture process, worker processes and the shared frame ring of one
+    input.
+
+    The inspected frames complete in any order. results() puts them back
+    in capture order, so objects are numbered and sent to the database
+    exactly as the single-process loop would.
+    Given a core set, every process is pinned to its share of it with a
+    matching number of threads, see affinity.py. Without one, every
+    process keeps the default of one thread per core.
+    """
+
+    def __init__(self, item, config_file, frame_size, one_pixel_length,
+                 cache_dir, workers, slots=None, every=None, cores=None,
+                 tile=None):
+        lanes = load_lanes(item, frame_size)
+        self.workers = workers
+        self.layout = plan_layout(cores, workers) if cores else None
+        self._affinity = None
+        self.ring = FrameRing((lanes.size[1], lanes.size[0], 3),
+                              slots or 2 * workers + 2)
+        self.setup = {
+            "item": item,
+            "video": item['video'],
+            "config_file": config_file,
+            "frame_size": frame_size,
+            "one_pixel_length": one_pixel_length,
+            "cache_dir": cache_dir,
+            "shape": self.ring.shape,
+            "slots": self.ring.slots,
+            "ring": self.ring.name,
+            "workers": workers,
+            # Inspect every n-th frame instead of the frame_number parameter
+            "every": every,
+            # Cameras do not wait for the workers
+            "drop": item['video'].isdigit(),
+            # Tiles of the frames, split between the threads of a worker
+            "tile": tile,
+        }
+        # Compute the undistortion maps once, the workers map the cache
+        profile = load_profile(item, frame_size, one_pixel_length, cache_dir,
+                               lanes.origin)
+        if profile.undistorts:
+            profile.maps()
+        self.skipped = 0
+        self.dropped = 0
+        self.frames = 0
+        self.queues = ()
+        self.processes = []
+
+    def start(self):
+        """
+        Start the capture and worker processes.
+
+        :return: None
+        """
+        context = multiprocessing.get_context("spawn")
+        free = context.Queue()
+        for slot in range(self.ring.slots):
+            free.put(slot)
+        work = context.Queue()
+        self.results_queue = context.Queue()
+        # Kept here, the processes unpickle them after start() returns
+        self.queues = (free, work, self.results_queue)
+        # Cores of the main, capture and worker processes
+        layout = [cores for name, cores in self.layout] if self.layout else \
+            [None] * (self.workers + 2)
+        self.processes = [context.Process(
+            target=capture, args=(self.setup, layout[1]) + self.queues)]
+        self.processes += [context.Process(
+            target=inspect_worker, args=(self.setup, cores) + self.queues)
+            for cores in layout[2:]]
+        for process, cores in zip(self.processes, layout[1:]):
+            start_process(process, cores)
+        # The main process only collects the results from now on
+        if self.layout:
+            print_layout(self.layout)
+            self._affinity = os.sched_getaffinity(0), cv2.getNumThreads()
+            apply_budget(layout[0])
+
+    def _next_message(self):
+        """
+        Wait for the next message of the processes.
+
+        :return: message tuple
+        """
+        while True:
+            try:
+                return self.results_queue.get(timeout=1.0)
+            except queue.Empty:
+                for process in self.processes:
+                    if process.exitcode:
+                        raise RuntimeError("{} exited with code {}".format(
+                            process.name, process.exitcode))
+
+    def results(self):
+        """
+        Yield the changes of the idle state as they happen and the inspected
+        frames in capture order.
+        Step 1: Keep the frames that arrive before an earlier one in a heap
+                ordered by sequence number.
+        Step 2: Yield the frames from the heap as long as the next one in
+                sequence is there.
+        Step 3: Stop when the capture process is done and every frame it
+                sent was yielded.
+
+        :return: generator of ("state", idle) and
+                 ("frame", frame_index, param_version, objects) tuples
+        """
+        pending = []
+        next_sequence = 0
+        total = None
+        while total is None or next_sequence < total:
+            message = self._next_message()
+            if message[0] == "state":
+                yield message
+            elif message[0] == "done":
+                total, self.skipped, self.dropped = message[1:]
+            else:
+                heapq.heappush(pending, message[1:])
+            while pending and pending[0][0] == next_sequence:
+                sequence, frame_index, version, objects = \
+                    heapq.heappop(pending)
+                next_sequence += 1
+                self.frames += 1
+                yield "frame", frame_index, version, objects
+
+    def close(self):
+        """
+        Wait for the processes and free the ring.
+
+        :return: None
+        """
+        for process in self.processes:
+            process.join()
+        self.ring.close()
+        self.ring.unlink()
+        if self._affinity:
+            affinity, threads = self._affinity
+            os.sched_setaffinity(0, affinity)
+            cv2.setNumThreads(threads)
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Measure the inspection rate of an "
+                            "input with 1 to N worker processes")
+    parser.add_argument("-c", "--config",
+                        default="../resources/config.json",
+                        help="Path of config.json")
+    parser.add_argument("-i", "--input",
+                        type=int,
+                        default=0,
+                        help="Index of the input in config.json")
+    parser.add_argument("-w", "--workers",
+                        type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="Largest number of workers")
+    parser.add_argument("-e", "--every",
+                        type=int,
+                        default=1,
+                        help="Inspect every n-th frame, 0 for the "
+                        "frame_number parameter")
+    parser.add_argument("-cpu", "--cores",
+                        default=None,
+                        help="Also measure with the processes pinned to "
+                        "shares of these cores, for example 0-3 or all")
+    return parser
+
+
+def benchmark(item, config_file, workers, every, cores=None):
+    """
+    Print the rate of inspected frames with 1 to `workers` processes, with
+    the default threads and, given a core set, with pinned processes.
+
+    :param item: entry of the input in the "inputs" list of config.json
+    :param config_file: path of config.json
+    :param workers: largest number of workers
+    :param every: inspect every n-th frame, 0 for the frame_number parameter
+    :param cores: cores to split between the processes, None to only
+                  measure the default threads
+    :return: None
+    """
+    cap = open_capture(item['video'])
+    frame_size = (cap.get(3), cap.get(4))
+    cap.release()
+    for count in range(1, workers + 1):
+        for name, layout in (("default", None), ("pinned", cores)):
+            if name == "pinned" and not cores:
+                continue
+            fanout = FanOut(item, config_file, frame_size, 0.0264583333,
+                            None, count, every=every or None, cores=layout)
+            start = time.time()
+            fanout.start()
+            objects = 0
+            for message in fanout.results():
+                if message[0] == "frame":
+                    objects += len(message[3])
+            elapsed = time.time() - start
+            fanout.close()
+            print("{} workers, {}: {:.1f} frames/s, {} frames, {} objects"
+                  .format(count, name, fanout.frames / elapsed,
+                          fanout.frames, objects))
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    with open(args.config) as f:
+        config = json.load(f)
+    benchmark(config['inputs'][args.input], args.config, args.workers,
+              args.every, args.cores and parse_cores(args.cores))
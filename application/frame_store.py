@@ -0,0 +1,224 @@
+"""Memory-mapped store of decoded video frames."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import json
+import struct
+import sys
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+# A frame store starts with MAGIC, the length of the JSON header and the
+# header itself, padded so the frames start on a page boundary. The frames
+# follow as one contiguous array of shape (count, height, width, channels).
+MAGIC = b"OFDFRAMES1"
+ALIGNMENT = 4096
+EXTENSION = ".frames"
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Decode a video once into a "
+                            "memory-mapped frame store")
+    parser.add_argument("video", help="Path of the video to decode")
+    parser.add_argument("output",
+                        help="Path of the frame store, ending in {}"
+                        .format(EXTENSION))
+    parser.add_argument("-n", "--every",
+                        type=int,
+                        default=1,
+                        help="Only store every n-th frame, for example the "
+                        "inspected frames only")
+    parser.add_argument("-b", "--benchmark",
+                        action="store_true",
+                        help="Compare reading the video and the frame store")
+    return parser
+
+
+def write_store(video, output, every=1):
+    """
+    Decode a video into a frame store.
+    Step 1: Decode the first frame to get the shape and type of the frames.
+    Step 2: Write the frames one after the other after a placeholder header.
+    Step 3: Rewrite the header with the number of frames stored.
+
+    :param video: path of the video
+    :param output: path of the frame store
+    :param every: store one frame every given number of frames
+    :return: number of frames stored
+    """
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise IOError("Unable to open video file {}".format(video))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    ret, frame = cap.read()
+    if not ret:
+        raise IOError("No frames in video file {}".format(video))
+    header = {
+        "shape": list(frame.shape),
+        "dtype": str(frame.dtype),
+        "fps": fps / every,
+        "every": every,
+        "count": 0,
+    }
+    count = 0
+    index = 0
+    with open(output, "wb") as f:
+        f.write(b"\0" * ALIGNMENT)
+        while ret:
+            # Same frames as the ones inspected every given number of frames
+            if (index + 1) % every == 0:
+                f.write(np.ascontiguousarray(frame).tobytes())
+                count += 1
+            index += 1
+            ret, frame = cap.read()
+        header["count"] = count
+        f.seek(0)
+        f.write(_pack_header(header))
+    cap.release()
+    return count
+
+
+def _pack_header(header):
+    """
+    Serialize the header of a frame store.
+
+    :param header: dictionary with shape, dtype, fps, every and count
+    :return: header bytes, padded to ALIGNMENT
+    """
+    data = json.dumps(header).encode()
+    packed = MAGIC + struct.pack("<I", len(data)) + data
+    if len(packed) > ALIGNMENT:
+        raise ValueError("Frame store header too large")
+    return packed.ljust(ALIGNMENT, b"\0")
+
+
+def open_store(path):
+    """
+    Memory-map a frame store.
+
+    :param path: path of the frame store
+    :return: header, array of frames of shape (count, height, width, channels)
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise IOError("{} is not a frame store".format(path))
+        size, = struct.unpack("<I", prefix[len(MAGIC):])
+        header = json.loads(f.read(size).decode())
+    frames = np.memmap(path, dtype=header["dtype"], mode="r",
+                       offset=ALIGNMENT,
+                       shape=tuple([header["count"]] + header["shape"]))
+    return header, frames
+
+
+class FrameStoreCapture:
+    """
+    Frame source that reads a frame store with the cv2.VideoCapture methods
+    used by the detector. read() returns a read-only view into the memory
+    map, no frame is decoded or copied.
+    """
+
+    def __init__(self, path):
+        self.header, self.frames = open_store(path)
+        # Number of video frames between two stored frames
+        self.frame_step = self.header["every"]
+        self.position = 0
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened or self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def get(self, prop):
+        shape = self.header["shape"]
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(shape[1])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(shape[0])
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.header["fps"])
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.frames))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+
+    def release(self):
+        self.opened = False
+
+
+def benchmark(video, store):
+    """
+    Print the read rate of the video and of its frame store.
+
+    :param video: path of the video
+    :param store: path of the frame store
+    :return: None
+    """
+    for name, cap in (("video", cv2.VideoCapture(video)),
+                      ("frame store", FrameStoreCapture(store))):
+        start = time.time()
+        count = 0
+        total = 0
+        ret, frame = cap.read()
+        while ret:
+            # Read part of every row so the pages of the frame are loaded
+            total += int(frame[::1, ::64].sum())
+            count += 1
+            ret, frame = cap.read()
+        elapsed = time.time() - start
+        cap.release()
+        print("{}: {} frames in {:.2f} s, {:.1f} frames/s".format(
+            name, count, elapsed, count / elapsed if elapsed else 0))
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    if not args.output.endswith(EXTENSION):
+        sys.exit("Output file name must end in {}".format(EXTENSION))
+    count = write_store(args.video, args.output, args.every)
+    print("{} frames stored in {}".format(count, args.output))
+    if args.benchmark:
+        benchmark(args.video, args.output)
@@ -0,0 +1,441 @@
+"""Segmentation and defect checks of a frame, shared by all frame sources."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import os
+import time
+from math import atan2
+
+import cv2
+import numpy as np
+
+# Defects in the order they are checked, with the key of their flag in the
+# results, which is also the folder of their saved images, and the file
+# name prefix of the saved images
+DEFECTS = [
+    ("Orientation", "orientation", "Orientation"),
+    ("Color", "color", "Color"),
+    ("Crack", "crack", "Crack"),
+]
+NO_DEFECT = ("No Defect", "no_defect", "Nodefect")
+
+
+def find_objects(frame, params):
+    """
+    Find the contours of the objects on the frame.
+    Step 1: Convert the frame to HSV and threshold it on the object color.
+    Step 2: Morphological opening and closing to remove noise and holes.
+    Step 3: Find the contours and keep the ones whose bounding box has the
+            area of an object.
+
+    :param frame: Input frame from the video
+    :param params: detector Parameters
+    :return: list of contours of the objects
+    """
+    # Convert BGR image to HSV color space
+    img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    return filter_objects(object_contours(img_hsv, params), params)
+
+
+def object_contours(img_hsv, params):
+    """
+    Find the contours of everything of the color of the objects.
+
+    :param img_hsv: frame in HSV color space
+    :param params: detector Parameters, only the object color range and
+                   the kernel are used
+    :return: list of contours
+    """
+    # Find the contours on the image
+    contours, hierarchy = cv2.findContours(object_mask(img_hsv, params),
+                                           cv2.RETR_LIST,
+                                           cv2.CHAIN_APPROX_NONE)
+    return contours
+
+
+def object_mask(img_hsv, params):
+    """
+    Threshold a frame on the color of the objects and clean the mask.
+
+    :param img_hsv: frame in HSV color space
+    :param params: detector Parameters
+    :return: mask of the objects
+    """
+    # Thresholding of an Image in a color range
+    img_threshold = cv2.inRange(img_hsv, params.object_color_low,
+                                params.object_color_high)
+
+    # Morphological opening(remove small objects from the foreground)
+    img_threshold = cv2.erode(img_threshold, params.kernel)
+    img_threshold = cv2.dilate(img_threshold, params.kernel)
+
+    # Morphological closing(fill small holes in the foreground)
+    img_threshold = cv2.dilate(img_threshold, params.kernel)
+    img_threshold = cv2.erode(img_threshold, params.kernel)
+    return img_threshold
+
+
+def filter_objects(contours, params):
+    """
+    Keep the contours whose bounding box has the area of an object.
+
+    :param contours: list of contours
+    :param params: detector Parameters
+    :return: list of contours of the objects
+    """
+    objects = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if params.object_area_max > w * h > params.object_area_min:
+            objects.append(cnt)
+    return objects
+
+
+def get_orientation(contours):
+    """
+    Gives the angle of the orientation of the object in radians.
+    Step 1: Convert 3D matrix of contours to 2D.
+    Step 2: Apply PCA algorithm to find angle of the data points.
+
+    :param contours: contour of the object from the frame
+    :return: angle of orientation of the object in radians
+    """
+    # data_pts stores contour values in 2D
+    data_pts = contours.reshape(-1, 2).astype(np.float64)
+    # Use PCA algorithm to find angle of the data points
+    mean, eigenvector = cv2.PCACompute(data_pts, mean=None)
+    angle = atan2(eigenvector[0, 1], eigenvector[0, 0])
+    return angle
+
+
+def detect_orientation(contours, params):
+    """
+    Identifies the Orientation defect of the object based on its angle.
+
+    :param contours: contour of the object from the frame
+    :param params: detector Parameters
+    :return: defect_flag, angle
+    """
+    angle = get_orientation(contours)
+    # If angle is less than orientation_angle then no orientation defect
+    # is present
+    return angle >= params.orientation_angle, angle
+
+
+def detect_color(frame, params, mask=None):
+    """
+    Identifies the color defect W.R.T the set default color of the object.
+    Step 1: Increase the brightness of the image.
+    Step 2: Convert the image to HSV Format. HSV color space gives more
+            information about the colors of the image.
+            It helps to identify distinct colors in the image.
+    Step 3: Threshold the image based on the color using "inRange" function.
+            Range of the color, which is considered as a defect for object, is
+            passed as one of the argument to inRange function to create a mask.
+    Step 4: Morphological opening is done on the mask to remove noises.
+    Step 5: Find the contours on the mask image. Contours are filtered based on
+            the area to get the contours of defective area.
+
+    :param frame: Input frame from the video
+    :param params: detector Parameters
+    :param mask: mask of the lanes of the belt, None for the whole frame
+    :return: color_flag, contours of the defective areas, brightened frame
+    """
+    # Increase the brightness of the image
+    bright = cv2.convertScaleAbs(frame, None, 1, 20)
+    # Convert the captured frame from BGR to HSV
+    img_hsv = cv2.cvtColor(bright, cv2.COLOR_BGR2HSV)
+    defects = color_defects(img_hsv, params, mask)
+    return len(defects) > 0, defects, bright
+
+
+def color_defects(img_hsv, params, mask=None):
+    """
+    Find the defective color areas of a brightened frame.
+
+    :param img_hsv: brightened frame in HSV color space
+    :param params: detector Parameters
+    :param mask: mask of the lanes of the belt, None for the whole frame
+    :return: contours of the defective areas
+    """
+    return color_areas(color_mask(img_hsv, params), params, mask)
+
+
+def color_mask(img_hsv, params):
+    """
+    Threshold a brightened frame on the defective color and clean the mask.
+
+    :param img_hsv: brightened frame in HSV color space
+    :param params: detector Parameters
+    :return: mask of the defective color
+    """
+    # Threshold the image
+    img_threshold = cv2.inRange(img_hsv, params.defect_color_low,
+                                params.defect_color_high)
+    # Morphological opening (remove small objects from the foreground)
+    img_threshold = cv2.erode(img_threshold, kernel=params.kernel)
+    img_threshold = cv2.dilate(img_threshold, kernel=params.kernel)
+    return img_threshold
+
+
+def color_areas(img_threshold, params, mask=None):
+    """
+    Find the defective color areas of a mask of the defective color.
+
+    :param img_threshold: mask of the defective color
+    :param params: detector Parameters
+    :param mask: mask of the lanes of the belt, None for the whole frame
+    :return: contours of the defective areas
+    """
+    # Only look for defective color on the lanes of the belt
+    if mask is not None:
+        img_threshold = cv2.bitwise_and(img_threshold, mask)
+    contours, hierarchy = cv2.findContours(img_threshold, cv2.RETR_LIST,
+                                           cv2.CHAIN_APPROX_NONE)
+    return [cnt for cnt in contours
+            if params.color_area_min < cv2.contourArea(cnt) <
+            params.color_area_max]
+
+
+def detect_crack(frame, params, edge_mask=None):
+    """
+    Identify the Crack defect on the object.
+    Step 1: Convert the image to gray scale.
+    Step 2: Blur the gray image to remove the noises.
+    Step 3: Find the edges on the blurred image to get the contours of
+            possible cracks.
+    Step 4: Filter the contours to get the contour of the crack.
+
+    :param frame: Input frame from the video
+    :param params: detector Parameters
+    :param edge_mask: mask of the lanes of the belt without their borders,
+                      None for the whole frame
+    :return: defect_flag, contours of the cracks
+    """
+    # Convert the captured frame from BGR to GRAY
+    img = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    img = cv2.blur(img, params.blur_size)
+    cracks = crack_contours(img, params, edge_mask)
+    return len(cracks) > 0, cracks
+
+
+def crack_contours(img, params, edge_mask=None):
+    """
+    Find the contours of the cracks on a blurred gray frame.
+
+    :param img: gray frame blurred with the blur_size parameter
+    :param params: detector Parameters
+    :param edge_mask: mask of the lanes of the belt without their borders,
+                      None for the whole frame
+    :return: contours of the cracks
+    """
+    kernel_size = 3
+    # Find the edges
+    detected_edges = cv2.Canny(img, params.canny_low_threshold,
+                               params.canny_low_threshold * params.canny_ratio,
+                               kernel_size)
+    return crack_areas(detected_edges, params, edge_mask)
+
+
+def crack_areas(detected_edges, params, edge_mask=None):
+    """
+    Find the contours of the cracks on an edge map.
+
+    :param detected_edges: Canny edges of the blurred gray frame
+    :param params: detector Parameters
+    :param edge_mask: mask of the lanes of the belt without their borders,
+                      None for the whole frame
+    :return: contours of the cracks
+    """
+    # Drop the edges along the borders of the lanes
+    if edge_mask is not None:
+        detected_edges = cv2.bitwise_and(detected_edges, edge_mask)
+    # Find the contours
+    contours, hierarchy = cv2.findContours(detected_edges, cv2.RETR_TREE,
+                                           cv2.CHAIN_APPROX_NONE)
+    cracks = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area > params.crack_area_max or area < params.crack_area_min:
+            cracks.append(cnt)
+    return cracks
+
+
+def inspect_frame(frame, params, profile, lanes, crack=True, tiler=None,
+                  times=None):
+    """
+    Measure every object of the frame and check it for defects.
+    The color and crack checks look at the whole frame, so they are done
+    once per frame and their result applies to every object of the frame.
+
+    :param frame: Input frame from the video, cropped to the lanes
+    :param params: detector Parameters
+    :param profile: CalibrationProfile of the input
+    :param lanes: Lanes of the input
+    :param crack: look for cracks, False reports no crack without looking
+    :param tiler: Tiler running the full-frame steps on tiles, see
+                  tiling.py, None to run them on the whole frame
+    :param times: dictionary the seconds of every step are added to, None
+                  not to time them
+    :return: list of per-object results, frame annotations
+    """
+    objects = []
+    annotations = {}
+    start = time.time()
+    if tiler is None:
+        contours = find_objects(frame, params)
+    else:
+        contours = tiler.find_objects(frame, params)
+    start = add_time(times, "objects", start)
+    for cnt in contours:
+        if not annotations:
+            check = detect_color if tiler is None else tiler.detect_color
+            annotations["Color"] = check(frame, params, lanes.mask)
+            start = add_time(times, "color", start)
+            check = detect_crack if tiler is None else tiler.detect_crack
+            annotations["Crack"] = check(
+                frame, params, lanes.edge_mask) if crack else (False, [])
+            start = add_time(times, "crack", start)
+        # Length and width in millimeters, corrected for lens distortion
+        # and perspective of the input
+        length, width = profile.measure(cnt)
+        start = add_time(times, "measure", start)
+        orientation_flag, angle = detect_orientation(cnt, params)
+        start = add_time(times, "orientation", start)
+        color_flag = annotations["Color"][0]
+        crack_flag = annotations["Crack"][0]
+        objects.append({
+            "contour": cnt,
+            "length": length,
+            "width": width,
+            "angle": angle,
+            "orientation": orientation_flag,
+            "color": color_flag,
+            "crack": crack_flag,
+            # An object is only free of defects if every check was done,
+            # the shed column of the results tells why it was not
+            "no_defect": bool(crack) and not (orientation_flag or
+                                              color_flag or crack_flag),
+            "lane": lanes.lane_of(cnt),
+        })
+    return objects, annotations
+
+
+def add_time(times, step, start):
+    """
+    Add the time since start to a step of an inspection.
+
+    :param times: dictionary of the seconds of every step, None not to time
+                  the steps
+    :param step: name of the step
+    :param start: time the step started
+    :return: time the step ended, the start of the next one
+    """
+    if times is None:
+        return start
+    now = time.time()
+    times[step] = times.get(step, 0.0) + now - start
+    return now
+
+
+def object_defects(obj):
+    """
+    Return the names of the defects of an object.
+
+    :param obj: per-object result of inspect_frame
+    :return: list of defect names, ["No Defect"] if there is none, empty
+             if none was found but not every check was done
+    """
+    defects = [defect for defect, key, _ in DEFECTS if obj[key]]
+    if not defects and obj[NO_DEFECT[1]]:
+        return [NO_DEFECT[0]]
+    return defects
+
+
+def defect_frame(frame, defect, annotations):
+    """
+    Return a copy of the frame with a defect drawn on it.
+
+    :param frame: Input frame from the video
+    :param defect: name of the defect
+    :param annotations: frame annotations of inspect_frame
+    :return: annotated copy of the frame
+    """
+    if defect == "Color":
+        flag, contours, bright = annotations["Color"]
+        image = bright.copy()
+        for cnt in contours:
+            cv2.drawContours(image, cnt, -1, (0, 0, 255), 2)
+        return image
+    image = frame.copy()
+    if defect == "Crack":
+        flag, contours = annotations["Crack"]
+        cv2.drawContours(image, contours, -1, (0, 255, 0), 2)
+    return image
+
+
+def crop_path(base_dir, defect, name):
+    """
+    Return the path of the saved image of an object.
+
+    :param base_dir: directory of the defect folders
+    :param defect: name of the defect, or "No Defect"
+    :param name: name of the object in the file name, usually its number
+    :return: path of the image
+    """
+    for defect_name, folder, prefix in DEFECTS + [NO_DEFECT]:
+        if defect_name == defect:
+            break
+    return os.path.join(base_dir, folder, "{}_{}.png".format(prefix, name))
+
+
+def encode_crop(image, contour, profile):
+    """
+    Cut an object out of a frame and encode it as PNG.
+
+    :param image: frame the object is cut from
+    :param contour: contour of the object
+    :param profile: CalibrationProfile used to undistort the object
+    :return: PNG bytes
+    """
+    ret, png = cv2.imencode(".png", profile.undistort_roi(image, contour))
+    return png.tobytes()
+
+
+def save_crop(base_dir, defect, name, image, contour, profile):
+    """
+    Save the image of an object in the folder of its defect.
+
+    :param base_dir: directory of the defect folders
+    :param defect: name of the defect, or "No Defect"
+    :param name: name of the object in the file name, usually its number
+    :param image: frame the object is cut from
+    :param contour: contour of the object
+    :param profile: CalibrationProfile used to undistort the object
+    :return: path of the saved image
+    """
+    path = crop_path(base_dir, defect, name)
+    cv2.imwrite(path, profile.undistort_roi(image, contour))
+    return path
@@ -0,0 +1,134 @@
+"""Belt region of interest and lanes of an input."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import cv2
+import numpy as np
+
+# Margin in pixels kept free of edges along the lane borders, larger than
+# the blur filter so the border of the mask is never taken for a crack
+EDGE_MARGIN = 9
+
+
+class Lanes:
+    """
+    Polygonal lanes of the conveyor belt.
+
+    Frames are cropped to the bounding box of all lanes and everything
+    outside the lanes is blanked with a mask computed once, so every later
+    stage only sees the belt. A label image of the same size gives the lane
+    of an object with a single lookup.
+    Without lanes the whole frame is one lane and frames are not touched.
+    """
+
+    def __init__(self, frame_size, polygons=None, names=None):
+        width, height = int(frame_size[0]), int(frame_size[1])
+        self.counts = np.zeros(max(len(polygons or []), 1), dtype=np.int64)
+        if not polygons:
+            self.names = ["belt"]
+            self.origin = (0, 0)
+            self.size = (width, height)
+            self.mask = None
+            self.edge_mask = None
+            self.labels = None
+            return
+        self.names = names or ["lane{}".format(i + 1)
+                               for i in range(len(polygons))]
+        polygons = [np.array(points, dtype=np.int32).reshape(-1, 1, 2)
+                    for points in polygons]
+        x, y, w, h = cv2.boundingRect(np.concatenate(polygons))
+        x, y = max(x, 0), max(y, 0)
+        w, h = min(w, width - x), min(h, height - y)
+        self.origin = (x, y)
+        self.size = (w, h)
+        # Label of each pixel of the crop: 0 outside, i + 1 inside lane i
+        self.labels = np.zeros((h, w), dtype=np.uint8)
+        for i, polygon in enumerate(polygons):
+            cv2.fillPoly(self.labels, [polygon - (x, y)], i + 1)
+        self.mask = np.where(self.labels > 0, 255, 0).astype(np.uint8)
+        self.edge_mask = cv2.erode(self.mask, cv2.getStructuringElement(
+            cv2.MORPH_RECT, (2 * EDGE_MARGIN + 1, 2 * EDGE_MARGIN + 1)))
+        self._crop = np.zeros((h, w, 3), dtype=np.uint8)
+
+    def apply(self, frame, out=None):
+        """
+        Crop the frame to the lanes and blank everything outside of them.
+
+        :param frame: captured frame
+        :param out: array of the size of the lanes to write the result to,
+                    by default a buffer reused for every call
+        :return: frame of the lanes only
+        """
+        if self.mask is None:
+            if out is None:
+                return frame
+            np.copyto(out, frame)
+            return out
+        if out is None:
+            out = self._crop
+        x, y = self.origin
+        w, h = self.size
+        out[:] = 0
+        cv2.copyTo(frame[y: y + h, x: x + w], self.mask, out)
+        return out
+
+    def lane_of(self, contour):
+        """
+        Return the lane of an object, given by the lane of its center.
+
+        :param contour: contour of the object in the cropped frame
+        :return: index of the lane
+        """
+        if self.labels is None:
+            return 0
+        x, y, w, h = cv2.boundingRect(contour)
+        label = self.labels[min(y + h // 2, self.size[1] - 1),
+                            min(x + w // 2, self.size[0] - 1)]
+        return max(int(label) - 1, 0)
+
+    def count(self, lane):
+        """
+        Count one more object on a lane.
+
+        :param lane: index of the lane
+        :return: number of objects seen on the lane
+        """
+        self.counts[lane] += 1
+        return int(self.counts[lane])
+
+
+def load_lanes(item, frame_size):
+    """
+    Build the lanes of an input from its config entry.
+
+    :param item: entry of the input in the "inputs" list of config.json
+    :param frame_size: width and height of the captured frames
+    :return: Lanes
+    """
+    lanes = item.get('lanes', [])
+    return Lanes(frame_size,
+                 [lane['points'] for lane in lanes],
+                 [lane.get('name', "lane{}".format(i + 1))
+                  for i, lane in enumerate(lanes)])
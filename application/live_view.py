@@ -0,0 +1,184 @@
+"""Local MJPEG over HTTP live view of the annotated frames."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import cv2
+
+BOUNDARY = "frame"
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server with one thread per viewer. http.server only has it from
+    Python 3.7.
+    """
+    daemon_threads = True
+
+
+class LiveView:
+    """
+    MJPEG stream of the annotated frames, served over HTTP.
+
+    The inspection loop hands frames to publish(), which only keeps a
+    reference to the newest one and returns. A single encoder thread
+    resizes and JPEG-encodes it at most `fps` times per second, whatever
+    the number of viewers. Every viewer waits for the next encoded frame
+    and always gets the newest one, so a slow client skips frames instead
+    of building a backlog.
+    """
+
+    def __init__(self, port, host="0.0.0.0", fps=5, width=640, quality=80):
+        self.interval = 1.0 / fps
+        self.width = width
+        self.quality = quality
+        self.viewers = 0
+        self.jpeg = None
+        self.sequence = 0
+        self._pending = None
+        self._last_publish = 0
+        self._running = True
+        self._condition = threading.Condition()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+            threading.Thread(target=self._encode, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def publish(self, frame):
+        """
+        Offer a frame to the viewers. Never blocks on encoding or sending.
+
+        :param frame: annotated frame
+        :return: None
+        """
+        now = time.time()
+        if not self.viewers or now - self._last_publish < self.interval:
+            return
+        self._last_publish = now
+        with self._condition:
+            # The caller may draw on or reuse the frame after this call
+            self._pending = frame.copy()
+            self._condition.notify_all()
+
+    def _encode(self):
+        """
+        Encode the newest published frame once for all viewers.
+
+        :return: None
+        """
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        while self._running:
+            with self._condition:
+                while self._pending is None and self._running:
+                    self._condition.wait()
+                frame, self._pending = self._pending, None
+            if frame is None:
+                continue
+            height, width = frame.shape[:2]
+            if self.width and width > self.width:
+                frame = cv2.resize(frame, (self.width,
+                                           height * self.width // width),
+                                   interpolation=cv2.INTER_AREA)
+            ret, jpeg = cv2.imencode(".jpg", frame, params)
+            if not ret:
+                continue
+            with self._condition:
+                self.jpeg = jpeg.tobytes()
+                self.sequence += 1
+                self._condition.notify_all()
+
+    def next_jpeg(self, sequence):
+        """
+        Wait for a frame newer than the given one.
+
+        :param sequence: sequence number of the last frame sent to a viewer
+        :return: sequence number and JPEG bytes of the newest frame, or
+                 None when the live view is closed
+        """
+        with self._condition:
+            while self.sequence <= sequence and self._running:
+                self._condition.wait(1.0)
+            if not self._running:
+                return None
+            return self.sequence, self.jpeg
+
+    def _handler(self):
+        live_view = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/":
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Content-Type",
+                                 "multipart/x-mixed-replace; boundary={}"
+                                 .format(BOUNDARY))
+                self.end_headers()
+                with live_view._condition:
+                    live_view.viewers += 1
+                sequence = 0
+                try:
+                    while True:
+                        frame = live_view.next_jpeg(sequence)
+                        if frame is None:
+                            break
+                        sequence, jpeg = frame
+                        self.wfile.write(
+                            "--{}\r\nContent-Type: image/jpeg\r\n"
+                            "Content-Length: {}\r\n\r\n"
+                            .format(BOUNDARY, len(jpeg)).encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with live_view._condition:
+                        live_view.viewers -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def close(self):
+        """
+        Stop the encoder and the HTTP server.
+
+        :return: None
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,113 @@
+"""Detection of a stopped conveyor belt."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import cv2
+import numpy as np
+
+# Size of the thumbnails compared to find out if the scene changed
+THUMBNAIL_SIZE = (32, 24)
+
+
+class IdleDetector:
+    """
+    Tells if the scene changed since the last inspected frame.
+
+    Frames are reduced to small gray thumbnails and compared with the
+    thumbnail of the last inspected frame by their mean absolute difference.
+    While the belt is stopped every frame is compared, so the idle state
+    ends on the first frame with motion.
+    """
+
+    def __init__(self, size=THUMBNAIL_SIZE):
+        self.size = size
+        self.idle = False
+        # Number of inspections skipped because the belt was idle
+        self.skipped = 0
+        self._reference = None
+        self._thumbnail = None
+
+    def _reduce(self, frame):
+        """
+        Return the gray thumbnail of a frame.
+
+        :param frame: BGR frame
+        :return: thumbnail
+        """
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def check(self, frame, threshold):
+        """
+        Compare the frame with the last inspected one and update the idle
+        state.
+
+        :param frame: BGR frame
+        :param threshold: mean absolute difference in gray levels below
+                          which the scene is considered unchanged
+        :return: True if the idle state changed
+        """
+        self._thumbnail = self._reduce(frame)
+        if self._reference is None:
+            idle = False
+        else:
+            difference = cv2.absdiff(self._thumbnail, self._reference)
+            idle = cv2.mean(difference)[0] <= threshold
+        changed = idle != self.idle
+        self.idle = idle
+        return changed
+
+    def inspected(self):
+        """
+        Keep the last checked frame as the reference for the next ones.
+
+        :return: None
+        """
+        self._reference = self._thumbnail
+
+    def state(self):
+        """
+        Return the state of the detector, for a checkpoint.
+
+        :return: JSON-serializable dictionary
+        """
+        return {
+            "idle": self.idle,
+            "skipped": self.skipped,
+            "reference": None if self._reference is None
+            else self._reference.tolist(),
+        }
+
+    def restore(self, state):
+        """
+        Restore the state saved by state().
+
+        :param state: dictionary returned by state()
+        :return: None
+        """
+        self.idle = state["idle"]
+        self.skipped = state["skipped"]
+        self._reference = None if state["reference"] is None \
+            else np.array(state["reference"], dtype=np.uint8)
@@ -27,37 +27,62 @@
 import socket
 import math
 import sys
-import cv2
 import os
 import json
+import time
 from argparse import ArgumentParser
+
+from affinity import (apply_budget, parse_cores, plan_layout, preset_threads,
+                      print_layout)
+# The thread pools of this process are sized before NumPy and OpenCV load
+if __name__ == '__main__':
+    preset_threads(sys.argv[1:])
+
+import cv2
 from influxdb import InfluxDBClient
-from math import atan2
 
-import numpy as np
+from calibration import load_profile
+from checkpoint import CHECKPOINT_NAME, Checkpoint, seek
+from frame_store import EXTENSION, FrameStoreCapture
+from inspection import (NO_DEFECT, crop_path, defect_frame, inspect_frame,
+                        object_defects, save_crop)
+from live_view import LiveView
+from motion import IdleDetector
+from overlay import Overlay, hud_lines
+from reference import inspect_frame as reference_frame
+from lanes import load_lanes
+from parameters import ParameterWatcher
+from result_buffer import ResultBuffer
+from result_stream import ResultStream, encode_results
+from shedding import SHED_CRACK, SHED_CROPS, SHED_DISPLAY, LoadShedder
+from tiling import Tiler, parse_tile
 
 # GLOBAL Variables
 CONFIG_FILE = '../resources/config.json'
+# Directory in which the undistortion maps of calibrated inputs are saved
+CALIBRATION_CACHE = '../resources/calibration'
 
-OBJECT_AREA_MIN = 9000
-OBJECT_AREA_MAX = 50000
-LOW_H = 0
-LOW_S = 0
-LOW_V = 47
-# Thresholding of an Image in a color range
-HIGH_H = 179
-HIGH_S = 255
-HIGH_V = 255
-# Lower and upper value of color Range of the object
-# for color thresholding to detect the object
-LOWER_COLOR_RANGE = (0, 0, 0)
-UPPER_COLOR_RANGE = (174, 73, 255)
+# Thresholds and detector parameters are read from the "parameters" block
+# of CONFIG_FILE, see parameters.py for their meaning and default values
 COUNT_OBJECT = 0
+# Text over the displayed frames, rendered only when it changes
+HUD = Overlay()
+DEFECT_HUD = Overlay()
 HEIGHT_OF_OBJ = 0
 WIDTH_OF_OBJ = 0
 
 OBJECT_COUNT = "Object Number : {}".format(COUNT_OBJECT)
 
+# Optional parts of a run, set from the command line arguments. They are
+# off by default so the functions of this module also work when imported
+HEADLESS = False
+LIVE_VIEW = None
+SHEDDER = LoadShedder(0)
+TILER = None
+REFERENCE = False
+CHECKPOINT = None
+STREAM = None
+
 
 def build_argparser():
     """
@@ -81,27 +106,91 @@ def build_argparser():
                         type=float,
                         default=None,
                         help="Field of view of camera")
+    parser.add_argument("-r", "--results",
+                        required=False,
+                        default=None,
+                        help="Path of a .npy or .csv file to which the "
+                        "per-object results are saved on exit")
+    parser.add_argument("--headless",
+                        action="store_true",
+                        help="Do not open the local display window")
+    parser.add_argument("-lp", "--live_port",
+                        type=int,
+                        default=None,
+                        help="Port on which the annotated frames are "
+                        "streamed as MJPEG over HTTP")
+    parser.add_argument("-lf", "--live_fps",
+                        type=float,
+                        default=5,
+                        help="Maximum rate of the live view in frames "
+                        "per second")
+    parser.add_argument("-lw", "--live_width",
+                        type=int,
+                        default=640,
+                        help="Maximum width of the live view in pixels")
+    parser.add_argument("-w", "--workers",
+                        type=int,
+                        default=0,
+                        help="Number of worker processes inspecting the "
+                        "frames in parallel, 0 to inspect them in this "
+                        "process. Workers imply --headless")
+    parser.add_argument("-cpu", "--cores",
+                        default="none",
+                        help="Pin the detector to these cores, for example "
+                        "0-3,6, or \"all\" for all the cores it may use. "
+                        "With workers they are split between the processes "
+                        "and every process gets one thread per core of its "
+                        "share. By default the system schedules the threads")
+    parser.add_argument("-lb", "--latency_budget",
+                        type=float,
+                        default=0,
+                        help="Time in milliseconds the inspection of a frame "
+                        "may take before checks, saved images, displayed "
+                        "frames and finally inspected frames are dropped "
+                        "to keep up, 0 to never drop anything")
+    parser.add_argument("-t", "--tile",
+                        default="0",
+                        help="Size of the tiles the frames are split into "
+                        "and inspected on one thread per core, for example "
+                        "1024 or 1024x0 for strips of a line-scan camera, "
+                        "0 to inspect whole frames")
+    parser.add_argument("-ck", "--checkpoint",
+                        type=float,
+                        default=0,
+                        help="Seconds between two checkpoints of a run on a "
+                        "video file, saved in the output directory, 0 for "
+                        "no checkpoints. Not available with workers")
+    parser.add_argument("-rs", "--resume",
+                        action="store_true",
+                        help="Continue a stopped run from its last "
+                        "checkpoint instead of the first frame, keeping "
+                        "the saved images. Checkpoints are saved every "
+                        "-ck seconds, 60 by default")
+    parser.add_argument("-st", "--stream",
+                        default=None,
+                        help="Port on 127.0.0.1, or path of a Unix socket, "
+                        "on which every object result is published as "
+                        "soon as it is measured")
+    parser.add_argument("-sp", "--stream_policy",
+                        default="drop_oldest",
+                        help="What a subscriber of the stream that does not "
+                        "keep up loses by default: drop_oldest, drop_newest "
+                        "or disconnect")
+    parser.add_argument("-sq", "--stream_queue",
+                        type=int,
+                        default=1024,
+                        help="Default number of results queued for a "
+                        "subscriber of the stream")
+    parser.add_argument("-ref", "--reference",
+                        action="store_true",
+                        help="Inspect with the original per-object "
+                        "inspection, see reference.py, to compare its "
+                        "results and speed. Not available with workers or "
+                        "tiles")
 
     return parser
 
 
-def dimensions(box):
-    """
-    Return the length and width of the object.
-
-    :param box: consists of top left, right and bottom left, right co-ordinates
-    :return: Length and width of the object
-    """
-    (tl, tr, br, bl) = box
-    x = int(math.sqrt(math.pow((bl[0] - tl[0]), 2) + math.pow((bl[1] - tl[1]), 2)))
-    y = int(math.sqrt(math.pow((tl[0] - tr[0]), 2) + math.pow((tl[1] - tr[1]), 2)))
-
-    if x > y:
-        return x, y
-    else:
-        return y, x
-
-
 def get_ip_address():
     """
     Return IP address of the server.
@@ -115,363 +204,357 @@ def get_ip_address():
     return ipaddress, port, proxy
 
 
-def get_orientation(contours):
+def display_wanted():
     """
-    Gives the angle of the orientation of the object in radians.
-    Step 1: Convert 3D matrix of contours to 2D.
-    Step 2: Apply PCA algorithm to find angle of the data points.
-    Step 3: If angle is greater than 0.5, return_flag is made to True
-            else false.
-    Step 4: Save the image in "Orientation" folder if it has a
-            orientation defect.
-
-    :param contours: contour of the object from the frame
-    :return: angle of orientation of the object in radians
+    Tell if the frames are shown at all, locally or on the live view.
+
+    :return: True if the frames should be annotated
     """
-    size_points = len(contours)
-    # data_pts stores contour values in 2D
-    data_pts = np.empty((size_points, 2), dtype=np.float64)
-    for i in range(data_pts.shape[0]):
-        data_pts[i, 0] = contours[i, 0, 0]
-        data_pts[i, 1] = contours[i, 0, 1]
-    # Use PCA algorithm to find angle of the data points
-    mean, eigenvector = cv2.PCACompute(data_pts, mean=None)
-    angle = atan2(eigenvector[0, 1], eigenvector[0, 0])
-    return angle
-
-
-def detect_orientation(frame, contours):
+    return not HEADLESS or (LIVE_VIEW is not None and LIVE_VIEW.viewers > 0)
+
+
+def show_defect(frame, defect):
     """
-    Identifies the Orientation of the object based on the detected angle.
+    Annotate and show the frame of a defective object for two seconds.
 
-    :param frame: Input frame from video
-    :param contours: contour of the object from the frame
-    :return: defect_flag, defect
+    :param frame: copy of the frame with the defect drawn on it
+    :param defect: name of the defect
+    :return: None
     """
-    defect = "Orientation"
-    global OBJECT_COUNT
-    # Find the orientation of each contour
-    angle = get_orientation(contours)
-    # If angle is less than 0.5 then no orientation defect is present
-    if angle < 0.5:
-        defect_flag = False
-    else:
-        x, y, w, h = cv2.boundingRect(contours)
-        print("Orientation defect detected in object {}".format(COUNT_OBJECT))
-        defect_flag = True
-        cv2.imwrite("{}/orientation/Orientation_{}.png"
-                    .format(base_dir, COUNT_OBJECT),
-                    frame[y: y + h , x : x + w])
-        cv2.putText(frame, OBJECT_COUNT, (5, 50), cv2.FONT_HERSHEY_SIMPLEX,
-                    0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Defect: {}".format(defect), (5, 140),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Length (mm): {}".format(HEIGHT_OF_OBJ), (5, 80),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Width (mm): {}".format(WIDTH_OF_OBJ), (5, 110),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.imshow("Out", frame)
-        cv2.waitKey(2000)
-    return defect_flag, defect
-
-
-def detect_color(frame, cnt):
+    if not display_wanted():
+        return
+    if SHEDDER.sheds(SHED_DISPLAY):
+        SHEDDER.count(SHED_DISPLAY)
+        return
+    DEFECT_HUD.draw(frame, hud_lines(OBJECT_COUNT, defect, HEIGHT_OF_OBJ,
+                                     WIDTH_OF_OBJ, quit_hint=False))
+    show_frame(frame, 2000)
+
+
+def show_frame(frame, delay):
     """
-    Identifies the color defect W.R.T the set default color of the object.
-    Step 1: Increase the brightness of the image.
-    Step 2: Convert the image to HSV Format. HSV color space gives more
-            information about the colors of the image.
-            It helps to identify distinct colors in the image.
-    Step 3: Threshold the image based on the color using "inRange" function.
-            Range of the color, which is considered as a defect for object, is
-            passed as one of the argument to inRange function to create a mask.
-    Step 4: Morphological opening and closing is done on the mask to remove
-            noises and fill the gaps.
-    Step 5: Find the contours on the mask image. Contours are filtered based on
-            the area to get the contours of defective area. Contour of the
-            defective area is then drawn on the original image to visualize.
-    Step 6: Save the image in "color" folder if it has a color defect.
-
-    :param frame: Input frame from the video
-    :param cnt: Contours of the object
-    :return: color_flag, defect
+    Show the frame in the "Out" window and send it to the live view.
+
+    :param frame: annotated frame
+    :param delay: time to wait for a key press in milliseconds
+    :return: code of the key pressed, -1 if none
     """
-    defect = "Color"
-    global OBJECT_COUNT
-    color_flag = False
-    # Increase the brightness of the image
-    cv2.convertScaleAbs(frame, frame, 1, 20)
-    # Convert the captured frame from BGR to HSV
-    img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    # Threshold the image
-    img_threshold = cv2.inRange(img_hsv, LOWER_COLOR_RANGE, UPPER_COLOR_RANGE)
-    # Morphological opening (remove small objects from the foreground)
-    img_threshold = cv2.erode(img_threshold,
-                              kernel=cv2.getStructuringElement(
-                                  cv2.MORPH_ELLIPSE, (5, 5)))
-    img_threshold = cv2.dilate(img_threshold,
-                               kernel=cv2.getStructuringElement(
-                                   cv2.MORPH_ELLIPSE, (5, 5)))
-    contours, hierarchy = cv2.findContours(img_threshold, cv2.RETR_LIST,
-                                           cv2.CHAIN_APPROX_NONE)
-    for i in range(len(contours)):
-        area = cv2.contourArea(contours[i])
-        if 2000 < area < 10000:
-            cv2.drawContours(frame, contours[i], -1, (0, 0, 255), 2)
-            color_flag = True
-    if color_flag:
-        x, y, w, h = cv2.boundingRect(cnt)
-        print("Color defect detected in object {}".format(COUNT_OBJECT))
-        cv2.imwrite("{}/color/Color_{}.png".format(base_dir, COUNT_OBJECT),
-                    frame[y : y + h, x : x + w])
-        cv2.putText(frame, OBJECT_COUNT, (5, 50), cv2.FONT_HERSHEY_SIMPLEX,
-                    0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Defect: {}".format(defect), (5, 140),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Length (mm): {}".format(HEIGHT_OF_OBJ), (5, 80),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Width (mm): {}".format(WIDTH_OF_OBJ), (5, 110),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.imshow("Out", frame)
-        cv2.waitKey(2000)
-    return color_flag, defect
-
-
-def detect_crack(frame, cnt):
+    if LIVE_VIEW:
+        LIVE_VIEW.publish(frame)
+    if HEADLESS:
+        return -1
+    cv2.imshow("Out", frame)
+    return cv2.waitKey(delay)
+
+
+def report_idle(idle):
+    """
+    Send a change of the idle state of the belt to the database.
+
+    :param idle: True if the belt stopped, False if it moves again
+    :return: None
     """
-    Identify the Crack defect on the object.
-    Step 1: Convert the image to gray scale.
-    Step 2: Blur the gray image to remove the noises.
-    Step 3: Find the edges on the blurred image to get the contours of
-            possible cracks.
-    Step 4: Filter the contours to get the contour of the crack.
-    Step 5: Draw the contour on the orignal image for visualization.
-    Step 6: Save the image in "crack" folder if it has crack defect.
-
-    :param frame: Input frame from the video
-    :param cnt: Contours of the object
-    :return: defect_flag, defect, cnt
+    print("Belt {}".format("idle" if idle else "moving"))
+    update_data([{
+        "measurement": "obj_flaw_detector_state",
+        "tags": {
+            "user": "User"
+        },
+        "fields": {
+            "Idle": int(idle)
+        }
+    }])
+
+
+def report_shedding():
     """
-    defect = "Crack"
-    global OBJECT_COUNT
-    defect_flag = False
-    low_threshold = 130
-    kernel_size = 3
-    ratio = 3
-    # Convert the captured frame from BGR to GRAY
-    img = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    img = cv2.blur(img, (7, 7))
-    # Find the edges
-    detected_edges = cv2.Canny(img, low_threshold,
-                               low_threshold * ratio, kernel_size)
-    # Find the contours
-    contours, hierarchy = cv2.findContours(detected_edges, cv2.RETR_TREE,
-                                           cv2.CHAIN_APPROX_NONE)
-
-    if len(contours) != 0:
-        for i in range(len(contours)):
-            area = cv2.contourArea(contours[i])
-            if area > 20 or area < 9:
-                cv2.drawContours(frame, contours, i, (0, 255, 0), 2)
-                defect_flag = True
-
-        if defect_flag:
-            x, y, w, h = cv2.boundingRect(cnt)
-            print("Crack defect detected in object {}".format(COUNT_OBJECT))
-            cv2.imwrite("{}/crack/Crack_{}.png".format(base_dir, COUNT_OBJECT),
-                        frame[y : y + h , x : x + w ])
-            cv2.putText(frame, OBJECT_COUNT, (5, 50), cv2.FONT_HERSHEY_SIMPLEX,
-                        0.75, (255, 255, 255), 2)
-            cv2.putText(frame, "Defect: {}".format(defect), (5, 140),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-            cv2.putText(frame, "Length (mm): {}".format(HEIGHT_OF_OBJ),
-                        (5, 80),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-            cv2.putText(frame, "Width (mm): {}".format(WIDTH_OF_OBJ), (5, 110),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-            cv2.imshow("Out", frame)
-            cv2.waitKey(2000)
-    return defect_flag, defect
+    Send a change of the shedding tier and the shed action counts to the
+    database.
+
+    :return: None
+    """
+    print("Shedding: {}".format(SHEDDER.describe()))
+    fields = {"Level": SHEDDER.level}
+    for name, count in SHEDDER.counts.items():
+        fields[name.capitalize()] = count
+    update_data([{
+        "measurement": "obj_flaw_detector_shedding",
+        "tags": {
+            "user": "User"
+        },
+        "fields": fields
+    }])
 
 
 def update_data(input_data):
     """
     To update database with input_data.
-    Step 1: Write given data points to the database.
+    Step 1: Write given data points to the database in one request.
     Step 2: Use SELECT statement to query the database.
 
-    :param input_data: JSON body consisting of object number and defect values
+    :param input_data: list of JSON bodies, one per object, consisting of
+                       object number and defect values
     """
-    client.write_points([input_data])
+    client.write_points(input_data, time_precision='u')
     client.query('SELECT * from "obj_flaw_detector"')
 
 
+def save_checkpoint():
+    """
+    Save the position in the input and the state of the run.
+
+    :return: None
+    """
+    CHECKPOINT.save({
+        "video": item['video'],
+        "frame_step": FRAME_STEP,
+        "frame_count": FRAME_COUNT,
+        "count_object": COUNT_OBJECT,
+        "lanes": LANES.counts.tolist(),
+        "idle": IDLE.state(),
+        "shedder": SHEDDER.state(),
+    }, RESULTS)
+
+
+def resume(state):
+    """
+    Continue the run from a checkpoint: seek the input to the frame after
+    it, restore the counters and the idle and shedding state and delete
+    the points of the frames after it, which are sent again.
+
+    :param state: state of the run saved by save_checkpoint()
+    :return: None
+    """
+    global FRAME_COUNT
+    global COUNT_OBJECT
+    global OBJECT_COUNT
+    if state["video"] != item['video'] or \
+            state["frame_step"] != FRAME_STEP:
+        print("The checkpoint is of another input: {}".format(state["video"]))
+        sys.exit(1)
+    FRAME_COUNT = state["frame_count"]
+    if not seek(cap, FRAME_COUNT // FRAME_STEP):
+        print("The input cannot seek, frames were skipped from the start")
+    COUNT_OBJECT = state["count_object"]
+    OBJECT_COUNT = "Object Number : {}".format(COUNT_OBJECT)
+    LANES.counts[:] = state["lanes"]
+    IDLE.restore(state["idle"])
+    SHEDDER.restore(state["shedder"])
+    for measurement in ("obj_flaw_detector", "obj_flaw_detector_state",
+                        "obj_flaw_detector_shedding"):
+        client.query(CHECKPOINT.delete_after(measurement))
+    print("Resumed at frame {} after object {}".format(FRAME_COUNT,
+                                                       COUNT_OBJECT))
+
+
+def record_object(obj, frame_index, param_version, shed=0):
+    """
+    Number an inspected object and store its result.
+
+    :param obj: per-object result of inspect_frame
+    :param frame_index: index of the frame of the object in the video
+    :param param_version: version of the parameters the frame was inspected
+                          with
+    :param shed: bit mask of the actions shed for the frame
+    :return: number of the object
+    """
+    global COUNT_OBJECT
+    COUNT_OBJECT += 1
+    LANES.count(obj["lane"])
+    RESULTS.append(object_id=COUNT_OBJECT,
+                   frame_index=frame_index,
+                   timestamp=time.time(),
+                   length=obj["length"],
+                   width=obj["width"],
+                   angle=obj["angle"],
+                   orientation=obj["orientation"],
+                   color=obj["color"],
+                   crack=obj["crack"],
+                   no_defect=obj["no_defect"],
+                   param_version=param_version,
+                   lane=obj["lane"],
+                   shed=shed)
+    return COUNT_OBJECT
+
+
+def publish_object():
+    """
+    Publish the result of the last recorded object on the result stream.
+    Called once the images of the object are saved, so a subscriber
+    never looks for an image that is not written yet.
+
+    :return: None
+    """
+    if STREAM:
+        STREAM.publish(encode_results(RESULTS, len(RESULTS) - 1))
+
+
+def print_defect(defect, object_id):
+    """
+    Print a defect of an object.
+
+    :param defect: name of the defect, or "No Defect"
+    :param object_id: number of the object
+    :return: None
+    """
+    if defect == NO_DEFECT[0]:
+        print("No defect detected in object {}".format(object_id))
+    else:
+        print("{} defect detected in object {}".format(defect, object_id))
+
+
+def fanout_detection(fanout):
+    """
+    Number, save and send the objects inspected by the worker processes,
+    in the order of their frames.
+
+    :param fanout: started FanOut of the input
+    :return: None
+    """
+    for message in fanout.results():
+        if message[0] == "state":
+            report_idle(message[1])
+            continue
+        kind, frame_index, param_version, objects = message
+        first_row = len(RESULTS)
+        for obj in objects:
+            object_id = record_object(obj, frame_index, param_version)
+            for defect, png in obj["crops"]:
+                print_defect(defect, object_id)
+                with open(crop_path(base_dir, defect, object_id), "wb") as f:
+                    f.write(png)
+            publish_object()
+            print("Length (mm) = {}, width (mm) = {}".format(
+                obj["length"], obj["width"]))
+        # Send the results of all objects of this frame to influxdb
+        if len(RESULTS) > first_row:
+            update_data(RESULTS.influx_points(first_row,
+                                              lane_names=LANES.names))
+
+
 def flaw_detection():
     """
     Measurement and defects such as color, crack and orientation of the object
     are found.
 
-    :return: None
+    :return: True if the input was read to its end, False if it was quit
     """
     global HEIGHT_OF_OBJ
     global WIDTH_OF_OBJ
-    global COUNT_OBJECT
     global OBJ_DEFECT
     global FRAME_COUNT
     global OBJECT_COUNT
+    global PARAMS
 
+    finished = False
     while cap.isOpened():
         # Read the frame from the stream
         ret, frame = cap.read()
 
         if not ret:
+            finished = True
             break
 
-        FRAME_COUNT += 1
+        # Keep only the lanes of the belt
+        frame = LANES.apply(frame)
+        FRAME_COUNT += FRAME_STEP
+        # Take the latest parameters, they stay the same for the whole frame
+        PARAMS = WATCHER.current
 
         # Check every given frame number
         # (Number chosen based on the frequency of object on conveyor belt)
-        if FRAME_COUNT % frame_number == 0:
+        inspect = FRAME_COUNT % PARAMS.frame_number == 0
+
+        # Skip the inspection while the belt is stopped, the frame would
+        # show the same objects as the last inspected one
+        if PARAMS.idle_threshold and (inspect or IDLE.idle):
+            if IDLE.check(frame, PARAMS.idle_threshold):
+                report_idle(IDLE.idle)
+            if IDLE.idle and inspect:
+                IDLE.skipped += 1
+                inspect = False
+
+        # Drop every other inspection while far behind
+        if inspect and SHEDDER.drop_frame():
+            inspect = False
+
+        if inspect:
+            begin = time.time()
+            display_time = 0
+            IDLE.inspected()
             HEIGHT_OF_OBJ = 0
             WIDTH_OF_OBJ = 0
             OBJ_DEFECT = []
-            data_base = []
-            # Convert BGR image to HSV color space
-            img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-            # Thresholding of an Image in a color range
-            img_threshold = cv2.inRange(img_hsv, (LOW_H, LOW_S, LOW_V),
-                                        (HIGH_H, HIGH_S, HIGH_V))
-
-            # Morphological opening(remove small objects from the foreground)
-            img_threshold = cv2.erode(img_threshold,
-                                      cv2.getStructuringElement(
-                                          cv2.MORPH_ELLIPSE, (5, 5)))
-            img_threshold = cv2.dilate(img_threshold,
-                                       cv2.getStructuringElement(
-                                           cv2.MORPH_ELLIPSE, (5, 5)))
-
-            # Morphological closing(fill small holes in the foreground)
-            img_threshold = cv2.dilate(img_threshold,
-                                       cv2.getStructuringElement(
-                                           cv2.MORPH_ELLIPSE, (5, 5)))
-            img_threshold = cv2.erode(img_threshold,
-                                      cv2.getStructuringElement(
-                                          cv2.MORPH_ELLIPSE, (5, 5)))
-
-            # Find the contours on the image
-            contours, hierarchy = cv2.findContours(img_threshold,
-                                                   cv2.RETR_LIST,
-                                                   cv2.CHAIN_APPROX_NONE)
-
-            for cnt in contours:
-                x, y, w, h = cv2.boundingRect(cnt)
-                if OBJECT_AREA_MAX > w * h > OBJECT_AREA_MIN:
-                    box = cv2.minAreaRect(cnt)
-                    box = cv2.boxPoints(box)
-                    height, width = dimensions(np.array(box, dtype='int'))
-                    HEIGHT_OF_OBJ = round(height * one_pixel_length * 10, 2)
-                    WIDTH_OF_OBJ = round(width * one_pixel_length * 10, 2)
-                    COUNT_OBJECT += 1
-                    frame_orient = frame.copy()
-                    frame_clr = frame.copy()
-                    frame_crack = frame.copy()
-                    frame_nodefect = frame.copy()
-                    OBJECT_COUNT = "Object Number : {}".format(COUNT_OBJECT)
-
-                    # Check for the orientation of the object
-                    orientation_flag, orientation_defect = \
-                        detect_orientation(frame_orient, cnt)
-                    if orientation_flag:
-                        value = 1
-                        data_base.append(value)
-                        OBJ_DEFECT.append(str(orientation_defect))
-                    else:
-                        value = 0
-                        data_base.append(value)
-
-                    # Check for the color defect of the object
-                    color_flag, color_defect = detect_color(frame_clr, cnt)
-                    if color_flag:
-                        value = 1
-                        data_base.append(value)
-                        OBJ_DEFECT.append(str(color_defect))
-                    else:
-                        value = 0
-                        data_base.append(value)
-
-                    # Check for the crack defect of the object
-                    crack_flag, crack_defect = detect_crack(frame_crack, cnt)
-                    if crack_flag:
-                        value = 1
-                        data_base.append(value)
-                        OBJ_DEFECT.append(str(crack_defect))
-                    else:
-                        value = 0
-                        data_base.append(value)
-
-                    # Check if none of the defect is found
-                    if not OBJ_DEFECT:
-                        value = 1
-                        data_base.append(value)
-                        defect = "No Defect"
-                        OBJ_DEFECT.append(defect)
-                        print("No defect detected in object {}"
-                              .format(COUNT_OBJECT))
-                        cv2.putText(frame_nodefect, "Length (mm): {}".format(HEIGHT_OF_OBJ),
-                                    (5, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.75,
-                                    (255, 255, 255), 2)
-                        cv2.putText(frame_nodefect, "Width (mm): {}".format(WIDTH_OF_OBJ),
-                                    (5, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.75,
-                                    (255, 255, 255), 2)
-                        cv2.imwrite("{}/no_defect/Nodefect_{}.png".format(
-                            base_dir, COUNT_OBJECT),
-                                    frame[y : y + h,
-                                          x : x + w])
-                    else:
-                        value = 0
-                        data_base.append(value)
-                    print("Length (mm) = {}, width (mm) = {}".format(
-                        HEIGHT_OF_OBJ, WIDTH_OF_OBJ))
-            if not OBJ_DEFECT:
-                continue
-
-            # Create json_body to store the defects
+            first_row = len(RESULTS)
+            # Checks and saved images dropped for this frame to keep up
+            shed = SHEDDER.actions & (SHED_CRACK | SHED_CROPS)
+            if REFERENCE:
+                objects, annotations = reference_frame(
+                    frame, PARAMS, PROFILE, LANES, crack=not shed & SHED_CRACK)
             else:
-                json_body = {
-                    "measurement": "obj_flaw_detector",
-                    "tags": {
-                        "user": "User"
-                    },
-
-                    "fields": {
-                        "Object Number": COUNT_OBJECT,
-                        "Orientation": data_base[0],
-                        "Color": data_base[1],
-                        "Crack": data_base[2],
-                        "No defect": data_base[3]
-                    }
-                }
-                # Send json_body to influxdb
-                update_data(json_body)
-
-        all_defects = " ".join(OBJ_DEFECT)
-        cv2.putText(frame, "Press q to quit", (410, 50),
-                    cv2.FONT_HERSHEY_COMPLEX, 1, (255, 255, 255), 2)
-        cv2.putText(frame, OBJECT_COUNT, (5, 50), cv2.FONT_HERSHEY_SIMPLEX,
-                    0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Defect: {}".format(all_defects), (5, 140),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Length (mm): {}".format(HEIGHT_OF_OBJ), (5, 80),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.putText(frame, "Width (mm): {}".format(WIDTH_OF_OBJ), (5, 110),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        cv2.imshow("Out", frame)
-        keypressed = cv2.waitKey(40)
+                objects, annotations = inspect_frame(
+                    frame, PARAMS, PROFILE, LANES, crack=not shed & SHED_CRACK,
+                    tiler=TILER)
+            if shed & SHED_CRACK:
+                SHEDDER.count(SHED_CRACK)
+            for obj in objects:
+                # Length and width in millimeters, corrected for lens
+                # distortion and perspective of the input
+                HEIGHT_OF_OBJ, WIDTH_OF_OBJ = obj["length"], obj["width"]
+                record_object(obj, FRAME_COUNT, PARAMS.version, shed)
+                OBJECT_COUNT = "Object Number : {}".format(COUNT_OBJECT)
+                # Defects of this object only, shown on the display
+                OBJ_DEFECT = object_defects(obj)
+
+                # Save the image of the object in the folder of each of its
+                # defects, with the defect drawn on it
+                defect_images = []
+                for defect in OBJ_DEFECT:
+                    print_defect(defect, COUNT_OBJECT)
+                    image = defect_frame(frame, defect, annotations)
+                    if shed & SHED_CROPS:
+                        SHEDDER.count(SHED_CROPS)
+                    else:
+                        save_crop(base_dir, defect, COUNT_OBJECT, image,
+                                  obj["contour"], PROFILE)
+                    if defect != NO_DEFECT[0]:
+                        defect_images.append((image, defect))
+                publish_object()
+                for image, defect in defect_images:
+                    shown = time.time()
+                    show_defect(image, defect)
+                    display_time += time.time() - shown
+                print("Length (mm) = {}, width (mm) = {}".format(
+                    HEIGHT_OF_OBJ, WIDTH_OF_OBJ))
+
+            # Send the results of all objects of this frame to influxdb
+            if len(RESULTS) > first_row:
+                update_data(RESULTS.influx_points(first_row,
+                                                  lane_names=LANES.names))
+
+            # The time the defects were shown is not part of the budget
+            if SHEDDER.update(time.time() - begin - display_time):
+                report_shedding()
+
+        if CHECKPOINT and CHECKPOINT.due():
+            save_checkpoint()
+
+        keypressed = -1
+        if not display_wanted():
+            keypressed = show_frame(frame, 40)
+        elif SHEDDER.show_frame(FRAME_COUNT):
+            # Frames of a frame store are read-only views
+            if not frame.flags.writeable:
+                frame = frame.copy()
+            HUD.draw(frame, hud_lines(OBJECT_COUNT, " ".join(OBJ_DEFECT),
+                                      HEIGHT_OF_OBJ, WIDTH_OF_OBJ))
+            keypressed = show_frame(frame, 40)
         if keypressed == 113 or keypressed == 81:
             break
-    cv2.destroyAllWindows()
+    if not HEADLESS:
+        cv2.destroyAllWindows()
     cap.release()
+    return finished
 
 
 if __name__ == '__main__':
@@ -483,6 +566,30 @@ if __name__ == '__main__':
     if not base_dir:
         base_dir = os.getcwd()
 
+    HEADLESS = args.headless or args.workers > 0
+    CORES = parse_cores(args.cores)
+    TILE = parse_tile(args.tile)
+    REFERENCE = args.reference
+    if REFERENCE and (args.workers or TILE):
+        print("The reference inspection is not available with workers or "
+              "tiles")
+        sys.exit(1)
+    if args.stream:
+        STREAM = ResultStream(args.stream, args.stream_policy,
+                              args.stream_queue)
+        print("Results published on {}".format(args.stream))
+    if args.checkpoint or args.resume:
+        if args.workers:
+            print("Checkpoints are not available with workers")
+            sys.exit(1)
+        CHECKPOINT = Checkpoint(os.path.join(base_dir, CHECKPOINT_NAME),
+                                args.checkpoint or 60)
+    if args.live_port:
+        LIVE_VIEW = LiveView(args.live_port, fps=args.live_fps,
+                             width=args.live_width)
+        print("Live view on http://{}:{}/".format(socket.gethostname(),
+                                                  args.live_port))
+
     # Checks for the video file
     assert os.path.isfile(CONFIG_FILE), "{} file doesn't exist".format(CONFIG_FILE)
     config = json.loads(open(CONFIG_FILE).read())
@@ -498,7 +605,10 @@ if __name__ == '__main__':
             delay = (int)(1000 / fps)
         else:
             input_stream = item['video']
-            cap = cv2.VideoCapture(input_stream)
+            if input_stream.endswith(EXTENSION):
+                cap = FrameStoreCapture(input_stream)
+            else:
+                cap = cv2.VideoCapture(input_stream)
             if not cap.isOpened():
                 print("\nUnable to open video file... Exiting...\n")
                 sys.exit(0)
@@ -526,10 +636,25 @@ if __name__ == '__main__':
         else:
             one_pixel_length = 0.0264583333
 
+        # Lanes of the belt, frames are cropped to them before processing
+        LANES = load_lanes(item, (cap.get(3), cap.get(4)))
+        # Calibration profile of the input, falls back to one_pixel_length
+        PROFILE = load_profile(item, (cap.get(3), cap.get(4)),
+                               one_pixel_length, CALIBRATION_CACHE,
+                               LANES.origin)
+
     dir_names = ["crack", "color", "orientation", "no_defect"]
     OBJ_DEFECT = []
-    frame_number = 40
     FRAME_COUNT = 0
+    # A frame store may only hold every n-th frame of the video
+    FRAME_STEP = getattr(cap, 'frame_step', 1)
+    # Reload the parameters whenever CONFIG_FILE changes, without restarting
+    WATCHER = ParameterWatcher(CONFIG_FILE)
+    WATCHER.start()
+    PARAMS = WATCHER.current
+    RESULTS = ResultBuffer()
+    SHEDDER = LoadShedder(args.latency_budget / 1000.0)
+    IDLE = IdleDetector()
 
     # Get ipaddress from the get_ip_address
     ipaddress, port, proxy,  = get_ip_address()
@@ -538,15 +663,84 @@ if __name__ == '__main__':
                             database=database, proxies=proxy)
     client.create_database(database)
 
+    STATE = None
+    if CHECKPOINT:
+        if item['video'].isdigit():
+            print("Checkpoints need a video file, not a camera")
+            sys.exit(1)
+        if args.resume:
+            STATE = CHECKPOINT.load(RESULTS)
+            if STATE is None:
+                print("No checkpoint in {}, starting from the first frame"
+                      .format(base_dir))
+        # Results of an older run are not continued
+        if STATE is None:
+            CHECKPOINT.remove()
+
     # create folders with the given dir_names to save defective objects
     for i in range(len(dir_names)):
         if not os.path.exists(os.path.join(base_dir, dir_names[i])):
             os.makedirs(os.path.join(base_dir, dir_names[i]))
-        else:
+        elif STATE is None:
             file_list = os.listdir(os.path.join(base_dir, dir_names[i]))
             for f in file_list:
                 os.remove(os.path.join(base_dir, dir_names[i], f))
     # Find dimensions and flaw detections such as color, crack and orientation
     # of the object.
-    flaw_detection()
+    if args.workers:
+        # Shared memory between processes needs Python 3.8, only loaded
+        # for workers
+        from fanout import FanOut
+
+        # The capture process opens the input again
+        FANOUT = FanOut(item, CONFIG_FILE, (cap.get(3), cap.get(4)),
+                        one_pixel_length, CALIBRATION_CACHE, args.workers,
+                        cores=CORES, tile=TILE)
+        cap.release()
+        FANOUT.start()
+        fanout_detection(FANOUT)
+        FANOUT.close()
+        IDLE.skipped = FANOUT.skipped
+        print("Frames dropped while all workers were busy: {}"
+              .format(FANOUT.dropped))
+    else:
+        if CORES:
+            print_layout(plan_layout(CORES, 0))
+            apply_budget(CORES)
+        if TILE:
+            TILER = Tiler(TILE, len(CORES) if CORES else None)
+        if STATE:
+            resume(STATE)
+        finished = flaw_detection()
+        if TILER:
+            TILER.close()
+        if CHECKPOINT:
+            # A quit run keeps its checkpoint to be resumed, a complete one
+            # removes it
+            if finished:
+                CHECKPOINT.remove()
+            else:
+                save_checkpoint()
+            print("Checkpoints: {}".format(CHECKPOINT.describe()))
+    print("Inspections skipped while the belt was idle: {}"
+          .format(IDLE.skipped))
+    if SHEDDER.budget:
+        print("Shed to keep up: {}".format(", ".join(
+            "{} {}".format(name, count)
+            for name, count in SHEDDER.counts.items())))
+    if LIVE_VIEW:
+        LIVE_VIEW.close()
+    if STREAM:
+        STREAM.close()
+        print("Result stream: {} subscribers, {} results sent, {} dropped"
+              .format(*STREAM.stats()))
+    for name, count in zip(LANES.names, LANES.counts):
+        print("Objects on {}: {}".format(name, count))
+
+    # Save the per-object results for offline analysis
+    if args.results:
+        if args.results.endswith(".csv"):
+            RESULTS.save_csv(args.results)
+        else:
+            RESULTS.save_npy(args.results)
 
@@ -0,0 +1,181 @@
+"""Cached rendering of the text drawn over the displayed frames."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+WHITE = (255, 255, 255)
+
+
+def hud_lines(object_count, defects, length, width, quit_hint=True):
+    """
+    Return the text lines of the display.
+
+    :param object_count: "Object Number : n" text
+    :param defects: defects of the object, separated by spaces
+    :param length: length of the object in millimeters
+    :param width: width of the object in millimeters
+    :param quit_hint: also show how to quit
+    :return: list of (text, origin, font, scale) tuples
+    """
+    lines = [
+        (object_count, (5, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.75),
+        ("Defect: {}".format(defects), (5, 140),
+         cv2.FONT_HERSHEY_SIMPLEX, 0.75),
+        ("Length (mm): {}".format(length), (5, 80),
+         cv2.FONT_HERSHEY_SIMPLEX, 0.75),
+        ("Width (mm): {}".format(width), (5, 110),
+         cv2.FONT_HERSHEY_SIMPLEX, 0.75),
+    ]
+    if quit_hint:
+        lines.insert(0, ("Press q to quit", (410, 50),
+                         cv2.FONT_HERSHEY_COMPLEX, 1))
+    return lines
+
+
+class Overlay:
+    """
+    Text overlay rendered once into small BGRA tiles.
+
+    Every line of text gets a tile covering only its bounding box, rendered
+    again only when the text of that line changes. Drawing the overlay
+    blends each tile into its region of the frame with two saturating
+    uint8 operations, using the color premultiplied by alpha and the
+    inverse alpha kept with the tile. The rest of the frame is not touched.
+    """
+
+    def __init__(self, thickness=2, color=WHITE):
+        self.thickness = thickness
+        self.color = color
+        self.tiles = {}
+
+    def _render(self, line):
+        """
+        Render one line of text into a tile.
+
+        :param line: (text, origin, font, scale) tuple
+        :return: x, y, premultiplied color and inverse alpha of the tile
+        """
+        text, (x, y), font, scale = line
+        (w, h), baseline = cv2.getTextSize(text, font, scale, self.thickness)
+        margin = self.thickness
+        x0 = max(x - margin, 0)
+        y0 = max(y - h - margin, 0)
+        x1 = x + w + margin
+        y1 = y + baseline + margin
+        tile = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        cv2.putText(tile, text, (x - x0, y - y0), font, scale,
+                    self.color + (255,), self.thickness)
+        alpha = cv2.cvtColor(tile[:, :, 3], cv2.COLOR_GRAY2BGR)
+        color = np.empty_like(alpha)
+        color[:] = self.color
+        premultiplied = cv2.multiply(color, alpha, scale=1 / 255.0)
+        inverse_alpha = cv2.subtract(np.full_like(alpha, 255), alpha)
+        return x0, y0, premultiplied, inverse_alpha
+
+    def draw(self, frame, lines):
+        """
+        Draw the lines on the frame, rendering only the lines that changed.
+
+        :param frame: frame to draw on, modified in place
+        :param lines: list of (text, origin, font, scale) tuples
+        :return: frame
+        """
+        tiles = {}
+        height, width = frame.shape[:2]
+        for line in lines:
+            tile = self.tiles.get(line)
+            if tile is None:
+                tile = self._render(line)
+            tiles[line] = tile
+            x0, y0, premultiplied, inverse_alpha = tile
+            h = min(premultiplied.shape[0], height - y0)
+            w = min(premultiplied.shape[1], width - x0)
+            if h <= 0 or w <= 0:
+                continue
+            roi = frame[y0: y0 + h, x0: x0 + w]
+            cv2.multiply(roi, inverse_alpha[:h, :w], roi, scale=1 / 255.0)
+            cv2.add(roi, premultiplied[:h, :w], roi)
+        # Only keep the tiles of the current text
+        self.tiles = tiles
+        return frame
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Measure the per-frame cost of the "
+                            "text overlay")
+    parser.add_argument("-s", "--size",
+                        default="640x480",
+                        help="Size of the frames, WIDTHxHEIGHT")
+    parser.add_argument("-n", "--frames",
+                        type=int,
+                        default=1000,
+                        help="Number of frames to draw on")
+    parser.add_argument("-c", "--change_every",
+                        type=int,
+                        default=40,
+                        help="Number of frames between two text changes")
+    return parser
+
+
+def benchmark(size, frames, change_every):
+    """
+    Print the per-frame cost of cv2.putText and of the cached overlay.
+
+    :param size: width and height of the frames
+    :param frames: number of frames to draw on
+    :param change_every: number of frames between two text changes
+    :return: None
+    """
+    frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    overlay = Overlay()
+    for name in ("putText", "overlay"):
+        start = time.time()
+        for i in range(frames):
+            count = i // change_every
+            lines = hud_lines("Object Number : {}".format(count),
+                              "Color Crack", 30.5 + count, 10.25)
+            if name == "putText":
+                for text, org, font, scale in lines:
+                    cv2.putText(frame, text, org, font, scale, WHITE, 2)
+            else:
+                overlay.draw(frame, lines)
+        elapsed = (time.time() - start) / frames
+        print("{}: {:.3f} ms per frame".format(name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    size = tuple(int(value) for value in args.size.split("x"))
+    benchmark(size, args.frames, args.change_every)
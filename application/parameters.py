@@ -0,0 +1,217 @@
+"""Versioned detector parameters, reloaded from config.json while running."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import json
+import os
+import threading
+
+import cv2
+
+# Values used when config.json has no "parameters" block
+DEFAULT_PARAMETERS = {
+    "version": 0,
+    # Area of the bounding box of an object, in pixels
+    "object_area_min": 9000,
+    "object_area_max": 50000,
+    # HSV range of the object, used to find it on the belt
+    "object_color_low": [0, 0, 47],
+    "object_color_high": [179, 255, 255],
+    # HSV range of the color considered as a defect
+    "defect_color_low": [0, 0, 0],
+    "defect_color_high": [174, 73, 255],
+    # Area of a defective color region, in pixels
+    "color_area_min": 2000,
+    "color_area_max": 10000,
+    # Canny thresholds for the crack edges
+    "canny_low_threshold": 130,
+    "canny_ratio": 3,
+    # Contours with an area outside this range are cracks
+    "crack_area_min": 9,
+    "crack_area_max": 20,
+    # Angle in radians above which the orientation is a defect
+    "orientation_angle": 0.5,
+    # Every frame_number-th frame is inspected
+    "frame_number": 40,
+    # Size of the elliptical kernel of the morphological operations
+    "kernel_size": 5,
+    # Size of the box filter applied before finding cracks
+    "blur_size": 7,
+    # Mean gray level difference with the last inspected frame below which
+    # the belt is idle and the frame is not inspected, 0 to always inspect
+    "idle_threshold": 2.0,
+}
+
+
+class Parameters:
+    """
+    Validated, read-only set of detector parameters with the kernels
+    derived from them.
+    """
+
+    def __init__(self, values):
+        if not isinstance(values, dict):
+            raise ValueError("The parameters must be an object, not {!r}"
+                             .format(values))
+        values = dict(DEFAULT_PARAMETERS, **values)
+        unknown = set(values) - set(DEFAULT_PARAMETERS)
+        if unknown:
+            raise ValueError("Unknown parameters: {}"
+                             .format(", ".join(sorted(unknown))))
+        validate(values)
+        self.values = values
+        self.version = values["version"]
+        self.object_area_min = values["object_area_min"]
+        self.object_area_max = values["object_area_max"]
+        self.object_color_low = tuple(values["object_color_low"])
+        self.object_color_high = tuple(values["object_color_high"])
+        self.defect_color_low = tuple(values["defect_color_low"])
+        self.defect_color_high = tuple(values["defect_color_high"])
+        self.color_area_min = values["color_area_min"]
+        self.color_area_max = values["color_area_max"]
+        self.canny_low_threshold = values["canny_low_threshold"]
+        self.canny_ratio = values["canny_ratio"]
+        self.crack_area_min = values["crack_area_min"]
+        self.crack_area_max = values["crack_area_max"]
+        self.orientation_angle = values["orientation_angle"]
+        self.frame_number = values["frame_number"]
+        self.blur_size = (values["blur_size"], values["blur_size"])
+        self.idle_threshold = values["idle_threshold"]
+        # Derived caches, built here so the inspection thread never does
+        self.kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (values["kernel_size"], values["kernel_size"]))
+
+
+def validate(values):
+    """
+    Check the types and ranges of the parameters.
+
+    :param values: dictionary of parameters
+    :return: None, raises ValueError on the first invalid parameter
+    """
+    def check(condition, name):
+        if not condition:
+            raise ValueError("Invalid parameter {}: {!r}"
+                             .format(name, values[name]))
+
+    def is_int(value):
+        # JSON true and false are ints to Python
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def is_number(value):
+        return is_int(value) or isinstance(value, float)
+
+    for name in ("version", "object_area_min", "object_area_max",
+                 "color_area_min", "color_area_max", "canny_low_threshold",
+                 "crack_area_min", "crack_area_max", "frame_number",
+                 "kernel_size", "blur_size"):
+        check(is_int(values[name]) and values[name] >= 0, name)
+    for name in ("canny_ratio", "orientation_angle", "idle_threshold"):
+        check(is_number(values[name]), name)
+    for name in ("object_color_low", "object_color_high",
+                 "defect_color_low", "defect_color_high"):
+        color = values[name]
+        check(isinstance(color, (list, tuple)) and len(color) == 3 and
+              all(is_number(value) for value in color), name)
+        check(0 <= color[0] <= 179 and 0 <= color[1] <= 255 and
+              0 <= color[2] <= 255, name)
+    check(values["object_area_min"] < values["object_area_max"],
+          "object_area_max")
+    check(values["color_area_min"] < values["color_area_max"],
+          "color_area_max")
+    check(values["crack_area_min"] <= values["crack_area_max"],
+          "crack_area_max")
+    check(values["canny_ratio"] > 0, "canny_ratio")
+    check(values["frame_number"] > 0, "frame_number")
+    check(values["kernel_size"] > 0, "kernel_size")
+    check(values["blur_size"] > 0, "blur_size")
+    check(values["idle_threshold"] >= 0, "idle_threshold")
+
+
+def load_parameters(config_file):
+    """
+    Read the "parameters" block of the config file.
+
+    :param config_file: path of config.json
+    :return: Parameters
+    """
+    with open(config_file) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("{} is not a JSON object".format(config_file))
+    return Parameters(config.get("parameters", {}))
+
+
+class ParameterWatcher(threading.Thread):
+    """
+    Background thread that watches the config file and swaps in a new
+    Parameters object when the version of its "parameters" block changes.
+
+    Loading, validation and the derived kernels all happen on this thread.
+    The inspection loop only reads `current` once per frame, so a new set
+    takes effect between two frames and a frame never mixes two versions.
+    An invalid block is reported and the running parameters are kept.
+    """
+
+    def __init__(self, config_file, interval=1.0):
+        super().__init__(daemon=True)
+        self.config_file = config_file
+        self.interval = interval
+        self.current = load_parameters(config_file)
+        self._mtime = os.path.getmtime(config_file)
+        self._stopped = threading.Event()
+
+    def poll(self):
+        """
+        Reload the parameters if the config file changed.
+
+        :return: True if a new version was swapped in
+        """
+        try:
+            mtime = os.path.getmtime(self.config_file)
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            parameters = load_parameters(self.config_file)
+        except (OSError, ValueError) as error:
+            print("Parameters not reloaded: {}".format(error))
+            return False
+        if parameters.version == self.current.version:
+            return False
+        print("Parameters updated to version {}".format(parameters.version))
+        self.current = parameters
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            # Whatever is wrong with the file, keep the running parameters
+            # and keep watching for the next edit
+            try:
+                self.poll()
+            except Exception as error:
+                print("Parameters not reloaded: {!r}".format(error))
+
+    def stop(self):
+        self._stopped.set()
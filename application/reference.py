@@ -0,0 +1,228 @@
+"""Original per-object inspection of the detector, kept as a reference."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import time
+from math import atan2
+
+import cv2
+import numpy as np
+
+from inspection import add_time
+
+
+def get_orientation(contours):
+    """
+    Gives the angle of the orientation of the object in radians.
+    Step 1: Convert 3D matrix of contours to 2D.
+    Step 2: Apply PCA algorithm to find angle of the data points.
+
+    :param contours: contour of the object from the frame
+    :return: angle of orientation of the object in radians
+    """
+    size_points = len(contours)
+    # data_pts stores contour values in 2D
+    data_pts = np.empty((size_points, 2), dtype=np.float64)
+    for i in range(data_pts.shape[0]):
+        data_pts[i, 0] = contours[i, 0, 0]
+        data_pts[i, 1] = contours[i, 0, 1]
+    # Use PCA algorithm to find angle of the data points
+    mean, eigenvector = cv2.PCACompute(data_pts, mean=None)
+    angle = atan2(eigenvector[0, 1], eigenvector[0, 0])
+    return angle
+
+
+def detect_color(frame, params):
+    """
+    Identifies the color defect W.R.T the set default color of the object.
+    Step 1: Increase the brightness of the image.
+    Step 2: Convert the image to HSV Format.
+    Step 3: Threshold the image based on the color using "inRange" function.
+    Step 4: Morphological opening is done on the mask to remove noises.
+    Step 5: Find the contours on the mask image. Contours are filtered based on
+            the area to get the contours of defective area.
+
+    :param frame: copy of the input frame, brightened in place
+    :param params: detector Parameters
+    :return: color_flag, contours of the defective areas
+    """
+    color_flag = False
+    defects = []
+    size = params.values["kernel_size"]
+    # Increase the brightness of the image
+    cv2.convertScaleAbs(frame, frame, 1, 20)
+    # Convert the captured frame from BGR to HSV
+    img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    # Threshold the image
+    img_threshold = cv2.inRange(img_hsv, params.defect_color_low,
+                                params.defect_color_high)
+    # Morphological opening (remove small objects from the foreground)
+    img_threshold = cv2.erode(img_threshold,
+                              kernel=cv2.getStructuringElement(
+                                  cv2.MORPH_ELLIPSE, (size, size)))
+    img_threshold = cv2.dilate(img_threshold,
+                               kernel=cv2.getStructuringElement(
+                                   cv2.MORPH_ELLIPSE, (size, size)))
+    contours, hierarchy = cv2.findContours(img_threshold, cv2.RETR_LIST,
+                                           cv2.CHAIN_APPROX_NONE)
+    for i in range(len(contours)):
+        area = cv2.contourArea(contours[i])
+        if params.color_area_min < area < params.color_area_max:
+            defects.append(contours[i])
+            color_flag = True
+    return color_flag, defects
+
+
+def detect_crack(frame, params):
+    """
+    Identify the Crack defect on the object.
+    Step 1: Convert the image to gray scale.
+    Step 2: Blur the gray image to remove the noises.
+    Step 3: Find the edges on the blurred image to get the contours of
+            possible cracks.
+    Step 4: Filter the contours to get the contour of the crack.
+
+    :param frame: copy of the input frame
+    :param params: detector Parameters
+    :return: defect_flag, contours of the cracks
+    """
+    defect_flag = False
+    cracks = []
+    kernel_size = 3
+    # Convert the captured frame from BGR to GRAY
+    img = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    img = cv2.blur(img, params.blur_size)
+    # Find the edges
+    detected_edges = cv2.Canny(img, params.canny_low_threshold,
+                               params.canny_low_threshold * params.canny_ratio,
+                               kernel_size)
+    # Find the contours
+    contours, hierarchy = cv2.findContours(detected_edges, cv2.RETR_TREE,
+                                           cv2.CHAIN_APPROX_NONE)
+
+    if len(contours) != 0:
+        for i in range(len(contours)):
+            area = cv2.contourArea(contours[i])
+            if area > params.crack_area_max or area < params.crack_area_min:
+                cracks.append(contours[i])
+                defect_flag = True
+    return defect_flag, cracks
+
+
+def inspect_frame(frame, params, profile, lanes, crack=True, times=None):
+    """
+    Measure every object of the frame and check it for defects, exactly as
+    the detector first did: on the whole frame, without the lane masks,
+    with a copy of the frame per check and the color and crack checks done
+    again for every object.
+    Only the thresholds come from the parameters and the measures from the
+    calibration profile of the input, so this is the result
+    inspection.inspect_frame has to give, see equivalence.py.
+
+    :param frame: Input frame from the video, cropped to the lanes
+    :param params: detector Parameters
+    :param profile: CalibrationProfile of the input
+    :param lanes: Lanes of the input, only used to name the lane of objects
+    :param crack: look for cracks, False reports no crack without looking
+    :param times: dictionary the seconds of every step are added to, None
+                  not to time them
+    :return: list of per-object results, frame annotations
+    """
+    objects = []
+    annotations = {}
+    size = params.values["kernel_size"]
+    start = time.time()
+    # Convert BGR image to HSV color space
+    img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+    # Thresholding of an Image in a color range
+    img_threshold = cv2.inRange(img_hsv, params.object_color_low,
+                                params.object_color_high)
+
+    # Morphological opening(remove small objects from the foreground)
+    img_threshold = cv2.erode(img_threshold,
+                              cv2.getStructuringElement(
+                                  cv2.MORPH_ELLIPSE, (size, size)))
+    img_threshold = cv2.dilate(img_threshold,
+                               cv2.getStructuringElement(
+                                   cv2.MORPH_ELLIPSE, (size, size)))
+
+    # Morphological closing(fill small holes in the foreground)
+    img_threshold = cv2.dilate(img_threshold,
+                               cv2.getStructuringElement(
+                                   cv2.MORPH_ELLIPSE, (size, size)))
+    img_threshold = cv2.erode(img_threshold,
+                              cv2.getStructuringElement(
+                                  cv2.MORPH_ELLIPSE, (size, size)))
+
+    # Find the contours on the image
+    contours, hierarchy = cv2.findContours(img_threshold,
+                                           cv2.RETR_LIST,
+                                           cv2.CHAIN_APPROX_NONE)
+    start = add_time(times, "objects", start)
+
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if params.object_area_max > w * h > params.object_area_min:
+            # The original minAreaRect measure, on the contour corrected
+            # for the lens and perspective of the input
+            length, width = profile.measure(cnt)
+            start = add_time(times, "measure", start)
+
+            # Check for the orientation of the object
+            angle = get_orientation(cnt)
+            orientation_flag = angle >= params.orientation_angle
+            start = add_time(times, "orientation", start)
+
+            # Check for the color defect of the object
+            frame_clr = frame.copy()
+            color_flag, color_contours = detect_color(frame_clr, params)
+            annotations["Color"] = (color_flag, color_contours, frame_clr)
+            start = add_time(times, "color", start)
+
+            # Check for the crack defect of the object
+            if crack:
+                frame_crack = frame.copy()
+                annotations["Crack"] = detect_crack(frame_crack, params)
+            else:
+                annotations["Crack"] = (False, [])
+            crack_flag = annotations["Crack"][0]
+            start = add_time(times, "crack", start)
+
+            objects.append({
+                "contour": cnt,
+                "length": length,
+                "width": width,
+                "angle": angle,
+                "orientation": orientation_flag,
+                "color": color_flag,
+                "crack": crack_flag,
+                "no_defect": bool(crack) and not (orientation_flag or
+                                                  color_flag or crack_flag),
+                "lane": lanes.lane_of(cnt),
+            })
+        else:
+            start = add_time(times, "objects", start)
+    return objects, annotations
@@ -0,0 +1,205 @@
+"""Columnar buffer of per-object inspection results."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import numpy as np
+
+# Column name and dtype of every per-object result
+RESULT_COLUMNS = [
+    ("object_id", np.int64),
+    ("frame_index", np.int64),
+    ("timestamp", np.float64),
+    ("length", np.float64),
+    ("width", np.float64),
+    ("angle", np.float64),
+    ("orientation", np.uint8),
+    ("color", np.uint8),
+    ("crack", np.uint8),
+    ("no_defect", np.uint8),
+    ("param_version", np.int32),
+    ("lane", np.int16),
+    # Bit mask of the checks skipped to keep up, see shedding.py
+    ("shed", np.uint8),
+]
+
+# Defect flag columns and the field names used for them in InfluxDB
+DEFECT_FIELDS = [
+    ("orientation", "Orientation"),
+    ("color", "Color"),
+    ("crack", "Crack"),
+    ("no_defect", "No defect"),
+]
+
+CHUNK_SIZE = 1024
+
+
+class ResultBuffer:
+    """
+    Preallocated columnar store of per-object results.
+
+    Every column is a separate NumPy array. Capacity grows in chunks of
+    CHUNK_SIZE rows so appending an object never allocates per record.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, columns=RESULT_COLUMNS):
+        self.chunk_size = chunk_size
+        self.dtypes = list(columns)
+        self.columns = {name: np.zeros(chunk_size, dtype=dtype)
+                        for name, dtype in self.dtypes}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        """
+        Extend every column by one chunk.
+
+        :return: None
+        """
+        for name, dtype in self.dtypes:
+            column = np.zeros(len(self.columns[name]) + self.chunk_size,
+                              dtype=dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+    def append(self, **values):
+        """
+        Add one object record. Columns that are not given are left as zero.
+
+        :param values: column name and value of the record
+        :return: row index of the record
+        """
+        if self.size == len(self.columns["object_id"]):
+            self._grow()
+        row = self.size
+        for name, value in values.items():
+            self.columns[name][row] = value
+        self.size += 1
+        return row
+
+    def extend(self, records):
+        """
+        Add the rows of a structured array, as returned by to_records().
+
+        :param records: structured array with one field per column
+        :return: None
+        """
+        while self.size + len(records) > len(self.columns["object_id"]):
+            self._grow()
+        for name, _ in self.dtypes:
+            self.columns[name][self.size:self.size + len(records)] = \
+                records[name]
+        self.size += len(records)
+
+    def column(self, name, start=0, stop=None):
+        """
+        Return a view of the filled part of a column.
+
+        :param name: name of the column
+        :param start: first row
+        :param stop: row after the last one, defaults to the buffer size
+        :return: NumPy view of the column
+        """
+        if stop is None:
+            stop = self.size
+        return self.columns[name][start:stop]
+
+    def to_records(self, start=0, stop=None):
+        """
+        Copy rows into a NumPy structured array.
+
+        :param start: first row
+        :param stop: row after the last one, defaults to the buffer size
+        :return: structured array with one field per column
+        """
+        if stop is None:
+            stop = self.size
+        records = np.empty(stop - start, dtype=self.dtypes)
+        for name, _ in self.dtypes:
+            records[name] = self.columns[name][start:stop]
+        return records
+
+    def influx_points(self, start=0, stop=None,
+                      measurement="obj_flaw_detector", lane_names=None):
+        """
+        Build the InfluxDB points of a range of rows, one point per object.
+
+        :param start: first row
+        :param stop: row after the last one, defaults to the buffer size
+        :param measurement: name of the measurement
+        :param lane_names: names of the lanes, used to tag each point with
+                           the lane of its object
+        :return: list of JSON bodies for write_points
+        """
+        if stop is None:
+            stop = self.size
+        object_ids = self.column("object_id", start, stop).tolist()
+        timestamps = self.column("timestamp", start, stop).tolist()
+        versions = self.column("param_version", start, stop).tolist()
+        lanes = self.column("lane", start, stop).tolist()
+        shed = self.column("shed", start, stop).tolist()
+        flags = [self.column(name, start, stop).tolist()
+                 for name, _ in DEFECT_FIELDS]
+        points = []
+        for i in range(stop - start):
+            fields = {"Object Number": object_ids[i], "Shed": shed[i]}
+            for (_, field), values in zip(DEFECT_FIELDS, flags):
+                fields[field] = values[i]
+            tags = {
+                "user": "User",
+                "param_version": versions[i]
+            }
+            if lane_names:
+                tags["lane"] = lane_names[lanes[i]]
+            points.append({
+                "measurement": measurement,
+                "tags": tags,
+                "time": int(timestamps[i] * 1e6),
+                "fields": fields
+            })
+        return points
+
+    def save_npy(self, path):
+        """
+        Save all rows as a structured array in a .npy file.
+
+        :param path: path of the .npy file
+        :return: None
+        """
+        np.save(path, self.to_records())
+
+    def save_csv(self, path):
+        """
+        Save all rows as a CSV file with a header line.
+
+        :param path: path of the CSV file
+        :return: None
+        """
+        records = self.to_records()
+        fmt = ["%.6f" if np.dtype(dtype).kind == "f" else "%d"
+               for _, dtype in self.dtypes]
+        np.savetxt(path, records, fmt=fmt, delimiter=",", comments="",
+                   header=",".join(name for name, _ in self.dtypes))
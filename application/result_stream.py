@@ -0,0 +1,525 @@
+"""Local stream of the per-object results to subscribed programs."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import os
+import socket
+import struct
+import threading
+import time
+from argparse import ArgumentParser
+from collections import deque
+
+import numpy as np
+
+from result_buffer import DEFECT_FIELDS, ResultBuffer
+from shedding import SHED_CROPS
+
+# Sent to every subscriber before the records: magic, protocol version
+# and size of a record in bytes
+HEADER = struct.Struct("<4sHH")
+MAGIC = b"OFDR"
+VERSION = 1
+
+# Record of one object, little-endian without padding. The flags and
+# crops bits follow DEFECT_FIELDS: orientation, color, crack, no defect.
+# A crops bit tells that the image of the object was saved in the folder
+# of that flag, see crop_path() of inspection.py.
+RECORD = np.dtype([
+    ("object_id", "<u8"),
+    ("frame_index", "<i8"),
+    # Microseconds since the epoch, as sent to InfluxDB
+    ("timestamp", "<i8"),
+    ("length", "<f4"),
+    ("width", "<f4"),
+    ("angle", "<f4"),
+    ("param_version", "<i4"),
+    ("lane", "<i2"),
+    ("flags", "u1"),
+    ("crops", "u1"),
+    ("shed", "u1"),
+])
+# Same layout, to pack one record without NumPy
+RECORD_STRUCT = struct.Struct("<QqqfffihBBB")
+
+# What a subscriber whose queue is full loses: its oldest records, the new
+# records, or its connection
+POLICIES = ["drop_oldest", "drop_newest", "disconnect"]
+
+
+def encode_results(results, start, stop=None):
+    """
+    Encode rows of a result buffer as stream records.
+
+    :param results: ResultBuffer
+    :param start: first row
+    :param stop: row after the last one, defaults to the row after start
+    :return: bytes of the records
+    """
+    if stop is None:
+        stop = start + 1
+    columns = [results.column(name, start, stop).tolist() for name in
+               ("object_id", "frame_index", "timestamp", "length", "width",
+                "angle", "param_version", "lane", "shed")]
+    flags = [results.column(name, start, stop).tolist()
+             for name, _ in DEFECT_FIELDS]
+    records = []
+    for i in range(stop - start):
+        (object_id, frame_index, timestamp, length, width, angle, version,
+         lane, shed) = (column[i] for column in columns)
+        mask = 0
+        for bit, values in enumerate(flags):
+            mask |= values[i] << bit
+        # The images of an object are saved unless they were shed
+        crops = 0 if shed & SHED_CROPS else mask
+        records.append(RECORD_STRUCT.pack(
+            object_id, frame_index, int(timestamp * 1e6), length, width,
+            angle, version, lane, mask, crops, shed))
+    return b"".join(records)
+
+
+def parse_address(address):
+    """
+    Return the socket family and address of a stream.
+
+    :param address: port number, or path of a Unix socket
+    :return: socket family, address for bind and connect
+    """
+    if str(address).isdigit():
+        return socket.AF_INET, ("127.0.0.1", int(address))
+    return socket.AF_UNIX, address
+
+
+class Subscriber:
+    """
+    Connection of one subscribed program with its own bounded queue.
+
+    Records are queued by offer(), which never waits for the connection,
+    and sent by the thread of the subscriber in as few writes as possible.
+    When the queue is full, the policy of the subscriber decides what is
+    lost, so a slow subscriber never slows down the inspection or the
+    other subscribers.
+    """
+
+    def __init__(self, connection, policy, size):
+        self.connection = connection
+        self.policy = policy
+        self.size = size
+        self.sent = 0
+        self.dropped = 0
+        self.queue = deque()
+        self.closed = False
+        self._finishing = False
+        self._condition = threading.Condition()
+
+    def offer(self, record):
+        """
+        Queue a record for the subscriber.
+
+        :param record: bytes of one record
+        :return: None
+        """
+        with self._condition:
+            if self.closed:
+                return
+            if len(self.queue) >= self.size:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                if self.policy == "disconnect":
+                    self.dropped += len(self.queue) + 1
+                    self.queue.clear()
+                    self.closed = True
+                    self._condition.notify()
+                    # Wakes the thread up if it is stuck sending
+                    try:
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    return
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(record)
+            self._condition.notify()
+
+    def run(self):
+        """
+        Send the queued records until the subscriber is closed.
+
+        :return: None
+        """
+        try:
+            while True:
+                with self._condition:
+                    while not self.queue and not self.closed and \
+                            not self._finishing:
+                        self._condition.wait()
+                    if self.closed or not self.queue:
+                        break
+                    records = b"".join(self.queue)
+                    count = len(self.queue)
+                    self.queue.clear()
+                self.connection.sendall(records)
+                self.sent += count
+        except OSError:
+            pass
+        finally:
+            with self._condition:
+                self.closed = True
+                self.dropped += len(self.queue)
+                self.queue.clear()
+            self.connection.close()
+
+    def finish(self):
+        """
+        Send the queued records, then close the connection.
+
+        :return: None
+        """
+        with self._condition:
+            self._finishing = True
+            self._condition.notify()
+
+
+class ResultStream:
+    """
+    Publish/subscribe stream of the per-object results on a local socket.
+
+    A subscriber connects, sends one line with its policy and queue size,
+    for example "drop_oldest 1024", or an empty line for the defaults of
+    the stream, and then receives HEADER followed by RECORD after RECORD,
+    one per object, as soon as the object is measured. The object numbers
+    follow each other, so a subscriber sees the records it lost as a gap.
+    """
+
+    def __init__(self, address, policy="drop_oldest", size=1024):
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy {}".format(policy))
+        self.policy = policy
+        self.size = size
+        self.subscribers = []
+        # Totals of the subscribers that are gone
+        self._subscribed = 0
+        self._sent = 0
+        self._dropped = 0
+        self._running = True
+        self._lock = threading.Lock()
+        family, self.address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen()
+        self.server.settimeout(0.5)
+        # Threads of the connected subscribers, removed when they end
+        self._threads = set()
+        self._acceptor = threading.Thread(target=self._accept, daemon=True)
+        self._acceptor.start()
+
+    def publish(self, record):
+        """
+        Offer an encoded record to every subscriber. Never blocks on a
+        connection.
+
+        :param record: bytes of a record, see encode_results()
+        :return: None
+        """
+        with self._lock:
+            subscribers = self.subscribers
+        for subscriber in subscribers:
+            subscriber.offer(record)
+
+    def _accept(self):
+        """
+        Accept the subscribers until the stream is closed.
+
+        :return: None
+        """
+        while self._running:
+            try:
+                connection, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            thread = threading.Thread(target=self._subscribe,
+                                      args=(connection,), daemon=True)
+            with self._lock:
+                self._threads.add(thread)
+            thread.start()
+
+    def _subscribe(self, connection):
+        """
+        Serve a new subscriber, and forget it and its thread once it is
+        gone, so a stream running for weeks does not grow.
+
+        :param connection: accepted socket
+        :return: None
+        """
+        try:
+            self._serve(connection)
+        finally:
+            with self._lock:
+                self._threads.discard(threading.current_thread())
+
+    def _serve(self, connection):
+        """
+        Read the request line of a new subscriber and send it the records
+        until it is closed.
+
+        :param connection: accepted socket
+        :return: None
+        """
+        try:
+            connection.settimeout(5)
+            line = b""
+            while not line.endswith(b"\n") and len(line) < 64:
+                data = connection.recv(64 - len(line))
+                if not data:
+                    break
+                line += data
+            words = line.decode().split()
+            policy = words[0] if words else self.policy
+            size = int(words[1]) if len(words) > 1 else self.size
+            if policy not in POLICIES or size < 1:
+                raise ValueError(line)
+            connection.settimeout(None)
+            # A send buffer the size of the queue, so the records wait in
+            # the queue where the policy applies, not in the system
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                                  size * RECORD.itemsize)
+            if connection.family == socket.AF_INET:
+                connection.setsockopt(socket.IPPROTO_TCP,
+                                      socket.TCP_NODELAY, 1)
+            connection.sendall(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+        except (OSError, ValueError, UnicodeDecodeError):
+            connection.close()
+            return
+        subscriber = Subscriber(connection, policy, size)
+        with self._lock:
+            if not self._running:
+                connection.close()
+                return
+            # Replaced, not changed, so publish() can iterate without lock
+            self.subscribers = self.subscribers + [subscriber]
+            self._subscribed += 1
+        subscriber.run()
+        with self._lock:
+            self.subscribers = [other for other in self.subscribers
+                                if other is not subscriber]
+            self._sent += subscriber.sent
+            self._dropped += subscriber.dropped
+
+    def stats(self):
+        """
+        Return the records sent to and dropped for the subscribers.
+
+        :return: number of subscribers since the start, records sent,
+                 records dropped
+        """
+        with self._lock:
+            return (self._subscribed,
+                    self._sent + sum(s.sent for s in self.subscribers),
+                    self._dropped + sum(s.dropped for s in self.subscribers))
+
+    def close(self):
+        """
+        Send the queued records and stop the stream.
+
+        :return: None
+        """
+        with self._lock:
+            self._running = False
+            subscribers = self.subscribers
+            threads = list(self._threads)
+        for subscriber in subscribers:
+            subscriber.finish()
+        for thread in [self._acceptor] + threads:
+            thread.join(timeout=1.0)
+        self.server.close()
+        if self.server.family == socket.AF_UNIX and \
+                os.path.exists(self.address):
+            os.remove(self.address)
+
+
+def subscribe(address, policy="", size=None):
+    """
+    Connect to a result stream and yield the records as they arrive.
+
+    :param address: port number, or path of a Unix socket
+    :param policy: policy of the subscriber, empty for the stream default
+    :param size: queue size of the subscriber, None for the stream default
+    :return: generator of structured arrays of RECORD
+    """
+    family, address = parse_address(address)
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    if size:
+        # Records beyond the queue wait in the stream, not in the system
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                              size * RECORD.itemsize)
+    connection.connect(address)
+    request = policy if size is None else "{} {}".format(
+        policy or "drop_oldest", size)
+    connection.sendall(request.encode() + b"\n")
+    stream = connection.makefile("rb")
+    magic, version, itemsize = HEADER.unpack(stream.read(HEADER.size))
+    if magic != MAGIC or itemsize != RECORD.itemsize:
+        raise ValueError("Not a result stream of version {}".format(VERSION))
+    try:
+        while True:
+            data = stream.read1(64 * RECORD.itemsize)
+            while len(data) % RECORD.itemsize:
+                more = stream.read(RECORD.itemsize -
+                                   len(data) % RECORD.itemsize)
+                if not more:
+                    return
+                data += more
+            if not data:
+                return
+            yield np.frombuffer(data, dtype=RECORD)
+    finally:
+        connection.close()
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Print the results of a running "
+                            "detector, or measure the stream with -b")
+    parser.add_argument("-s", "--stream",
+                        default="8091",
+                        help="Port, or path of the Unix socket, of the stream")
+    parser.add_argument("-p", "--policy",
+                        default="",
+                        help="Policy when the queue is full: drop_oldest, "
+                        "drop_newest or disconnect. Defaults to the one of "
+                        "the stream")
+    parser.add_argument("-q", "--queue",
+                        type=int,
+                        default=None,
+                        help="Size of the queue in records")
+    parser.add_argument("-b", "--benchmark",
+                        action="store_true",
+                        help="Publish synthetic results to a fast and a slow "
+                        "subscriber of each policy and print the publish "
+                        "time, latency and drops")
+    parser.add_argument("-n", "--objects",
+                        type=int,
+                        default=5000,
+                        help="Number of results of the benchmark")
+    parser.add_argument("-r", "--rate",
+                        type=float,
+                        default=1000,
+                        help="Results per second of the benchmark")
+    return parser
+
+
+def benchmark(address, objects, rate):
+    """
+    Publish synthetic results at a given rate to one fast subscriber and a
+    slow one of every policy, then print the time publish() took, the
+    latency of the fast subscriber and what the slow ones lost.
+
+    :param address: port number, or path of a Unix socket
+    :param objects: number of results
+    :param rate: results per second
+    :return: None
+    """
+    stream = ResultStream(address)
+    latencies = []
+    received = {}
+
+    def read(name, policy, delay):
+        count = 0
+        for records in subscribe(address, policy, 256):
+            if not delay:
+                now = time.time() * 1e6
+                latencies.extend(now - records["timestamp"])
+            count += len(records)
+            received[name] = count
+            time.sleep(delay * len(records))
+
+    readers = [("fast", "drop_oldest", 0)] + [
+        ("slow " + policy, policy, 10.0 / rate) for policy in POLICIES]
+    for name, policy, delay in readers:
+        threading.Thread(target=read, args=(name, policy, delay),
+                         daemon=True).start()
+    while len(stream.subscribers) < len(readers):
+        time.sleep(0.01)
+
+    results = ResultBuffer()
+    publish_times = []
+    start = time.time()
+    for i in range(objects):
+        row = results.append(object_id=i + 1, frame_index=i * 40,
+                             timestamp=time.time(), length=50, width=20,
+                             no_defect=1)
+        begin = time.perf_counter()
+        stream.publish(encode_results(results, row))
+        publish_times.append(time.perf_counter() - begin)
+        time.sleep(max(start + (i + 1) / rate - time.time(), 0))
+    time.sleep(0.5)
+    count, sent, dropped = stream.stats()
+    stream.close()
+
+    publish_times = np.array(publish_times) * 1e6
+    latencies = np.array(latencies) / 1000
+    print("{} results at {:.0f}/s, {} bytes each".format(
+        objects, rate, RECORD.itemsize))
+    print("  encode and publish: {:.1f} us median, {:.1f} us p99".format(
+        np.percentile(publish_times, 50), np.percentile(publish_times, 99)))
+    print("  fast subscriber: {} received, latency {:.2f} ms median, "
+          "{:.2f} ms p99".format(received.get("fast", 0),
+                                 np.percentile(latencies, 50),
+                                 np.percentile(latencies, 99)))
+    print("  slow subscribers, reading {:.0f} results/s:".format(rate / 10))
+    for name, policy, delay in readers[1:]:
+        print("    {:<12} {:>6} received".format(policy,
+                                                 received.get(name, 0)))
+    print("  {} results sent and {} dropped over {} subscribers".format(
+        sent, dropped, count))
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    if args.benchmark:
+        benchmark(args.stream, args.objects, args.rate)
+    else:
+        names = [name for name, _ in DEFECT_FIELDS]
+        for records in subscribe(args.stream, args.policy, args.queue):
+            for record in records:
+                flags = [name for bit, name in enumerate(names)
+                         if record["flags"] >> bit & 1]
+                print("Object {} of frame {}: {:.2f} x {:.2f} mm, angle "
+                      "{:.3f}, lane {}, {}, latency {:.1f} ms".format(
+                          record["object_id"], record["frame_index"],
+                          record["length"], record["width"],
+                          record["angle"], record["lane"], " ".join(flags),
+                          time.time() * 1000 - record["timestamp"] / 1000))
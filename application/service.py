@@ -0,0 +1,545 @@
+"""Local HTTP service inspecting images sent by other capture software."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import asyncio
+import io
+import json
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+from calibration import load_profile
+from inspection import inspect_frame, object_defects
+from lanes import load_lanes
+from parameters import ParameterWatcher
+
+CONFIG_FILE = '../resources/config.json'
+CALIBRATION_CACHE = '../resources/calibration'
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024 * 1024
+# Content type of raw arrays, saved with numpy.save
+NPY_TYPE = "application/x-npy"
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 411: "Length Required",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Inspect images posted over HTTP, "
+                            "or load test a running service")
+    parser.add_argument("-p", "--port",
+                        type=int,
+                        default=8090,
+                        help="Port of the service")
+    parser.add_argument("--host",
+                        default="127.0.0.1",
+                        help="Address the service listens on")
+    parser.add_argument("-i", "--input",
+                        type=int,
+                        default=None,
+                        help="Index of the input in config.json whose lanes "
+                        "and calibration apply to the posted images")
+    parser.add_argument("-b", "--max_batch",
+                        type=int,
+                        default=8,
+                        help="Largest number of images inspected in one "
+                        "batch")
+    parser.add_argument("-mw", "--max_wait",
+                        type=float,
+                        default=0,
+                        help="Longest time in milliseconds the first image "
+                        "of a batch waits for others, 0 to only batch the "
+                        "images that arrived while the last batch ran")
+    parser.add_argument("-t", "--decode_threads",
+                        type=int,
+                        default=4,
+                        help="Number of threads decoding the images")
+    parser.add_argument("-it", "--inspect_threads",
+                        type=int,
+                        default=None,
+                        help="Number of threads inspecting the images of a "
+                        "batch, one per core by default")
+    parser.add_argument("-l", "--load_test",
+                        default=None,
+                        help="Image or .npy file to post to a running "
+                        "service instead of serving")
+    parser.add_argument("-c", "--concurrency",
+                        type=int,
+                        default=16,
+                        help="Number of connections of the load test")
+    parser.add_argument("-n", "--requests",
+                        type=int,
+                        default=1000,
+                        help="Number of requests of the load test")
+    return parser
+
+
+class HTTPError(ValueError):
+    """
+    Request the service cannot read, answered with `status`.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def body_length(method, headers):
+    """
+    Return the length of the body of a request.
+
+    :param method: HTTP method of the request
+    :param headers: headers of the request, with lower case names
+    :return: length of the body in bytes, raises HTTPError if it is
+             missing, invalid, too large or chunked
+    """
+    if "transfer-encoding" in headers:
+        raise HTTPError(411, "Chunked bodies are not supported, send a "
+                        "Content-Length")
+    if "content-length" not in headers:
+        if method == "POST":
+            raise HTTPError(411, "Content-Length required")
+        return 0
+    try:
+        length = int(headers["content-length"])
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length {!r}"
+                        .format(headers["content-length"]))
+    if length > MAX_BODY:
+        raise HTTPError(413, "Body too large")
+    return length
+
+
+async def read_head(reader):
+    """
+    Read the request line and headers of a request.
+
+    :param reader: StreamReader of the connection
+    :return: method, target, headers with lower case names, None if the
+             connection was closed, raises HTTPError if they are malformed
+    """
+    try:
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        # Also raised by readline for a line over the limit of the reader
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        try:
+            header = await reader.readline()
+        except ValueError:
+            raise HTTPError(400, "Header too long")
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, colon, value = header.decode("latin-1").partition(":")
+        if not colon:
+            raise HTTPError(400, "Malformed header")
+        headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def decode(body, content_type):
+    """
+    Decode the body of a request into a BGR frame.
+
+    :param body: encoded image, or array saved with numpy.save
+    :param content_type: content type of the body
+    :return: BGR frame
+    """
+    if content_type == NPY_TYPE:
+        frame = np.load(io.BytesIO(body), allow_pickle=False)
+        if frame.dtype != np.uint8 or frame.ndim not in (2, 3):
+            raise ValueError("Expected a uint8 image array, got {} {}"
+                             .format(frame.dtype, frame.shape))
+    else:
+        frame = cv2.imdecode(np.frombuffer(body, dtype=np.uint8),
+                             cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Cannot decode the image")
+    if frame.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    if frame.shape[2] != 3:
+        raise ValueError("Expected 3 channels, got {}".format(frame.shape[2]))
+    return frame
+
+
+class Inspector:
+    """
+    Inspection of the posted frames, batch by batch.
+
+    Lanes and calibration profiles depend on the frame size and are built
+    once per size. The parameters are read once per batch, so all frames of
+    a batch are inspected with the same version. The frames of a batch are
+    inspected in parallel, OpenCV releases the GIL.
+    """
+
+    def __init__(self, config_file, item=None, one_pixel_length=0.0264583333,
+                 threads=None):
+        self.item = item or {}
+        self.one_pixel_length = one_pixel_length
+        self.watcher = ParameterWatcher(config_file)
+        self.watcher.start()
+        self.sizes = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+
+    def _setup(self, frame_size):
+        """
+        Return the lanes and profile of a frame size.
+
+        :param frame_size: width and height of the frame
+        :return: Lanes, CalibrationProfile
+        """
+        with self._lock:
+            if frame_size not in self.sizes:
+                lanes = load_lanes(self.item, frame_size)
+                profile = load_profile(self.item, frame_size,
+                                       self.one_pixel_length,
+                                       CALIBRATION_CACHE, lanes.origin)
+                self.sizes[frame_size] = lanes, profile
+            return self.sizes[frame_size]
+
+    def inspect(self, frame, params):
+        """
+        Inspect one frame.
+
+        :param frame: BGR frame
+        :param params: detector Parameters
+        :return: JSON-ready result of the frame
+        """
+        height, width = frame.shape[:2]
+        lanes, profile = self._setup((width, height))
+        # The buffer of the lanes is shared, every thread crops to its own
+        crop = None if lanes.mask is None else \
+            np.empty((lanes.size[1], lanes.size[0], 3), dtype=np.uint8)
+        objects, annotations = inspect_frame(lanes.apply(frame, crop),
+                                             params, profile, lanes)
+        x0, y0 = lanes.origin
+        return {
+            "width": width,
+            "height": height,
+            "param_version": params.version,
+            "objects": [{
+                # Bounding box in the posted image, x, y, width, height
+                "box": [value + offset for value, offset in zip(
+                    cv2.boundingRect(obj["contour"]), (x0, y0, 0, 0))],
+                "length": float(obj["length"]),
+                "width": float(obj["width"]),
+                "angle": float(obj["angle"]),
+                "orientation": bool(obj["orientation"]),
+                "color": bool(obj["color"]),
+                "crack": bool(obj["crack"]),
+                "no_defect": bool(obj["no_defect"]),
+                "defects": object_defects(obj),
+                "lane": lanes.names[obj["lane"]],
+            } for obj in objects],
+        }
+
+    def inspect_batch(self, frames):
+        """
+        Inspect a batch of frames with one set of parameters.
+
+        :param frames: list of BGR frames
+        :return: list of results, or of the exception raised by a frame
+        """
+        params = self.watcher.current
+
+        def inspect(frame):
+            try:
+                return self.inspect(frame, params)
+            except Exception as error:
+                return error
+
+        return list(self._executor.map(inspect, frames))
+
+
+class MicroBatcher:
+    """
+    Groups the frames of concurrent requests into batches.
+
+    A batch takes the frames queued when it starts, and the first frame
+    waits at most `max_wait` seconds for others to join. One batch is
+    inspected at a time, and the frames that arrive meanwhile form the next
+    batch, so batches grow with the load while a lone request does not
+    wait at all by default.
+    """
+
+    def __init__(self, process, max_batch=8, max_wait=0.0):
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.frames = 0
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, frame):
+        """
+        Queue a frame and wait for its result.
+
+        :param frame: BGR frame
+        :return: result of the frame
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((frame, future))
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+            frames = [frame for frame, future in batch]
+            try:
+                results = await loop.run_in_executor(self._executor,
+                                                     self.process, frames)
+            except Exception as error:
+                results = [error] * len(batch)
+            self.batches += 1
+            self.frames += len(batch)
+            for (frame, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class InspectionService:
+    """
+    Minimal HTTP/1.1 server with keep-alive.
+
+    POST /inspect with an encoded image (any format cv2.imdecode reads) or
+    an array saved with numpy.save and the content type application/x-npy.
+    The reply is the JSON result of the image. GET /stats gives the number
+    of requests and batches.
+    """
+
+    def __init__(self, inspector, max_batch, max_wait, decode_threads):
+        self.inspector = inspector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.decoder = ThreadPoolExecutor(max_workers=decode_threads)
+        self.requests = 0
+        self.batcher = None
+
+    async def serve(self, host, port):
+        """
+        Serve until cancelled.
+
+        :param host: address to listen on
+        :param port: port to listen on
+        :return: None
+        """
+        self.batcher = MicroBatcher(self.inspector.inspect_batch,
+                                    self.max_batch, self.max_wait)
+        server = await asyncio.start_server(self._connection, host, port)
+        print("Inspection service on http://{}:{}/inspect".format(host, port))
+        async with server:
+            await server.serve_forever()
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await read_head(reader)
+                    if head is None:
+                        break
+                    method, target, headers = head
+                    length = body_length(method, headers)
+                except HTTPError as error:
+                    # The rest of the connection cannot be parsed
+                    await self._reply(writer, error.status,
+                                      {"error": str(error)}, close=True)
+                    break
+                if headers.get("expect", "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    await writer.drain()
+                body = await reader.readexactly(length)
+                status, payload = await self._dispatch(method, target,
+                                                       headers, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._reply(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, headers, body):
+        """
+        Answer one request.
+
+        :return: HTTP status, JSON-ready payload
+        """
+        path = urlsplit(target).path
+        if path == "/stats":
+            return 200, {"requests": self.requests,
+                         "batches": self.batcher.batches,
+                         "frames": self.batcher.frames}
+        if path != "/inspect":
+            return 404, {"error": "Unknown path {}".format(path)}
+        if method != "POST":
+            return 405, {"error": "Use POST"}
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        try:
+            frame = await loop.run_in_executor(self.decoder, decode, body,
+                                               content_type)
+        except Exception as error:
+            # Whatever numpy or OpenCV raise on a malformed body
+            return 400, {"error": "Cannot decode the body: {}"
+                         .format(error)}
+        try:
+            return 200, await self.batcher.submit(frame)
+        except Exception as error:
+            return 500, {"error": str(error)}
+
+    async def _reply(self, writer, status, payload, close=False):
+        body = json.dumps(payload).encode()
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+                     "Content-Length: {}\r\nConnection: {}\r\n\r\n"
+                     .format(status, REASONS[status], len(body),
+                             "close" if close else "keep-alive").encode())
+        writer.write(body)
+        await writer.drain()
+
+
+async def post(reader, writer, host, body, content_type):
+    """
+    Post one image on an open connection.
+
+    :return: HTTP status of the reply
+    """
+    writer.write("POST /inspect HTTP/1.1\r\nHost: {}\r\nContent-Type: {}\r\n"
+                 "Content-Length: {}\r\n\r\n"
+                 .format(host, content_type, len(body)).encode())
+    writer.write(body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b""):
+            break
+        name, value = header.decode("latin-1").split(":", 1)
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def load_test(host, port, path, concurrency, requests):
+    """
+    Post an image `requests` times over `concurrency` keep-alive
+    connections and print the request rate and latency percentiles.
+
+    :param host: address of the service
+    :param port: port of the service
+    :param path: image or .npy file to post
+    :param concurrency: number of connections
+    :param requests: number of requests
+    :return: None
+    """
+    with open(path, "rb") as f:
+        body = f.read()
+    content_type = NPY_TYPE if path.endswith(".npy") else \
+        "application/octet-stream"
+    latencies = []
+    errors = 0
+    remaining = [requests]
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            status = await post(reader, writer, host, body, content_type)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    milliseconds = np.array(latencies) * 1000
+    print("{} requests, {} errors, {:.1f} requests/s".format(
+        len(latencies), errors, len(latencies) / elapsed))
+    print("Latency (ms): p50 {:.1f}, p90 {:.1f}, p99 {:.1f}, max {:.1f}"
+          .format(*np.percentile(milliseconds, [50, 90, 99, 100])))
+
+
+async def main(args):
+    with open(CONFIG_FILE) as f:
+        config = json.load(f)
+    item = config['inputs'][args.input] if args.input is not None else None
+    inspector = Inspector(CONFIG_FILE, item, threads=args.inspect_threads)
+    service = InspectionService(inspector, args.max_batch,
+                                args.max_wait / 1000.0, args.decode_threads)
+    await service.serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    try:
+        if args.load_test:
+            asyncio.run(load_test(args.host, args.port, args.load_test,
+                                  args.concurrency, args.requests))
+        else:
+            asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,179 @@
+"""Graceful degradation of the inspection when it falls behind."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+# Bits of the "shed" column of the results, one per action
+SHED_CRACK = 1
+SHED_CROPS = 2
+SHED_DISPLAY = 4
+SHED_FRAMES = 8
+
+# Actions in the order they are taken as the inspection falls further
+# behind, the cheapest loss first
+TIERS = [
+    (SHED_CRACK, "crack"),
+    (SHED_CROPS, "crops"),
+    (SHED_DISPLAY, "display"),
+    (SHED_FRAMES, "frames"),
+]
+
+
+class LoadShedder:
+    """
+    Per-frame latency budget of the inspection with degradation tiers.
+
+    Every inspected frame that takes longer than the budget raises the
+    tier by one, up to dropping frames. The tier goes down by one after
+    `recover_frames` inspected frames in a row took less than
+    `recover_ratio` times the budget, so a burst is absorbed without the
+    tier flapping. Every shed action is counted, and the actions of a
+    frame are kept as a bit mask for its results.
+    """
+
+    def __init__(self, budget, recover_frames=5, recover_ratio=0.5,
+                 display_every=5):
+        # Budget in seconds, 0 never sheds anything
+        self.budget = budget
+        self.recover_frames = recover_frames
+        self.recover_ratio = recover_ratio
+        # Number of frames between two shown frames while the display is shed
+        self.display_every = display_every
+        self.level = 0
+        self.counts = {name: 0 for _, name in TIERS}
+        self._fast = 0
+        self._due = 0
+
+    @property
+    def actions(self):
+        """
+        Bit mask of the actions of the current tier.
+
+        :return: mask of SHED_* bits
+        """
+        mask = 0
+        for action, _ in TIERS[:self.level]:
+            mask |= action
+        return mask
+
+    def sheds(self, action):
+        """
+        Tell if an action is shed at the current tier.
+
+        :param action: SHED_* bit
+        :return: True if the action is shed
+        """
+        return bool(self.actions & action)
+
+    def count(self, action, number=1):
+        """
+        Count shed actions.
+
+        :param action: SHED_* bit
+        :param number: number of times the action was shed
+        :return: None
+        """
+        for bit, name in TIERS:
+            if bit == action:
+                self.counts[name] += number
+
+    def drop_frame(self):
+        """
+        Tell if a frame due for inspection is dropped. Every other due
+        frame is dropped while frames are shed.
+
+        :return: True if the frame is not inspected
+        """
+        if not self.sheds(SHED_FRAMES):
+            return False
+        self._due += 1
+        if self._due % 2:
+            self.count(SHED_FRAMES)
+            return True
+        return False
+
+    def show_frame(self, frame_count):
+        """
+        Tell if a frame is shown, only one every `display_every` frames
+        while the display is shed.
+
+        :param frame_count: number of the frame
+        :return: True if the frame is shown
+        """
+        if not self.sheds(SHED_DISPLAY) or \
+                frame_count % self.display_every == 0:
+            return True
+        self.count(SHED_DISPLAY)
+        return False
+
+    def update(self, latency):
+        """
+        Move the tier according to the latency of an inspected frame.
+
+        :param latency: time the inspection of the frame took in seconds
+        :return: True if the tier changed
+        """
+        if not self.budget:
+            return False
+        level = self.level
+        if latency > self.budget:
+            self._fast = 0
+            self.level = min(self.level + 1, len(TIERS))
+        elif latency < self.budget * self.recover_ratio:
+            self._fast += 1
+            if self._fast >= self.recover_frames and self.level:
+                self._fast = 0
+                self.level -= 1
+        else:
+            self._fast = 0
+        return self.level != level
+
+    def describe(self):
+        """
+        Return the shed actions of the current tier.
+
+        :return: names of the actions, separated by spaces
+        """
+        return " ".join(name for _, name in TIERS[:self.level]) or "none"
+
+    def state(self):
+        """
+        Return the tier and counts, for a checkpoint.
+
+        :return: JSON-serializable dictionary
+        """
+        return {"level": self.level, "counts": dict(self.counts),
+                "fast": self._fast, "due": self._due}
+
+    def restore(self, state):
+        """
+        Restore the state saved by state().
+
+        :param state: dictionary returned by state()
+        :return: None
+        """
+        self.level = state["level"]
+        self.counts.update(state["counts"])
+        self._fast = state["fast"]
+        self._due = state["due"]
@@ -0,0 +1,501 @@
+"""Soak test of the inspection pipeline, watching memory and latency drift."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import contextlib
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from calibration import load_profile
+from fanout import open_capture
+from inspection import DEFECTS
+from lanes import load_lanes
+from motion import IdleDetector
+from parameters import ParameterWatcher, Parameters
+from result_buffer import ResultBuffer
+from shedding import LoadShedder
+
+CONFIG_FILE = '../resources/config.json'
+DIR_NAMES = ["crack", "color", "orientation", "no_defect"]
+SAMPLE_FIELDS = ["elapsed", "frames", "objects", "rss_mb", "results_mb",
+                 "fds", "traced_mb", "crop_files", "p50_ms", "p99_ms",
+                 "max_ms"]
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Run the inspection loop of the "
+                            "detector as fast as possible for a long time "
+                            "and fail on memory, file descriptor, saved "
+                            "image or latency drift")
+    parser.add_argument("-c", "--config",
+                        default=CONFIG_FILE,
+                        help="Path of config.json")
+    parser.add_argument("-i", "--input",
+                        type=int,
+                        default=0,
+                        help="Index of the input in config.json, looped "
+                        "until the end of the test")
+    parser.add_argument("-s", "--synthetic",
+                        default=None,
+                        help="Use generated frames of this size, "
+                        "WIDTHxHEIGHT, instead of the input")
+    parser.add_argument("-e", "--every",
+                        type=int,
+                        default=0,
+                        help="Inspect every n-th frame, 0 for the "
+                        "frame_number parameter")
+    parser.add_argument("-t", "--duration",
+                        type=float,
+                        default=3600,
+                        help="Length of the test in seconds")
+    parser.add_argument("-si", "--interval",
+                        type=float,
+                        default=10,
+                        help="Time between two samples in seconds")
+    parser.add_argument("-wu", "--warmup",
+                        type=float,
+                        default=60,
+                        help="Time in seconds before the reference sample, "
+                        "to let caches and buffers settle")
+    parser.add_argument("-dir", "--directory",
+                        default=None,
+                        help="Directory of the saved images, a temporary "
+                        "directory removed at the end by default")
+    parser.add_argument("--influx",
+                        action="store_true",
+                        help="Also send the results to InfluxDB with the "
+                        "update_data() of the detector")
+    parser.add_argument("-o", "--output",
+                        default=None,
+                        help="Path of a .csv file to which the samples are "
+                        "saved")
+    parser.add_argument("--top",
+                        type=int,
+                        default=10,
+                        help="Number of allocation sites reported by "
+                        "tracemalloc, 0 to disable tracemalloc")
+    parser.add_argument("--max_rss_growth",
+                        type=float,
+                        default=10,
+                        help="Largest RSS growth after the warm up, in MB "
+                        "per hour")
+    parser.add_argument("--max_fd_growth",
+                        type=int,
+                        default=2,
+                        help="Largest number of file descriptors opened "
+                        "after the warm up")
+    parser.add_argument("--max_crop_files",
+                        type=int,
+                        default=1000000,
+                        help="Largest number of saved images at the end")
+    parser.add_argument("-v", "--verbose",
+                        action="store_true",
+                        help="Print the output of the detector")
+    parser.add_argument("--max_latency_drift",
+                        type=float,
+                        default=1.5,
+                        help="Largest ratio between the p99 latency at the "
+                        "end and after the warm up")
+    return parser
+
+
+class SyntheticCapture:
+    """
+    Endless frame source of objects moving along the belt, with the
+    cv2.VideoCapture methods used by the detector. Every third object is
+    rotated, so both defective and good objects are inspected.
+    """
+
+    def __init__(self, width, height, speed=8):
+        self.width = width
+        self.height = height
+        self.speed = speed
+        self.position = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        for lane in range(2):
+            x = (self.position * self.speed + lane * self.width // 2) % \
+                (self.width + 200) - 200
+            y = self.height * (2 * lane + 1) // 4
+            angle = 90 if (self.position * self.speed // self.width + lane) \
+                % 3 == 0 else 0
+            box = cv2.boxPoints(((x, y), (200, 60), angle))
+            cv2.fillPoly(frame, [box.astype(np.int32)], (180, 180, 180))
+        self.position += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+def rss_mb():
+    """
+    Return the resident set size of this process.
+
+    :return: RSS in MB
+    """
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def open_fds():
+    """
+    Return the number of open file descriptors of this process.
+
+    :return: number of file descriptors
+    """
+    return len(os.listdir("/proc/self/fd"))
+
+
+def count_files(base_dir):
+    """
+    Return the number of images saved in the defect folders.
+
+    :param base_dir: directory of the defect folders
+    :return: number of files
+    """
+    return sum(len(os.listdir(os.path.join(base_dir, name)))
+               for name in DIR_NAMES)
+
+
+def drift(samples, warmup, args):
+    """
+    Compare the samples taken after the warm up with the thresholds.
+    Step 1: Fit a line to the RSS of the samples to get its growth per hour.
+            The results of every object are kept for --results on purpose,
+            so the memory of the result buffer is not counted.
+    Step 2: Compare the file descriptors with the first sample.
+    Step 3: Check the saved images against the objects inspected, at most
+            one per defect of an object, and against the largest count.
+    Step 4: Compare the median p99 latency of the last three samples with
+            the one of the first three samples.
+
+    :param samples: list of sample dictionaries
+    :param warmup: time in seconds of the warm up
+    :param args: command line arguments with the thresholds
+    :return: list of failure messages, empty if the test passed
+    """
+    samples = [sample for sample in samples if sample["elapsed"] >= warmup]
+    if len(samples) < 2:
+        return ["Not enough samples after the warm up"]
+    failures = []
+    hours = np.array([sample["elapsed"] for sample in samples]) / 3600.0
+    rss = np.array([sample["rss_mb"] - sample["results_mb"]
+                    for sample in samples])
+    growth = np.polyfit(hours, rss, 1)[0]
+    print("RSS growth: {:.2f} MB per hour".format(growth))
+    if growth > args.max_rss_growth:
+        failures.append("RSS grows by {:.2f} MB per hour".format(growth))
+    fds = max(sample["fds"] for sample in samples) - samples[0]["fds"]
+    print("File descriptors opened: {}".format(fds))
+    if fds > args.max_fd_growth:
+        failures.append("{} file descriptors opened".format(fds))
+    last = samples[-1]
+    print("Saved images: {} of {} objects".format(last["crop_files"],
+                                                  last["objects"]))
+    if last["crop_files"] > last["objects"] * len(DEFECTS):
+        failures.append("{} images saved for {} objects".format(
+            last["crop_files"], last["objects"]))
+    if last["crop_files"] > args.max_crop_files:
+        failures.append("{} images saved".format(last["crop_files"]))
+    first = np.median([sample["p99_ms"] for sample in samples[:3]])
+    last = np.median([sample["p99_ms"] for sample in samples[-3:]])
+    ratio = last / first if first else 1.0
+    print("p99 latency: {:.2f} ms after the warm up, {:.2f} ms at the end"
+          .format(first, last))
+    if ratio > args.max_latency_drift:
+        failures.append("p99 latency grew {:.2f} times".format(ratio))
+    return failures
+
+
+class LatencyShedder(LoadShedder):
+    """
+    Load shedder of the detector that also keeps the latency of every
+    inspected frame, as measured by the inspection loop itself.
+    """
+
+    def __init__(self, budget):
+        super().__init__(budget)
+        self.latencies = []
+
+    def update(self, latency):
+        self.latencies.append(latency)
+        return super().update(latency)
+
+
+class SoakWatcher(ParameterWatcher):
+    """
+    Parameter watcher that inspects every n-th frame instead of the
+    frame_number parameter.
+    """
+
+    def __init__(self, config_file, every):
+        self.every = every
+        super().__init__(config_file)
+
+    @property
+    def current(self):
+        return self._current
+
+    @current.setter
+    def current(self, parameters):
+        if self.every:
+            parameters = Parameters(dict(parameters.values,
+                                         frame_number=self.every))
+        self._current = parameters
+
+
+class NullClient:
+    """
+    InfluxDB client that drops the points, when the test runs without
+    InfluxDB.
+    """
+
+    def write_points(self, points, **kwargs):
+        return True
+
+    def query(self, query):
+        return None
+
+
+class SoakCapture:
+    """
+    Input of the detector during the test: loops over the input, samples
+    the process every interval and ends the input when the test is over.
+    """
+
+    def __init__(self, cap, args, base_dir, detector, out):
+        self.cap = cap
+        self.args = args
+        self.base_dir = base_dir
+        self.detector = detector
+        self.out = out
+        self.frame_step = getattr(cap, 'frame_step', 1)
+        self.frames = 0
+        self.samples = []
+        self.reference = None
+        self.start = time.time()
+        self.next_sample = self.start + args.interval
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+    def read(self):
+        if time.time() >= self.next_sample and self.sample():
+            return False, None
+        ret, frame = self.cap.read()
+        if not ret:
+            # Start the input over, a camera ends the test
+            if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                return False, None
+            ret, frame = self.cap.read()
+        self.frames += self.frame_step
+        return ret, frame
+
+    def sample(self):
+        """
+        Sample the process.
+
+        :return: True if the test is over
+        """
+        args = self.args
+        now = time.time()
+        self.next_sample += args.interval
+        elapsed = now - self.start
+        shedder = self.detector.SHEDDER
+        latencies = shedder.latencies
+        shedder.latencies = []
+        milliseconds = np.array(latencies) * 1000 if latencies else \
+            np.zeros(1)
+        sample = {
+            "elapsed": round(elapsed, 1),
+            "frames": self.frames,
+            "objects": self.detector.COUNT_OBJECT,
+            "rss_mb": round(rss_mb(), 2),
+            "results_mb": round(sum(
+                column.nbytes for column in
+                self.detector.RESULTS.columns.values()) / 1e6, 2),
+            "fds": open_fds(),
+            "traced_mb": round(tracemalloc.get_traced_memory()[0] / 1e6,
+                               2) if args.top else 0,
+            "crop_files": count_files(self.base_dir),
+            "p50_ms": round(float(np.percentile(milliseconds, 50)), 2),
+            "p99_ms": round(float(np.percentile(milliseconds, 99)), 2),
+            "max_ms": round(float(milliseconds.max()), 2),
+        }
+        self.samples.append(sample)
+        print(" ".join("{}={}".format(name, sample[name])
+                       for name in SAMPLE_FIELDS), file=self.out)
+        self.out.flush()
+        # Allocations are compared with the first sample after warm up
+        if args.top and self.reference is None and elapsed >= args.warmup:
+            self.reference = tracemalloc.take_snapshot()
+        return elapsed >= args.duration
+
+
+def soak(args):
+    """
+    Run the inspection loop of the detector on the input in a loop and
+    sample the process.
+    Step 1: Set the detector up as its main block does, headless, with the
+            input looped by a SoakCapture.
+    Step 2: Run flaw_detection() of the detector until the test is over.
+    Step 3: Check the samples for drift.
+
+    :param args: command line arguments
+    :return: list of failure messages, empty if the test passed
+    """
+    # Only loaded here, the other tools use the frame sources of this module
+    import object_flaw_detector as detector
+
+    with open(args.config) as f:
+        config = json.load(f)
+    if args.synthetic:
+        width, height = (int(value) for value in args.synthetic.split("x"))
+        item = {}
+        cap = SyntheticCapture(width, height)
+    else:
+        item = config['inputs'][args.input]
+        cap = open_capture(item['video'])
+        if not cap.isOpened():
+            return ["Unable to open {}".format(item['video'])]
+    frame_size = (cap.get(3), cap.get(4))
+
+    base_dir = args.directory or tempfile.mkdtemp(prefix="soak")
+    for name in DIR_NAMES:
+        os.makedirs(os.path.join(base_dir, name), exist_ok=True)
+    if args.influx:
+        from influxdb import InfluxDBClient
+        ipaddress, port, proxy = detector.get_ip_address()
+        database = 'obj_flaw_database'
+        client = InfluxDBClient(host=ipaddress, port=port,
+                                database=database, proxies=proxy)
+        client.create_database(database)
+    else:
+        client = NullClient()
+
+    soak_cap = SoakCapture(cap, args, base_dir, detector, sys.stdout)
+    watcher = SoakWatcher(args.config, args.every)
+    watcher.start()
+    # The same state as the main block of the detector sets up
+    detector.HEADLESS = True
+    detector.LIVE_VIEW = None
+    detector.TILER = None
+    detector.base_dir = base_dir
+    detector.client = client
+    detector.cap = soak_cap
+    detector.item = item
+    detector.LANES = load_lanes(item, frame_size)
+    detector.PROFILE = load_profile(item, frame_size, 0.0264583333, None,
+                                    detector.LANES.origin)
+    detector.OBJ_DEFECT = []
+    detector.FRAME_COUNT = 0
+    detector.FRAME_STEP = soak_cap.frame_step
+    detector.WATCHER = watcher
+    detector.PARAMS = watcher.current
+    detector.RESULTS = ResultBuffer()
+    detector.SHEDDER = LatencyShedder(0)
+    detector.IDLE = IdleDetector()
+
+    if args.top:
+        tracemalloc.start()
+    try:
+        # The detector prints every object
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose
+                                            else devnull):
+                detector.flaw_detection()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        cap.release()
+
+    samples = soak_cap.samples
+    if args.top and soak_cap.reference is not None:
+        print("Top allocation growth since the warm up:")
+        snapshot = tracemalloc.take_snapshot()
+        for stat in snapshot.compare_to(soak_cap.reference,
+                                        "lineno")[:args.top]:
+            print("  {}".format(stat))
+    if args.top:
+        tracemalloc.stop()
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SAMPLE_FIELDS)
+            writer.writeheader()
+            writer.writerows(samples)
+    if not args.directory:
+        shutil.rmtree(base_dir)
+    return drift(samples, args.warmup, args)
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    failures = soak(args)
+    for failure in failures:
+        print("FAIL: {}".format(failure))
+    if not failures:
+        print("PASS")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,416 @@
+"""Inspection of large frames as overlapping tiles on several threads."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from inspection import (color_areas, color_mask, crack_areas, detect_color,
+                        detect_crack, filter_objects, find_objects,
+                        object_mask)
+
+
+def parse_tile(text):
+    """
+    Parse a tile size such as "512" or "1024x0".
+
+    :param text: width and height of the tiles, a single number for square
+                 tiles, 0 for the whole frame along that side
+    :return: (width, height) of the tiles, None for "0"
+    """
+    width, _, height = text.partition("x")
+    size = (int(width), int(height or width))
+    return size if any(size) else None
+
+
+def tile_grid(shape, tile_size):
+    """
+    Split a frame into tiles.
+
+    :param shape: shape of the frame
+    :param tile_size: (width, height) of the tiles, 0 for the whole frame
+                      along that side
+    :return: list of (x, y, width, height) of the tiles, row by row
+    """
+    height, width = shape[:2]
+    tile_width = tile_size[0] or width
+    tile_height = tile_size[1] or height
+    return [(x, y, min(tile_width, width - x), min(tile_height, height - y))
+            for y in range(0, height, tile_height)
+            for x in range(0, width, tile_width)]
+
+
+def halos(params):
+    """
+    Return the margin each step needs around a tile so that its result on
+    the tile is the one on the whole frame.
+    The object mask goes through four morphological operations and the
+    color mask through two, each reaching half a kernel further. Canny
+    looks one pixel around the blurred image for the gradient and one more
+    for the non-maximum suppression.
+
+    :param params: detector Parameters
+    :return: margins of the object, color and crack steps in pixels
+    """
+    reach = max(params.kernel.shape) // 2
+    return 4 * reach, 2 * reach, max(params.blur_size) // 2 + 2
+
+
+class Tiler:
+    """
+    Runs the full-frame steps of the inspection on overlapping tiles.
+
+    Every tile is processed with a margin wide enough for its own pixels
+    to come out exactly as on the whole frame, so the working images of a
+    thread stay the size of a tile whatever the size of the frame. Only
+    the masks are put together at full size. The contours are then found
+    on them in one pass, which joins the objects and defects crossing the
+    seams before they are measured. Canny links weak edges to strong ones
+    through any distance, so the edges of a tile are linked within it and
+    the chains crossing a seam are followed afterwards, see join_edges().
+    The methods return what their untiled counterparts in inspection.py
+    return.
+    """
+
+    def __init__(self, tile_size, threads=None):
+        self.tile_size = tile_size
+        self.threads = threads or len(os.sched_getaffinity(0))
+        self.pool = ThreadPoolExecutor(self.threads)
+        self._grids = {}
+        self._masks = {}
+
+    def tiles(self, shape):
+        """
+        Return the tiles of a frame shape.
+
+        :param shape: shape of the frame
+        :return: list of (x, y, width, height) of the tiles
+        """
+        key = shape[:2]
+        if key not in self._grids:
+            self._grids[key] = tile_grid(shape, self.tile_size)
+        return self._grids[key]
+
+    def _mask(self, name, shape):
+        # Full-frame masks are reused from frame to frame. Every pixel is
+        # written by one of the tiles.
+        key = (name, shape[:2])
+        if key not in self._masks:
+            self._masks[key] = np.empty(shape[:2], dtype=np.uint8)
+        return self._masks[key]
+
+    def _run(self, step, frame, halo, *outputs):
+        """
+        Run a step on every tile and copy its results to the full-frame
+        outputs.
+
+        :param step: function of a tile with its margins and of the slices
+                     of its core that returns one image of the core per
+                     output
+        :param frame: Input frame
+        :param halo: margin of the step in pixels
+        :param outputs: full-frame output images
+        :return: None
+        """
+        height, width = frame.shape[:2]
+
+        def run_tile(tile):
+            x, y, w, h = tile
+            left, top = max(x - halo, 0), max(y - halo, 0)
+            right, bottom = min(x + w + halo, width), min(y + h + halo, height)
+            core = (slice(y - top, y - top + h), slice(x - left, x - left + w))
+            results = step(frame[top:bottom, left:right], core)
+            for output, result in zip(outputs, results):
+                output[y:y + h, x:x + w] = result
+
+        for _ in self.pool.map(run_tile, self.tiles(frame.shape)):
+            pass
+
+    def find_objects(self, frame, params):
+        """
+        Tiled find_objects() of inspection.py.
+
+        :param frame: Input frame from the video
+        :param params: detector Parameters
+        :return: list of contours of the objects
+        """
+        if len(self.tiles(frame.shape)) == 1:
+            return find_objects(frame, params)
+        mask = self._mask("objects", frame.shape)
+
+        def step(tile, core):
+            return object_mask(cv2.cvtColor(tile, cv2.COLOR_BGR2HSV),
+                               params)[core],
+
+        self._run(step, frame, halos(params)[0], mask)
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_LIST,
+                                               cv2.CHAIN_APPROX_NONE)
+        return filter_objects(contours, params)
+
+    def detect_color(self, frame, params, mask=None):
+        """
+        Tiled detect_color() of inspection.py.
+
+        :param frame: Input frame from the video
+        :param params: detector Parameters
+        :param mask: mask of the lanes of the belt, None for the whole frame
+        :return: color_flag, contours of the defective areas, brightened frame
+        """
+        if len(self.tiles(frame.shape)) == 1:
+            return detect_color(frame, params, mask)
+        # The brightened frame is kept with the annotations of the frame,
+        # it is not reused
+        bright = np.empty_like(frame)
+        img_threshold = self._mask("color", frame.shape)
+
+        def step(tile, core):
+            tile_bright = cv2.convertScaleAbs(tile, None, 1, 20)
+            return tile_bright[core], color_mask(
+                cv2.cvtColor(tile_bright, cv2.COLOR_BGR2HSV), params)[core]
+
+        self._run(step, frame, halos(params)[1], bright, img_threshold)
+        defects = color_areas(img_threshold, params, mask)
+        return len(defects) > 0, defects, bright
+
+    def detect_crack(self, frame, params, edge_mask=None):
+        """
+        Tiled detect_crack() of inspection.py.
+        Step 1: On every tile, blur its gray image and compute the gradient
+                once for two Canny passes: the weak edges, above the low
+                threshold, and the strong ones, above the high threshold.
+        Step 2: Keep the weak edges of the tile connected to a strong one
+                within the tile.
+        Step 3: Follow the weak edges connected to the kept ones across
+                the seams, see join_edges().
+
+        :param frame: Input frame from the video
+        :param params: detector Parameters
+        :param edge_mask: mask of the lanes of the belt without their borders,
+                          None for the whole frame
+        :return: defect_flag, contours of the cracks
+        """
+        if len(self.tiles(frame.shape)) == 1:
+            return detect_crack(frame, params, edge_mask)
+        weak = self._mask("weak", frame.shape)
+        edges = self._mask("edges", frame.shape)
+        low = params.canny_low_threshold
+        high = params.canny_low_threshold * params.canny_ratio
+
+        def step(tile, core):
+            img = cv2.blur(cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY),
+                           params.blur_size)
+            # Canny takes the gradient with replicated borders
+            dx = cv2.Sobel(img, cv2.CV_16S, 1, 0, ksize=3,
+                           borderType=cv2.BORDER_REPLICATE)
+            dy = cv2.Sobel(img, cv2.CV_16S, 0, 1, ksize=3,
+                           borderType=cv2.BORDER_REPLICATE)
+            tile_weak = cv2.Canny(dx, dy, low, low)[core]
+            if not cv2.countNonZero(tile_weak):
+                return tile_weak, tile_weak
+            # Canny keeps the same maxima whatever the thresholds, so the
+            # strong edges are among the weak ones. The weak edges
+            # connected to them are flooded.
+            flooded = tile_weak.copy()
+            for y, x in np.argwhere(cv2.Canny(dx, dy, high, high)[core]):
+                if flooded[y, x] == 255:
+                    cv2.floodFill(flooded, None, (int(x), int(y)), 128,
+                                  flags=8)
+            return tile_weak, cv2.compare(flooded, 128, cv2.CMP_EQ)
+
+        self._run(step, frame, halos(params)[2], weak, edges)
+        join_edges(weak, edges, self.tiles(frame.shape))
+        cracks = crack_areas(edges, params, edge_mask)
+        return len(cracks) > 0, cracks
+
+    def close(self):
+        """
+        Stop the threads.
+
+        :return: None
+        """
+        self.pool.shutdown()
+
+
+def join_edges(weak, edges, tiles):
+    """
+    Add the weak edges that are connected to the edges of another tile.
+    A weak edge left out of a tile is only connected to a strong edge
+    through a neighbor on the other side of a seam. Every weak edge on a
+    seam next to a kept edge across it is flooded through all weak edges
+    it is connected to, in any tile, which completes its chain in one pass.
+
+    :param weak: weak edges of the frame, changed in place
+    :param edges: edges kept within every tile, changed in place
+    :param tiles: tiles of the frame
+    :return: None
+    """
+    seeds = []
+    for column in sorted({x for x, y, w, h in tiles if x}):
+        for kept, side in ((column - 1, column), (column, column - 1)):
+            for i in _seam_seeds(edges[:, kept], weak[:, side],
+                                 edges[:, side]):
+                seeds.append((side, i))
+    for row in sorted({y for x, y, w, h in tiles if y}):
+        for kept, side in ((row - 1, row), (row, row - 1)):
+            for i in _seam_seeds(edges[kept], weak[side], edges[side]):
+                seeds.append((i, row if side == row else row - 1))
+    for x, y in seeds:
+        # Already flooded from another seed of the same chain
+        if weak[y, x] != 255:
+            continue
+        ret, image, mask, (left, top, w, h) = cv2.floodFill(
+            weak, None, (x, y), 128, flags=8)
+        region = edges[top:top + h, left:left + w]
+        region[weak[top:top + h, left:left + w] == 128] = 255
+
+
+def _seam_seeds(kept, weak, edges):
+    # Weak edges on one side of a seam touching a kept edge on the other
+    kept = kept > 0
+    touching = kept.copy()
+    touching[1:] |= kept[:-1]
+    touching[:-1] |= kept[1:]
+    return np.flatnonzero(touching & (weak > 0) & (edges == 0)).tolist()
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Compare the tiled inspection of "
+                            "large frames with the untiled one")
+    parser.add_argument("-c", "--config",
+                        default="../resources/config.json",
+                        help="Path of config.json")
+    parser.add_argument("-i", "--input",
+                        type=int,
+                        default=0,
+                        help="Index of the input in config.json")
+    parser.add_argument("-s", "--size",
+                        default="3840x2160",
+                        help="Size the frames are scaled to, for example "
+                        "3840x2160 or 8192x1024 for a line-scan camera")
+    parser.add_argument("-t", "--tiles",
+                        default="512,1024,1024x0",
+                        help="Comma separated tile sizes to compare")
+    parser.add_argument("-th", "--threads",
+                        type=int,
+                        default=None,
+                        help="Number of threads, one per core by default")
+    parser.add_argument("-n", "--frames",
+                        type=int,
+                        default=20,
+                        help="Number of frames")
+    return parser
+
+
+def benchmark(item, parameters, size, tile_sizes, threads, frame_count):
+    """
+    Print the time of every step untiled and with every tile size, and
+    check that the tiled results are the untiled ones.
+
+    :param item: entry of the input in the "inputs" list of config.json
+    :param parameters: parameters block of config.json
+    :param size: (width, height) the frames are scaled to
+    :param tile_sizes: list of (width, height) of the tiles
+    :param threads: number of threads, None for one per core
+    :param frame_count: number of frames
+    :return: True if all results matched
+    """
+    from fanout import open_capture
+    from parameters import Parameters
+
+    params = Parameters(parameters)
+    cap = open_capture(item['video'])
+    frames = []
+    while len(frames) < frame_count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, size))
+    cap.release()
+    if not frames:
+        print("No frames read from {}".format(item['video']))
+        return False
+
+    def run(finder):
+        times = np.zeros(3)
+        results = []
+        for frame in frames:
+            stamps = [time.time()]
+            objects = finder.find_objects(frame, params)
+            stamps.append(time.time())
+            color = finder.detect_color(frame, params)
+            stamps.append(time.time())
+            crack = finder.detect_crack(frame, params)
+            stamps.append(time.time())
+            times += np.diff(stamps)
+            results.append((objects, color, crack))
+        return times * 1000 / len(frames), results
+
+    def same(first, second):
+        if isinstance(first, np.ndarray):
+            return np.array_equal(first, second)
+        if isinstance(first, (list, tuple)):
+            return len(first) == len(second) and \
+                all(same(a, b) for a, b in zip(first, second))
+        return first == second
+
+    print("{} frames of {}x{}, ms per frame: objects, color, crack".format(
+        len(frames), size[0], size[1]))
+    times, expected = run(sys.modules["inspection"])
+    print("  untiled          {:7.1f} {:7.1f} {:7.1f}".format(*times))
+    matched = True
+    for tile_size in tile_sizes:
+        tiler = Tiler(tile_size, threads)
+        times, results = run(tiler)
+        tiler.close()
+        match = same(results, expected)
+        matched = matched and match
+        print("  tiles {:<10} {:7.1f} {:7.1f} {:7.1f}  {}".format(
+            "{}x{}".format(*tile_size), *times,
+            "identical" if match else "DIFFERENT"))
+    return matched
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    with open(args.config) as f:
+        config = json.load(f)
+    size = tuple(int(side) for side in args.size.split("x"))
+    tile_sizes = [parse_tile(text) for text in args.tiles.split(",")]
+    if not benchmark(config['inputs'][args.input],
+                     config.get("parameters", {}), size, tile_sizes,
+                     args.threads, args.frames):
+        sys.exit(1)
@@ -0,0 +1,407 @@
+"""Sweep of the detector parameters over a recorded clip."""
+"""
+* Copyright (c) 2018 Intel Corporation.
+*
+* Permission is hereby granted, free of charge, to any person obtaining
+* a copy of this software and associated documentation files (the
+* "Software"), to deal in the Software without restriction, including
+* without limitation the rights to use, copy, modify, merge, publish,
+* distribute, sublicense, and/or sell copies of the Software, and to
+* permit persons to whom the Software is furnished to do so, subject to
+* the following conditions:
+*
+* The above copyright notice and this permission notice shall be
+* included in all copies or substantial portions of the Software.
+*
+* THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+* EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+* MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+* NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+* LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+* OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+* WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+*
+"""
+
+
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from fanout import open_capture
+from inspection import (color_defects, crack_contours, detect_orientation,
+                        filter_objects, object_contours)
+from lanes import load_lanes
+from parameters import DEFAULT_PARAMETERS, Parameters
+
+# Parameters that do not change the verdict of an inspected frame
+NOT_SWEPT = ["version", "frame_number", "idle_threshold"]
+# Result flags counted for every setting, in the order of the output
+FLAGS = ["orientation", "color", "crack", "no_defect"]
+# Counts of every frame: its objects, then its objects with each flag
+COUNTS = ["objects"] + FLAGS
+
+# Intermediate images of the worker processes, see init_worker()
+CACHE = {}
+
+
+def build_argparser():
+    """
+    Parse the command line arguments.
+
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description="Count the defects found in a "
+                            "recorded clip for every setting of a parameter "
+                            "search")
+    parser.add_argument("space",
+                        help="JSON file of the values of each parameter: a "
+                        "list of values, or {\"min\": a, \"max\": b} for "
+                        "random search")
+    parser.add_argument("-c", "--config",
+                        default="../resources/config.json",
+                        help="Path of config.json, its parameters are the "
+                        "base of every setting")
+    parser.add_argument("-i", "--input",
+                        type=int,
+                        default=0,
+                        help="Index of the input in config.json")
+    parser.add_argument("-v", "--video",
+                        default=None,
+                        help="Clip to use instead of the video of the input")
+    parser.add_argument("-e", "--every",
+                        type=int,
+                        default=0,
+                        help="Use every n-th frame, 0 for the frame_number "
+                        "parameter")
+    parser.add_argument("-n", "--samples",
+                        type=int,
+                        default=0,
+                        help="Number of random settings, 0 for the full grid "
+                        "of the listed values")
+    parser.add_argument("-l", "--labels",
+                        default=None,
+                        help="Results CSV of the clip with the expected "
+                        "flags, as saved with -r and corrected by hand")
+    parser.add_argument("-p", "--processes",
+                        type=int,
+                        default=len(os.sched_getaffinity(0)),
+                        help="Number of worker processes")
+    parser.add_argument("-cd", "--cache_dir",
+                        default="../resources/tuning",
+                        help="Directory of the cached intermediate images")
+    parser.add_argument("-o", "--output",
+                        default="sweep.csv",
+                        help="Path of the CSV file of the counts")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="Seed of the random search")
+    return parser
+
+
+def settings(space, samples, seed=0):
+    """
+    List the settings of a search space.
+
+    :param space: dictionary of the values of each parameter, a list of
+                  values or a {"min", "max"} range
+    :param samples: number of random settings, 0 for the full grid
+    :param seed: seed of the random search
+    :return: list of dictionaries of parameter values
+    """
+    for name in space:
+        if name not in DEFAULT_PARAMETERS or name in NOT_SWEPT:
+            raise ValueError("Cannot sweep {}".format(name))
+    names = sorted(space)
+    if not samples:
+        for name in names:
+            if not isinstance(space[name], list):
+                raise ValueError("The grid needs a list of values for {}, "
+                                 "use -n for ranges".format(name))
+        return [dict(zip(names, values)) for values in
+                itertools.product(*(space[name] for name in names))]
+
+    rng = random.Random(seed)
+
+    def draw(spec):
+        if isinstance(spec, list):
+            return rng.choice(spec)
+        low, high = spec["min"], spec["max"]
+        if isinstance(low, list):
+            return [draw({"min": a, "max": b}) for a, b in zip(low, high)]
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return rng.uniform(low, high)
+
+    return [{name: draw(space[name]) for name in names}
+            for _ in range(samples)]
+
+
+def cache_key(video, item, every):
+    """
+    Return a key identifying the intermediate images of a clip.
+
+    :param video: path of the clip
+    :param item: entry of the input in config.json, for its lanes
+    :param every: number of frames between two used frames
+    :return: hexadecimal key
+    """
+    stat = os.stat(video)
+    text = json.dumps([os.path.abspath(video), stat.st_size, stat.st_mtime,
+                       item.get('lanes', []), every])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def build_cache(video, item, every, cache_dir):
+    """
+    Compute the images that do not depend on the parameters once per used
+    frame and save them as .npy files that the workers map.
+    Step 1: Preallocate the cached arrays on disk for every used frame of
+            the clip.
+    Step 2: Crop every used frame to the lanes.
+    Step 3: Write its HSV image, for the objects, the HSV image of the
+            brightened frame, for the defective color, and its gray image,
+            for the cracks, straight into the arrays.
+    Step 4: Save the frame numbers last, so an interrupted cache is built
+            again.
+
+    :param video: path of the clip
+    :param item: entry of the input in config.json, for its lanes
+    :param every: number of frames between two used frames
+    :param cache_dir: directory of the cache
+    :return: paths of the cached arrays by name
+    """
+    key = cache_key(video, item, every)
+    names = ["index", "size", "hsv", "bright", "gray"]
+    paths = {name: os.path.join(cache_dir, "{}_{}.npy".format(key, name))
+             for name in names}
+    if all(os.path.isfile(path) for path in paths.values()):
+        return paths
+    os.makedirs(cache_dir, exist_ok=True)
+    cap = open_capture(video)
+    lanes = load_lanes(item, (cap.get(3), cap.get(4)))
+    frame_step = getattr(cap, 'frame_step', 1)
+    # Frames of the clip that are used, the images are written to the
+    # files instead of being held in memory
+    stored = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    capacity = sum(1 for i in range(1, stored + 1)
+                   if (i * frame_step) % every == 0)
+    w, h = lanes.size
+    arrays = {}
+    for name, shape in (("hsv", (h, w, 3)), ("bright", (h, w, 3)),
+                        ("gray", (h, w))):
+        arrays[name] = np.lib.format.open_memmap(
+            paths[name], mode="w+", dtype=np.uint8,
+            shape=(max(capacity, 1),) + shape)
+    index = []
+    frame_count = 0
+    while len(index) < capacity:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_count += frame_step
+        if frame_count % every:
+            continue
+        frame = lanes.apply(frame)
+        i = len(index)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, arrays["hsv"][i])
+        cv2.cvtColor(cv2.convertScaleAbs(frame, None, 1, 20),
+                     cv2.COLOR_BGR2HSV, arrays["bright"][i])
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, arrays["gray"][i])
+        index.append(frame_count)
+    if len(index) == capacity and cap.read()[0]:
+        print("{} has more frames than it reports, only the first {} "
+              "are cached".format(video, frame_count))
+    # Frame size of the clip, the lanes are placed in it
+    size = [cap.get(3), cap.get(4)]
+    cap.release()
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    np.save(paths["size"], np.array(size))
+    np.save(paths["index"], np.array(index))
+    return paths
+
+
+def init_worker(paths, item, base):
+    """
+    Map the cached images in a worker process.
+
+    :param paths: paths of the cached arrays by name
+    :param item: entry of the input in config.json, for its lanes
+    :param base: parameter values the settings are applied to
+    :return: None
+    """
+    # The processes share the cores, one OpenCV thread each
+    cv2.setNumThreads(1)
+    for name, path in paths.items():
+        CACHE[name] = np.load(path, mmap_mode='r')
+    CACHE["lanes"] = load_lanes(item, tuple(CACHE["size"].tolist()))
+    CACHE["base"] = base
+    # Contours of the objects and blurred images, reused by the next
+    # settings with the same object color range, kernel or blur size
+    CACHE["contours"] = {}
+    CACHE["blurred"] = {}
+
+
+def evaluate(setting):
+    """
+    Inspect every cached frame with one setting.
+
+    :param setting: dictionary of parameter values
+    :return: setting, per-frame counts of the flags, or the error message
+             of an invalid setting
+    """
+    try:
+        params = Parameters(dict(CACHE["base"], **setting))
+    except ValueError as error:
+        return setting, str(error)
+    lanes = CACHE["lanes"]
+    contour_key = (params.object_color_low, params.object_color_high,
+                   params.values["kernel_size"])
+    if contour_key not in CACHE["contours"]:
+        CACHE["contours"] = {contour_key: {}}
+    contours = CACHE["contours"][contour_key]
+    if params.blur_size not in CACHE["blurred"]:
+        CACHE["blurred"] = {params.blur_size: {}}
+    blurred = CACHE["blurred"][params.blur_size]
+
+    counts = np.zeros((len(CACHE["index"]), len(COUNTS)), dtype=np.int64)
+    for i in range(len(CACHE["index"])):
+        if i not in contours:
+            contours[i] = object_contours(CACHE["hsv"][i], params)
+        objects = filter_objects(contours[i], params)
+        if not objects:
+            continue
+        # Same checks as inspect_frame, done once for the frame
+        color = len(color_defects(CACHE["bright"][i], params,
+                                  lanes.mask)) > 0
+        if i not in blurred:
+            blurred[i] = cv2.blur(CACHE["gray"][i], params.blur_size)
+        crack = len(crack_contours(blurred[i], params, lanes.edge_mask)) > 0
+        for cnt in objects:
+            orientation, angle = detect_orientation(cnt, params)
+            counts[i] += (1, orientation, color, crack,
+                          not (orientation or color or crack))
+    return setting, counts
+
+
+def load_labels(path, index):
+    """
+    Count the expected objects and flags of every frame from a results
+    CSV.
+
+    :param path: results CSV with frame_index and flag columns
+    :param index: frame indices of the cached frames
+    :return: per-frame counts
+    """
+    rows = {frame: i for i, frame in enumerate(index.tolist())}
+    labels = np.zeros((len(index), len(COUNTS)), dtype=np.int64)
+    with open(path) as f:
+        for record in csv.DictReader(f):
+            row = rows.get(int(record["frame_index"]))
+            if row is None:
+                continue
+            labels[row] += [1] + [int(record[flag]) for flag in FLAGS]
+    return labels
+
+
+def score(counts, labels):
+    """
+    Compare the per-frame counts of a setting with the labels.
+
+    :param counts: per-frame counts of the setting
+    :param labels: per-frame expected counts
+    :return: dictionary of false positives and negatives of every count and
+             the F1 score over all flags
+    """
+    scores = {}
+    true_positives = np.minimum(counts, labels).sum(axis=0)
+    false_positives = np.maximum(counts - labels, 0).sum(axis=0)
+    false_negatives = np.maximum(labels - counts, 0).sum(axis=0)
+    for i, flag in enumerate(COUNTS):
+        scores["{}_fp".format(flag)] = int(false_positives[i])
+        scores["{}_fn".format(flag)] = int(false_negatives[i])
+    # Counts of the frames that match the labels, objects aside
+    tp = true_positives[1:].sum()
+    errors = false_positives[1:].sum() + false_negatives[1:].sum()
+    scores["f1"] = round(float(2 * tp / max(2 * tp + errors, 1)), 4)
+    return scores
+
+
+def sweep(args):
+    """
+    Run the search and save the counts of every setting.
+
+    :param args: command line arguments
+    :return: list of output rows
+    """
+    with open(args.config) as f:
+        config = json.load(f)
+    item = config['inputs'][args.input]
+    base = Parameters(config.get("parameters", {})).values
+    with open(args.space) as f:
+        candidates = settings(json.load(f), args.samples, args.seed)
+    # Settings sharing contours or blurred images follow each other
+    names = ("object_color_low", "object_color_high", "kernel_size",
+             "blur_size")
+    candidates.sort(key=lambda setting: json.dumps(
+        [setting.get(name) for name in names]))
+    every = args.every or base["frame_number"]
+
+    start = time.time()
+    paths = build_cache(args.video or item['video'], item, every,
+                        args.cache_dir)
+    index = np.load(paths["index"])
+    print("{} frames cached in {:.1f} s".format(
+        len(index), time.time() - start))
+    labels = load_labels(args.labels, index) if args.labels else None
+
+    start = time.time()
+    rows = []
+    skipped = 0
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.processes, init_worker,
+                      (paths, item, base)) as pool:
+        for setting, counts in pool.imap(evaluate, candidates):
+            if isinstance(counts, str):
+                skipped += 1
+                continue
+            row = {name: json.dumps(value) if isinstance(value, list)
+                   else value for name, value in setting.items()}
+            totals = counts.sum(axis=0)
+            for i, name in enumerate(COUNTS):
+                row[name] = int(totals[i])
+            if labels is not None:
+                row.update(score(counts, labels))
+            rows.append(row)
+    elapsed = time.time() - start
+    print("{} settings in {:.1f} s, {} invalid settings skipped".format(
+        len(rows), elapsed, skipped))
+    return rows
+
+
+if __name__ == '__main__':
+    args = build_argparser().parse_args()
+    rows = sweep(args)
+    if rows:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print("Counts of every setting saved to {}".format(args.output))
+    if args.labels:
+        rows.sort(key=lambda row: row["f1"], reverse=True)
+        print("Best settings:")
+        for row in rows[:5]:
+            print("  {}".format(row))
@@ -0,0 +1,7 @@
+"""Make the modules of the application importable from the tests."""
+import os
+import sys
+
+APPLICATION_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "application")
+sys.path.insert(0, APPLICATION_DIR)
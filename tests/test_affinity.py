@@ -0,0 +1,93 @@
+"""Tests of the core sets and thread pools of the processes."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from affinity import (THREAD_VARIABLES, format_cores, parse_cores,
+                      plan_layout, preset_threads, start_process,
+                      thread_environment)
+
+
+def test_parse_and_format_cores():
+    assert parse_cores("0-3,6") == (0, 1, 2, 3, 6)
+    assert parse_cores("5,1") == (1, 5)
+    assert parse_cores("none") is None
+    assert parse_cores("all") == tuple(sorted(os.sched_getaffinity(0)))
+    assert format_cores((6, 0, 1, 2, 3, 9, 10)) == "0-3,6,9-10"
+
+
+def test_single_process_gets_every_core():
+    assert plan_layout((0, 1, 2, 3), 0) == [("main", (0, 1, 2, 3))]
+
+
+def test_workers_split_the_other_cores():
+    assert plan_layout(range(8), 3) == [
+        ("main", (0,)), ("capture", (0,)), ("worker1", (1, 2)),
+        ("worker2", (3, 4)), ("worker3", (5, 6, 7))]
+
+
+def test_workers_share_cores_when_there_are_too_few():
+    assert plan_layout((0, 1, 2), 3) == [
+        ("main", (0,)), ("capture", (0,)), ("worker1", (1,)),
+        ("worker2", (2,)), ("worker3", (1,))]
+    assert plan_layout((4,), 2)[2:] == [("worker1", (4,)),
+                                        ("worker2", (4,))]
+
+
+def test_thread_environment():
+    assert thread_environment((0, 1)) == {name: "2"
+                                          for name in THREAD_VARIABLES}
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    for name in THREAD_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+    return os.environ
+
+
+@pytest.mark.parametrize("argv, threads", [
+    ([], None),
+    (["-cpu", "none"], None),
+    (["-cpu", "0"], "1"),
+    (["-cpu", "0", "-w", "2", "--headless"], "1"),
+    (["--cores=0", "--workers=1"], "1"),
+    (["-cpu", "bad"], None),
+    (["-w", "x", "-cpu", "0"], None),
+])
+def test_preset_threads(environment, argv, threads):
+    preset_threads(argv)
+    assert {environment.get(name) for name in THREAD_VARIABLES} == {threads}
+
+
+def test_preset_threads_keeps_the_variables_of_the_user(environment):
+    environment["OMP_NUM_THREADS"] = "7"
+    preset_threads(["-cpu", "0"])
+    assert environment["OMP_NUM_THREADS"] == "7"
+    assert environment["MKL_NUM_THREADS"] == "1"
+
+
+def test_affinity_does_not_load_numpy():
+    # preset_threads() runs before NumPy and OpenCV are imported
+    code = "import sys, affinity; print('numpy' in sys.modules)"
+    output = subprocess.check_output(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(sys.modules["affinity"].__file__))
+    assert output.strip() == b"False"
+
+
+class Process:
+    def start(self):
+        self.environment = {name: os.environ.get(name)
+                            for name in THREAD_VARIABLES}
+
+
+def test_start_process_sets_the_variables_for_the_child(environment):
+    process = Process()
+    start_process(process, (0, 1, 2))
+    assert set(process.environment.values()) == {"3"}
+    assert not any(name in environment for name in THREAD_VARIABLES)
+    start_process(process, None)
+    assert set(process.environment.values()) == {None}
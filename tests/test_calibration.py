@@ -0,0 +1,81 @@
+"""Tests of the per-input calibration profiles."""
+import os
+
+import cv2
+import numpy as np
+
+from calibration import CalibrationProfile, load_profile
+
+CAMERA_MATRIX = [[500.0, 0.0, 160.0], [0.0, 500.0, 120.0], [0.0, 0.0, 1.0]]
+
+
+def rectangle(x, y, w, h):
+    return np.array([[[x, y]], [[x + w, y]], [[x + w, y + h]],
+                     [[x, y + h]]], dtype=np.int32)
+
+
+def test_load_profile_defaults_to_the_pixel_length():
+    profile = load_profile({}, (320, 240), 0.5)
+    assert profile.mm_per_pixel == 5.0
+    assert not profile.undistorts
+    assert profile.measure(rectangle(10, 10, 40, 20)) == (200.0, 100.0)
+
+
+def test_measure_uses_the_calibrated_scale():
+    item = {"calibration": {"mm_per_pixel": 0.25}}
+    profile = load_profile(item, (320, 240), 0.5)
+    assert profile.measure(rectangle(10, 10, 20, 80)) == (20.0, 5.0)
+
+
+def test_origin_of_cropped_frames():
+    profile = CalibrationProfile((320, 240), 1.0, origin=(30, 40))
+    points = profile.undistort_points(rectangle(0, 0, 10, 10))
+    assert points[0, 0].tolist() == [30.0, 40.0]
+
+
+def test_perspective_scales_the_contour():
+    profile = CalibrationProfile((320, 240), 1.0,
+                                 perspective=[[2, 0, 0], [0, 2, 0],
+                                              [0, 0, 1]])
+    assert profile.measure(rectangle(10, 10, 40, 20)) == (80.0, 40.0)
+
+
+def test_maps_are_cached_and_memory_mapped(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    profile = CalibrationProfile((320, 240), 1.0, CAMERA_MATRIX,
+                                 [-0.2, 0.05, 0, 0, 0], cache_dir=cache_dir)
+    map1, map2 = profile.maps()
+    assert len(os.listdir(cache_dir)) == 2
+    cached = CalibrationProfile((320, 240), 1.0, CAMERA_MATRIX,
+                                [-0.2, 0.05, 0, 0, 0], cache_dir=cache_dir)
+    cached_map1, cached_map2 = cached.maps()
+    assert isinstance(cached_map1, np.memmap)
+    assert np.array_equal(cached_map1, map1)
+    assert np.array_equal(cached_map2, map2)
+    other = CalibrationProfile((320, 240), 1.0, CAMERA_MATRIX,
+                               [-0.1, 0, 0, 0, 0], cache_dir=cache_dir)
+    other.maps()
+    assert len(os.listdir(cache_dir)) == 4
+
+
+def test_undistort_roi_matches_the_whole_frame():
+    profile = CalibrationProfile((320, 240), 1.0, CAMERA_MATRIX,
+                                 [-0.2, 0.05, 0, 0, 0])
+    frame = np.random.RandomState(0).randint(0, 255, (240, 320, 3),
+                                             dtype=np.uint8)
+    contour = rectangle(100, 80, 60, 40)
+    roi = profile.undistort_roi(frame, contour)
+    map1, map2 = profile.maps()
+    whole = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+    points = cv2.undistortPoints(contour.astype(np.float32),
+                                 profile.camera_matrix, profile.dist_coeffs,
+                                 P=profile.camera_matrix)
+    x, y, w, h = cv2.boundingRect(points)
+    assert np.array_equal(roi, whole[y: y + h, x: x + w])
+
+
+def test_undistort_roi_without_lens_is_the_bounding_box():
+    profile = CalibrationProfile((320, 240), 1.0)
+    frame = np.arange(240 * 320, dtype=np.uint16).reshape(240, 320)
+    roi = profile.undistort_roi(frame, rectangle(10, 20, 5, 3))
+    assert np.array_equal(roi, frame[20:24, 10:16])
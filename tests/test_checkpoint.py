@@ -0,0 +1,114 @@
+"""Tests of the checkpoints of offline runs."""
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from checkpoint import Checkpoint, seek
+from result_buffer import ResultBuffer
+
+
+def add_rows(results, first, count):
+    for i in range(first, first + count):
+        results.append(object_id=i, frame_index=i * 10, length=i / 2.0)
+
+
+def test_save_and_resume(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    results = ResultBuffer()
+    checkpoint = Checkpoint(path, 0)
+    add_rows(results, 1, 3)
+    checkpoint.save({"frame_count": 30}, results)
+    add_rows(results, 4, 2)
+    checkpoint.save({"frame_count": 50}, results)
+    saved_time = checkpoint.time
+    # Rows of a run stopped after the checkpoint
+    add_rows(results, 6, 4)
+    with open(checkpoint.rows_path, "ab") as f:
+        f.write(results.to_records(5).tobytes())
+
+    resumed = ResultBuffer()
+    restarted = Checkpoint(path, 0)
+    state = restarted.load(resumed)
+    assert state["frame_count"] == 50
+    assert state["rows"] == 5
+    assert restarted.time == saved_time
+    assert resumed.to_records().tolist() == results.to_records(0, 5).tolist()
+    assert os.path.getsize(checkpoint.rows_path) == \
+        5 * results.to_records().dtype.itemsize
+    assert not os.path.exists(path + ".tmp")
+
+    # The next save only appends the new rows
+    add_rows(resumed, 6, 1)
+    restarted.save({"frame_count": 60}, resumed)
+    again = ResultBuffer()
+    Checkpoint(path, 0).load(again)
+    assert again.column("object_id").tolist() == [1, 2, 3, 4, 5, 6]
+
+
+def test_delete_after_the_checkpoint_time(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), 0)
+    checkpoint.save({}, ResultBuffer())
+    with open(checkpoint.path) as f:
+        assert json.load(f)["time"] == checkpoint.time
+    assert checkpoint.delete_after("obj_flaw_detector") == \
+        'DELETE FROM "obj_flaw_detector" WHERE time > {}'.format(
+            checkpoint.time * 1000)
+
+
+def test_missing_and_truncated_checkpoints(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert Checkpoint(path, 0).load(ResultBuffer()) is None
+    results = ResultBuffer()
+    add_rows(results, 1, 3)
+    checkpoint = Checkpoint(path, 0)
+    checkpoint.save({}, results)
+    os.truncate(checkpoint.rows_path, 10)
+    with pytest.raises(ValueError):
+        Checkpoint(path, 0).load(ResultBuffer())
+    checkpoint.remove()
+    assert not os.listdir(str(tmp_path))
+
+
+def test_due():
+    assert Checkpoint("checkpoint.json", 0).due()
+    assert not Checkpoint("checkpoint.json", 3600).due()
+
+
+class Capture:
+    """Input that cannot seek, like some cameras and codecs."""
+
+    def __init__(self):
+        self.position = 0
+
+    def set(self, prop, value):
+        if value == 0:
+            self.position = 0
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    def grab(self):
+        self.position += 1
+        return True
+
+
+def test_seek(tmp_path):
+    cap = Capture()
+    assert not seek(cap, 7)
+    assert cap.position == 7
+
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10,
+                             (32, 24))
+    for i in range(10):
+        writer.write(np.full((24, 32, 3), i * 20, dtype=np.uint8))
+    writer.release()
+    cap = cv2.VideoCapture(path)
+    seek(cap, 6)
+    ret, frame = cap.read()
+    cap.release()
+    assert abs(int(frame.mean()) - 120) <= 2
@@ -0,0 +1,85 @@
+"""Tests of the reference inspection and the equivalence check."""
+import cv2
+import numpy as np
+import pytest
+
+import equivalence
+import reference
+from calibration import CalibrationProfile
+from inspection import inspect_frame
+from lanes import Lanes
+from parameters import Parameters
+from soak import SyntheticCapture
+
+PARAMS = Parameters({"frame_number": 1})
+
+
+def result(x, length=30.0, angle=0.1, **flags):
+    contour = np.array([[[x, 10]], [[x + 20, 10]], [[x + 20, 30]],
+                        [[x, 30]]], dtype=np.int32)
+    obj = {"contour": contour, "length": length, "width": 10.0,
+           "angle": angle, "orientation": False, "color": False,
+           "crack": False, "no_defect": True}
+    obj.update(flags)
+    return obj
+
+
+def test_compare_pairs_objects_by_position():
+    expected = [result(10), result(100, length=40.0)]
+    objects = [result(100, length=40.005), result(10)]
+    assert equivalence.compare(expected, objects, 0.01, 0.01) == []
+
+
+def test_compare_reports_differences():
+    expected = [result(10), result(100)]
+    assert equivalence.compare(expected, expected[:1], 0.01, 0.01) == \
+        [("count", 2, 1)]
+    objects = [result(10, length=31.0, angle=0.3, crack=True,
+                      no_defect=False), result(100)]
+    assert equivalence.compare(expected, objects, 0.01, 0.01) == [
+        ("length", 30.0, 31.0), ("angle", 0.1, 0.3), ("crack", False, True),
+        ("no_defect", True, False)]
+
+
+def test_read_frames_every_nth_frame():
+    lanes = Lanes((64, 48))
+    frames = equivalence.read_frames(SyntheticCapture(64, 48), lanes, 3, 4)
+    assert [index for index, frame in frames] == [3, 6, 9, 12]
+    assert frames[0][1] is not frames[1][1]
+
+
+@pytest.mark.parametrize("mm_per_pixel, perspective", [
+    (0.264583333, None),
+    # A calibrated input, measured with its profile by both inspections
+    (0.1, [[1.2, 0.05, 3], [0.02, 0.9, -4], [0, 0.0001, 1]]),
+])
+def test_optimized_inspection_matches_the_reference(mm_per_pixel,
+                                                    perspective):
+    profile = CalibrationProfile((640, 480), mm_per_pixel,
+                                 perspective=perspective)
+    lanes = Lanes((640, 480))
+    cap = SyntheticCapture(640, 480)
+    frames = equivalence.read_frames(cap, lanes, 7, 12)
+    expected, times = equivalence.run(reference.inspect_frame, frames,
+                                      PARAMS, profile, lanes)
+    results, _ = equivalence.run(inspect_frame, frames, PARAMS, profile,
+                                 lanes)
+    assert sum(len(objects) for objects in expected) > 0
+    assert any(obj["orientation"] for objects in expected
+               for obj in objects)
+    for first, second in zip(expected, results):
+        assert equivalence.compare(first, second, 0.01, 1e-6) == []
+    assert set(times) == set(equivalence.STEPS)
+
+
+def test_reference_without_crack_check_is_not_defect_free():
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    cv2.rectangle(frame, (60, 80), (259, 149), (180, 180, 180), -1)
+    params = Parameters({"object_area_min": 5000})
+    profile = CalibrationProfile((320, 240), 0.25)
+    objects, annotations = reference.inspect_frame(frame, params, profile,
+                                                   Lanes((320, 240)),
+                                                   crack=False)
+    assert (objects[0]["length"], objects[0]["width"]) == (49.75, 17.25)
+    assert not objects[0]["no_defect"]
+    assert annotations["Crack"] == (False, [])
@@ -0,0 +1,108 @@
+"""Tests of the fan-out of the inspection to worker processes."""
+import json
+import queue
+
+import cv2
+import numpy as np
+import pytest
+
+from calibration import load_profile
+from fanout import FanOut, FrameRing
+from frame_store import ALIGNMENT, _pack_header
+from inspection import inspect_frame
+from lanes import load_lanes
+from parameters import Parameters
+
+FRAME_SIZE = (320, 240)
+
+
+def test_ring_is_shared_by_name():
+    ring = FrameRing((4, 6, 3), 3)
+    try:
+        other = FrameRing((4, 6, 3), 3, ring.name)
+        other.frames[1] = 9
+        other.header[1] = 5, 40
+        other.close()
+        assert ring.frames[1].min() == 9
+        assert ring.frames[0].max() == 0
+        assert ring.header[1].tolist() == [5, 40]
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_results_are_put_back_in_capture_order():
+    fanout = FanOut.__new__(FanOut)
+    fanout.processes = []
+    fanout.frames = 0
+    fanout.results_queue = queue.Queue()
+    for message in [("frame", 2, 30, 1, ["c"]), ("state", True),
+                    ("frame", 0, 10, 1, ["a"]), ("done", 4, 7, 1),
+                    ("frame", 3, 40, 2, ["d"]), ("frame", 1, 20, 1, ["b"])]:
+        fanout.results_queue.put(message)
+    assert list(fanout.results()) == [
+        ("state", True),
+        ("frame", 10, 1, ["a"]),
+        ("frame", 20, 1, ["b"]),
+        ("frame", 30, 1, ["c"]),
+        ("frame", 40, 2, ["d"]),
+    ]
+    assert (fanout.frames, fanout.skipped, fanout.dropped) == (4, 7, 1)
+
+
+def synthetic_frames(count):
+    frames = []
+    for i in range(count):
+        frame = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+        box = cv2.boxPoints(((60 + 12 * i, 120), (150, 70), 30 * (i % 3)))
+        cv2.fillPoly(frame, [box.astype(np.int32)], (180, 180, 180))
+        frames.append(frame)
+    return frames
+
+
+@pytest.fixture
+def video_input(tmp_path):
+    store = str(tmp_path / "belt.frames")
+    frames = synthetic_frames(12)
+    # A frame store keeps the frames exact, a video codec would not
+    with open(store, "wb") as f:
+        f.write(_pack_header({"shape": list(frames[0].shape),
+                              "dtype": "uint8", "fps": 10, "every": 1,
+                              "count": len(frames)}))
+        assert f.tell() == ALIGNMENT
+        for frame in frames:
+            f.write(frame.tobytes())
+    config = tmp_path / "config.json"
+    item = {"video": store}
+    config.write_text(json.dumps({"inputs": [item], "parameters": {
+        "frame_number": 1, "idle_threshold": 0,
+        "object_area_min": 5000}}))
+    return item, str(config), frames
+
+
+def test_workers_give_the_results_of_one_process(video_input):
+    item, config_file, frames = video_input
+    params = Parameters({"frame_number": 1, "idle_threshold": 0,
+                         "object_area_min": 5000})
+    lanes = load_lanes(item, FRAME_SIZE)
+    profile = load_profile(item, FRAME_SIZE, 0.5, None, lanes.origin)
+    expected = []
+    for index, frame in enumerate(frames):
+        objects, _ = inspect_frame(lanes.apply(frame), params, profile,
+                                   lanes)
+        expected.append((index + 1, [(obj["length"], obj["width"],
+                                      obj["orientation"], obj["no_defect"])
+                                     for obj in objects]))
+
+    fanout = FanOut(item, config_file, FRAME_SIZE, 0.5, None, 2)
+    fanout.start()
+    try:
+        received = [(frame_index, [(obj["length"], obj["width"],
+                                    obj["orientation"], obj["no_defect"])
+                                   for obj in objects])
+                    for kind, frame_index, version, objects
+                    in fanout.results()]
+    finally:
+        fanout.close()
+    assert received == expected
+    assert any(objects for _, objects in expected)
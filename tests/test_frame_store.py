@@ -0,0 +1,71 @@
+"""Tests of the memory-mapped frame store."""
+import cv2
+import numpy as np
+import pytest
+
+from frame_store import ALIGNMENT, FrameStoreCapture, open_store, write_store
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10,
+                             (64, 48))
+    for i in range(7):
+        writer.write(np.full((48, 64, 3), i * 30, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def decode(video):
+    cap = cv2.VideoCapture(video)
+    frames = []
+    ret, frame = cap.read()
+    while ret:
+        frames.append(frame)
+        ret, frame = cap.read()
+    cap.release()
+    return frames
+
+
+def test_store_holds_the_decoded_frames(video, tmp_path):
+    store = str(tmp_path / "video.frames")
+    assert write_store(video, store) == 7
+    header, frames = open_store(store)
+    assert header["shape"] == [48, 64, 3]
+    assert header["fps"] == 10
+    assert frames.offset == ALIGNMENT
+    assert np.array_equal(frames, np.array(decode(video)))
+
+
+def test_store_every_nth_frame(video, tmp_path):
+    store = str(tmp_path / "video.frames")
+    assert write_store(video, store, every=3) == 2
+    header, frames = open_store(store)
+    decoded = decode(video)
+    assert header["every"] == 3
+    assert np.array_equal(frames[0], decoded[2])
+    assert np.array_equal(frames[1], decoded[5])
+
+
+def test_capture(video, tmp_path):
+    store = str(tmp_path / "video.frames")
+    write_store(video, store, every=2)
+    cap = FrameStoreCapture(store)
+    assert cap.frame_step == 2
+    assert cap.get(cv2.CAP_PROP_FRAME_WIDTH) == 64
+    assert cap.get(cv2.CAP_PROP_FRAME_HEIGHT) == 48
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 3
+    assert cap.set(cv2.CAP_PROP_POS_FRAMES, 2)
+    ret, frame = cap.read()
+    assert ret and not frame.flags.writeable
+    assert cap.read() == (False, None)
+    cap.release()
+    assert not cap.isOpened()
+
+
+def test_not_a_store(tmp_path):
+    path = tmp_path / "other.frames"
+    path.write_bytes(b"\0" * 100)
+    with pytest.raises(IOError):
+        open_store(str(path))
@@ -0,0 +1,53 @@
+"""Tests of the polygonal belt lanes."""
+import numpy as np
+
+from lanes import Lanes, load_lanes
+
+ITEM = {"lanes": [
+    {"name": "top", "points": [[10, 10], [109, 10], [109, 49], [10, 49]]},
+    {"points": [[10, 60], [109, 60], [109, 99], [10, 99]]},
+]}
+
+
+def test_without_lanes_the_frame_is_untouched():
+    lanes = load_lanes({}, (320, 240))
+    frame = np.ones((240, 320, 3), dtype=np.uint8)
+    assert lanes.apply(frame) is frame
+    out = np.zeros_like(frame)
+    assert lanes.apply(frame, out) is out
+    assert out.all()
+    assert lanes.names == ["belt"]
+    assert lanes.lane_of(np.array([[[5, 5]]])) == 0
+
+
+def test_frames_are_cropped_and_masked():
+    lanes = load_lanes(ITEM, (320, 240))
+    assert lanes.names == ["top", "lane2"]
+    assert lanes.origin == (10, 10)
+    assert lanes.size == (100, 90)
+    frame = np.full((240, 320, 3), 200, dtype=np.uint8)
+    cropped = lanes.apply(frame)
+    assert cropped.shape == (90, 100, 3)
+    # Inside the lanes, then the gap between them
+    assert cropped[0, 0].tolist() == [200, 200, 200]
+    assert cropped[45, 50].tolist() == [0, 0, 0]
+    assert cropped[89, 99].tolist() == [200, 200, 200]
+
+
+def test_lanes_are_clipped_to_the_frame():
+    lanes = Lanes((50, 50), [[[-10, -10], [100, -10], [100, 100]]])
+    assert lanes.origin == (0, 0)
+    assert lanes.size == (50, 50)
+    assert lanes.apply(np.ones((50, 50, 3), dtype=np.uint8)).shape == \
+        (50, 50, 3)
+
+
+def test_lane_of_object_center():
+    lanes = load_lanes(ITEM, (320, 240))
+    top = np.array([[[20, 5]], [[60, 5]], [[60, 30]], [[20, 30]]])
+    bottom = top + (0, 60)
+    assert lanes.lane_of(top) == 0
+    assert lanes.lane_of(bottom) == 1
+    assert lanes.count(1) == 1
+    assert lanes.count(1) == 2
+    assert lanes.counts.tolist() == [0, 2]
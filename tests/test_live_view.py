@@ -0,0 +1,86 @@
+"""Tests of the MJPEG live view."""
+import http.client
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from live_view import BOUNDARY, LiveView
+
+
+@pytest.fixture
+def live_view():
+    view = LiveView(0, host="127.0.0.1", fps=100, width=32)
+    yield view
+    view.close()
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+def test_publish_without_viewers_does_nothing(live_view):
+    live_view.publish(np.zeros((48, 64, 3), dtype=np.uint8))
+    time.sleep(0.05)
+    assert live_view.sequence == 0
+
+
+def test_frames_are_encoded_once_and_resized(live_view):
+    live_view.viewers = 1
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    live_view.publish(frame)
+    # The frame is copied, the caller may draw on it again
+    frame[:] = 255
+    sequence, jpeg = live_view.next_jpeg(0)
+    assert sequence == 1
+    image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (24, 32, 3)
+    assert image.max() < 16
+
+
+def test_stream(live_view):
+    port = live_view.server.server_address[1]
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request("GET", "/")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.getheader("Content-Type") == \
+        "multipart/x-mixed-replace; boundary={}".format(BOUNDARY)
+    wait_for(lambda: live_view.viewers == 1)
+
+    def publish():
+        while live_view.sequence == 0:
+            live_view.publish(np.zeros((48, 64, 3), dtype=np.uint8))
+            time.sleep(0.02)
+
+    thread = threading.Thread(target=publish, daemon=True)
+    thread.start()
+    assert response.readline() == "--{}\r\n".format(BOUNDARY).encode()
+    assert response.readline() == b"Content-Type: image/jpeg\r\n"
+    length = int(response.readline().split(b":")[1])
+    response.readline()
+    assert response.read(length)[:2] == b"\xff\xd8"
+    thread.join(5)
+    response.close()
+    connection.close()
+
+    # A viewer that left is noticed when the next frame is sent to it
+    def left():
+        live_view.publish(np.zeros((48, 64, 3), dtype=np.uint8))
+        return live_view.viewers == 0
+
+    wait_for(left)
+
+
+def test_unknown_path(live_view):
+    port = live_view.server.server_address[1]
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request("GET", "/other")
+    assert connection.getresponse().status == 404
+    connection.close()
@@ -0,0 +1,55 @@
+"""Tests of the idle belt detection."""
+import json
+
+import numpy as np
+
+from motion import IdleDetector
+
+
+def frame(value):
+    return np.full((240, 320, 3), value, dtype=np.uint8)
+
+
+def test_first_frame_is_never_idle():
+    idle = IdleDetector()
+    assert not idle.check(frame(0), 2.0)
+    assert not idle.idle
+
+
+def test_idle_until_the_scene_changes():
+    idle = IdleDetector()
+    idle.check(frame(100), 2.0)
+    idle.inspected()
+    assert idle.check(frame(101), 2.0)
+    assert idle.idle
+    # Still idle, the state did not change
+    assert not idle.check(frame(100), 2.0)
+    moving = frame(100)
+    moving[:120] = 200
+    assert idle.check(moving, 2.0)
+    assert not idle.idle
+
+
+def test_reference_is_the_last_inspected_frame():
+    idle = IdleDetector()
+    idle.check(frame(100), 2.0)
+    idle.inspected()
+    # Slow drift, compared with the inspected frame and not the last one
+    for value in (101, 102, 103):
+        idle.check(frame(value), 2.0)
+    assert not idle.idle
+
+
+def test_state_round_trip():
+    idle = IdleDetector()
+    idle.check(frame(50), 2.0)
+    idle.inspected()
+    idle.check(frame(50), 2.0)
+    idle.skipped = 4
+    state = json.loads(json.dumps(idle.state()))
+    restored = IdleDetector()
+    restored.restore(state)
+    assert restored.idle and restored.skipped == 4
+    assert not restored.check(frame(50), 2.0)
+    assert restored.idle
+    assert IdleDetector().state()["reference"] is None
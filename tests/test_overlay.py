@@ -0,0 +1,52 @@
+"""Tests of the cached text overlay."""
+import cv2
+import numpy as np
+
+from overlay import WHITE, Overlay, hud_lines
+
+
+def put_text(frame, lines):
+    for text, origin, font, scale in lines:
+        cv2.putText(frame, text, origin, font, scale, WHITE, 2)
+    return frame
+
+
+def test_hud_lines():
+    lines = hud_lines("Object Number : 3", "Color", 30.5, 10.25)
+    assert [line[0] for line in lines] == [
+        "Press q to quit", "Object Number : 3", "Defect: Color",
+        "Length (mm): 30.5", "Width (mm): 10.25"]
+    assert len(hud_lines("", "", 0, 0, quit_hint=False)) == 4
+
+
+def test_overlay_matches_put_text_on_a_black_frame():
+    lines = hud_lines("Object Number : 3", "Color Crack", 30.5, 10.25)
+    expected = put_text(np.zeros((480, 640, 3), dtype=np.uint8), lines)
+    drawn = Overlay().draw(np.zeros((480, 640, 3), dtype=np.uint8), lines)
+    # The blend rounds the anti-aliased edges to within one level
+    assert np.abs(drawn.astype(int) - expected).max() <= 1
+    assert (drawn == 255).sum() == (expected == 255).sum()
+
+
+def test_only_changed_lines_are_rendered():
+    overlay = Overlay()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    lines = hud_lines("Object Number : 1", "", 1, 1)
+    overlay.draw(frame, lines)
+    tiles = dict(overlay.tiles)
+    lines = hud_lines("Object Number : 2", "", 1, 1)
+    overlay.draw(frame, lines)
+    assert len(overlay.tiles) == len(lines)
+    for line in lines:
+        if line[0] == "Object Number : 2":
+            assert line not in tiles
+        else:
+            assert overlay.tiles[line] is tiles[line]
+
+
+def test_lines_outside_the_frame_are_clipped():
+    frame = np.full((60, 100, 3), 7, dtype=np.uint8)
+    Overlay().draw(frame, hud_lines("Object Number : 1", "", 1, 1))
+    # Only the object count fits, the rest of the frame is untouched
+    assert frame[55:, :].tolist() == np.full((5, 100, 3), 7).tolist()
+    assert frame.max() == 255
@@ -0,0 +1,103 @@
+"""Tests of the detector parameters and their hot reload."""
+import json
+import os
+
+import pytest
+
+from parameters import (DEFAULT_PARAMETERS, ParameterWatcher, Parameters,
+                        load_parameters)
+
+
+def write_config(path, parameters, mtime=None):
+    with open(str(path), "w") as f:
+        json.dump({"inputs": [], "parameters": parameters}, f)
+    if mtime is not None:
+        os.utime(str(path), (mtime, mtime))
+
+
+def test_defaults():
+    parameters = Parameters({})
+    assert parameters.frame_number == DEFAULT_PARAMETERS["frame_number"]
+    assert parameters.blur_size == (7, 7)
+    assert parameters.kernel.shape == (5, 5)
+
+
+@pytest.mark.parametrize("values", [
+    [],
+    {"unknown": 1},
+    {"frame_number": True},
+    {"frame_number": 0},
+    {"frame_number": 4.0},
+    {"kernel_size": "5"},
+    {"version": -1},
+    {"canny_ratio": None},
+    {"orientation_angle": False},
+    {"object_color_low": [0, 0]},
+    {"object_color_low": [0, 0, "47"]},
+    {"object_color_low": "0,0,47"},
+    {"defect_color_high": [180, 255, 255]},
+    {"object_area_min": 60000},
+    {"idle_threshold": -1},
+])
+def test_invalid_parameters(values):
+    with pytest.raises(ValueError):
+        Parameters(values)
+
+
+def test_load_parameters(tmp_path):
+    config = tmp_path / "config.json"
+    write_config(config, {"version": 2, "frame_number": 10})
+    parameters = load_parameters(str(config))
+    assert (parameters.version, parameters.frame_number) == (2, 10)
+    config.write_text("[]")
+    with pytest.raises(ValueError):
+        load_parameters(str(config))
+
+
+def test_watcher_swaps_new_versions(tmp_path):
+    config = tmp_path / "config.json"
+    write_config(config, {"version": 1}, mtime=1000)
+    watcher = ParameterWatcher(str(config))
+    assert not watcher.poll()
+    write_config(config, {"version": 1, "frame_number": 5}, mtime=1001)
+    # Same version, the running parameters are kept
+    assert not watcher.poll()
+    write_config(config, {"version": 2, "frame_number": 5}, mtime=1002)
+    assert watcher.poll()
+    assert watcher.current.frame_number == 5
+
+
+def test_watcher_keeps_the_parameters_of_a_bad_file(tmp_path):
+    config = tmp_path / "config.json"
+    write_config(config, {"version": 1}, mtime=1000)
+    watcher = ParameterWatcher(str(config))
+    running = watcher.current
+    write_config(config, {"version": 2, "kernel_size": True}, mtime=1001)
+    assert not watcher.poll()
+    config.write_text("{")
+    os.utime(str(config), (1002, 1002))
+    assert not watcher.poll()
+    config.write_text('{"parameters": []}')
+    os.utime(str(config), (1003, 1003))
+    assert not watcher.poll()
+    assert watcher.current is running
+
+
+def test_watcher_thread_survives_errors_and_stops(tmp_path, monkeypatch):
+    config = tmp_path / "config.json"
+    write_config(config, {"version": 1})
+    watcher = ParameterWatcher(str(config), interval=0.01)
+    polls = []
+
+    def poll():
+        polls.append(1)
+        if len(polls) == 1:
+            raise TypeError("unexpected")
+        if len(polls) == 3:
+            watcher.stop()
+
+    monkeypatch.setattr(watcher, "poll", poll)
+    watcher.start()
+    watcher.join(5)
+    assert not watcher.is_alive()
+    assert len(polls) == 3
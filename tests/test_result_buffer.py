@@ -0,0 +1,88 @@
+"""Tests of the columnar result buffer."""
+import numpy as np
+import pytest
+
+from result_buffer import RESULT_COLUMNS, ResultBuffer
+
+
+def fill(buffer, count):
+    for i in range(count):
+        buffer.append(object_id=i + 1, frame_index=i * 5,
+                      timestamp=1000.0 + i, length=10.5 + i, color=i % 2,
+                      no_defect=1 - i % 2, param_version=3, lane=i % 2)
+
+
+def test_append_grows_in_chunks():
+    buffer = ResultBuffer(chunk_size=4)
+    fill(buffer, 10)
+    assert len(buffer) == 10
+    assert len(buffer.columns["object_id"]) == 12
+    assert buffer.column("object_id").tolist() == list(range(1, 11))
+    assert buffer.column("length", 2, 4).tolist() == [12.5, 13.5]
+
+
+def test_unset_columns_are_zero():
+    buffer = ResultBuffer()
+    buffer.append(object_id=7)
+    assert buffer.column("crack").tolist() == [0]
+    assert buffer.column("width").tolist() == [0.0]
+
+
+def test_extend_round_trips_records():
+    buffer = ResultBuffer(chunk_size=4)
+    fill(buffer, 6)
+    copy = ResultBuffer(chunk_size=4)
+    copy.extend(buffer.to_records())
+    copy.extend(buffer.to_records(4))
+    assert len(copy) == 8
+    assert copy.to_records(0, 6).tolist() == buffer.to_records().tolist()
+    assert copy.column("object_id", 6).tolist() == [5, 6]
+
+
+def test_influx_points():
+    buffer = ResultBuffer()
+    fill(buffer, 3)
+    points = buffer.influx_points(1, lane_names=["left", "right"])
+    assert len(points) == 2
+    point = points[0]
+    assert point["measurement"] == "obj_flaw_detector"
+    assert point["time"] == 1001000000
+    assert point["tags"] == {"user": "User", "param_version": 3,
+                             "lane": "right"}
+    assert point["fields"]["Object Number"] == 2
+    assert point["fields"]["Color"] == 1
+    assert point["fields"]["No defect"] == 0
+    assert "lane" not in buffer.influx_points()[0]["tags"]
+
+
+def test_save_npy_and_csv(tmp_path):
+    buffer = ResultBuffer()
+    fill(buffer, 3)
+    buffer.save_npy(str(tmp_path / "results.npy"))
+    records = np.load(str(tmp_path / "results.npy"))
+    assert records.dtype.names == tuple(name for name, _ in RESULT_COLUMNS)
+    assert records["object_id"].tolist() == [1, 2, 3]
+    buffer.save_csv(str(tmp_path / "results.csv"))
+    lines = (tmp_path / "results.csv").read_text().splitlines()
+    assert lines[0].split(",")[:3] == [
+        "object_id", "frame_index", "timestamp"]
+    assert lines[2].startswith("2,5,1001.000000,11.500000")
+
+
+class Client:
+    def __init__(self):
+        self.written = []
+
+    def write_points(self, points, **kwargs):
+        self.written.append(points)
+
+    def query(self, query):
+        return None
+
+
+def test_points_are_written_at_once(monkeypatch):
+    detector = pytest.importorskip("object_flaw_detector")
+    client = Client()
+    monkeypatch.setattr(detector, "client", client, raising=False)
+    detector.update_data([{"measurement": "obj_flaw_detector"}])
+    assert client.written == [[{"measurement": "obj_flaw_detector"}]]
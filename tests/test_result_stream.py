@@ -0,0 +1,134 @@
+"""Tests of the result stream."""
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from result_buffer import ResultBuffer
+from result_stream import (HEADER, MAGIC, RECORD, RECORD_STRUCT,
+                           ResultStream, Subscriber, encode_results,
+                           subscribe)
+from shedding import SHED_CROPS
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+def results(count):
+    buffer = ResultBuffer()
+    for i in range(count):
+        buffer.append(object_id=i + 1, frame_index=40 * i,
+                      timestamp=1500000000.25 + i, length=30.5, width=10.25,
+                      angle=0.5, orientation=1, crack=i % 2,
+                      param_version=2, lane=1,
+                      shed=SHED_CROPS if i == 2 else 0)
+    return buffer
+
+
+def test_encode_results():
+    assert RECORD.itemsize == RECORD_STRUCT.size
+    records = np.frombuffer(encode_results(results(3), 0, 3), dtype=RECORD)
+    assert records["object_id"].tolist() == [1, 2, 3]
+    assert records["timestamp"].tolist() == [1500000000250000,
+                                             1500000001250000,
+                                             1500000002250000]
+    assert records["length"].tolist() == [30.5] * 3
+    # Orientation is bit 0 and crack bit 2, see DEFECT_FIELDS
+    assert records["flags"].tolist() == [1, 5, 1]
+    # The images of the third object were shed
+    assert records["crops"].tolist() == [1, 5, 0]
+    assert records["shed"].tolist() == [0, 0, SHED_CROPS]
+    assert encode_results(results(3), 1) == \
+        encode_results(results(3), 0, 3)[RECORD.itemsize:
+                                         2 * RECORD.itemsize]
+
+
+@pytest.mark.parametrize("policy, queued, dropped, closed", [
+    ("drop_oldest", [b"c", b"d"], 2, False),
+    ("drop_newest", [b"a", b"b"], 2, False),
+    ("disconnect", [], 3, True),
+])
+def test_full_queue_policies(policy, queued, dropped, closed):
+    connection, other = socket.socketpair()
+    subscriber = Subscriber(connection, policy, 2)
+    for record in (b"a", b"b", b"c", b"d"):
+        subscriber.offer(record)
+    assert list(subscriber.queue) == queued
+    assert subscriber.dropped == dropped
+    assert subscriber.closed == closed
+    connection.close()
+    other.close()
+
+
+def test_stream_in_order_and_forgets_gone_subscribers(tmp_path):
+    stream = ResultStream(str(tmp_path / "stream.sock"))
+    try:
+        connection = socket.socket(socket.AF_UNIX)
+        connection.connect(stream.address)
+        connection.sendall(b"drop_newest 64\n")
+        stream_file = connection.makefile("rb")
+        magic, version, itemsize = HEADER.unpack(
+            stream_file.read(HEADER.size))
+        assert (magic, itemsize) == (MAGIC, RECORD.itemsize)
+        wait_for(lambda: len(stream.subscribers) == 1)
+        buffer = results(5)
+        for row in range(5):
+            stream.publish(encode_results(buffer, row))
+        records = np.frombuffer(stream_file.read(5 * RECORD.itemsize),
+                                dtype=RECORD)
+        assert records["object_id"].tolist() == [1, 2, 3, 4, 5]
+        stream_file.close()
+        connection.close()
+
+        # A subscriber that left is noticed on the next write to it
+        def gone():
+            stream.publish(encode_results(buffer, 0))
+            return not stream.subscribers and not stream._threads
+
+        wait_for(gone)
+        subscribed, sent, dropped = stream.stats()
+        assert subscribed == 1
+        assert sent >= 5
+    finally:
+        stream.close()
+    assert not (tmp_path / "stream.sock").exists()
+
+
+def test_subscribe(tmp_path):
+    stream = ResultStream(str(tmp_path / "stream.sock"))
+    received = subscribe(stream.address)
+    try:
+        # Subscribes on the first read, then waits for the records
+        records = []
+        reader = threading.Thread(
+            target=lambda: records.append(next(received)), daemon=True)
+        reader.start()
+        wait_for(lambda: stream.subscribers)
+        stream.publish(encode_results(results(1), 0))
+        reader.join(5)
+        assert records[0]["object_id"].tolist() == [1]
+    finally:
+        stream.close()
+        received.close()
+
+
+def test_invalid_requests_are_closed(tmp_path):
+    stream = ResultStream(str(tmp_path / "stream.sock"))
+    try:
+        connection = socket.socket(socket.AF_UNIX)
+        connection.connect(stream.address)
+        connection.sendall(b"never 10\n")
+        assert connection.recv(16) == b""
+        connection.close()
+        assert stream.stats() == (0, 0, 0)
+        with pytest.raises(ValueError):
+            ResultStream(str(tmp_path / "other.sock"), policy="never")
+    finally:
+        stream.close()
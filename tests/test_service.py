@@ -0,0 +1,181 @@
+"""Tests of the HTTP inspection service."""
+import asyncio
+import io
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from service import (NPY_TYPE, HTTPError, InspectionService, Inspector,
+                     MicroBatcher, body_length, decode, read_head)
+
+
+def object_frame():
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    cv2.rectangle(frame, (60, 80), (259, 149), (180, 180, 180), -1)
+    return frame
+
+
+def npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("method, headers, expected", [
+    ("GET", {}, 0),
+    ("POST", {"content-length": "12"}, 12),
+])
+def test_body_length(method, headers, expected):
+    assert body_length(method, headers) == expected
+
+
+@pytest.mark.parametrize("method, headers, status", [
+    ("POST", {}, 411),
+    ("POST", {"transfer-encoding": "chunked"}, 411),
+    ("POST", {"content-length": "abc"}, 400),
+    ("POST", {"content-length": "-5"}, 400),
+    ("POST", {"content-length": str(1 << 40)}, 413),
+])
+def test_body_length_errors(method, headers, status):
+    with pytest.raises(HTTPError) as error:
+        body_length(method, headers)
+    assert error.value.status == status
+
+
+def read(data):
+    async def run():
+        reader = asyncio.StreamReader(limit=256)
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_head(reader)
+    return asyncio.run(run())
+
+
+def test_read_head():
+    assert read(b"POST /inspect HTTP/1.1\r\nContent-Length: 3\r\n"
+                b"X-Name:  a:b \r\n\r\nabc") == \
+        ("POST", "/inspect", {"content-length": "3", "x-name": "a:b"})
+    assert read(b"") is None
+
+
+@pytest.mark.parametrize("data", [
+    b"GET /\r\n\r\n",
+    b"GET / HTTP/1.1\r\nNo colon\r\n\r\n",
+    b"GET / HTTP/1.1\r\nX: " + b"a" * 1000 + b"\r\n\r\n",
+    b"GET /" + b"a" * 1000 + b" HTTP/1.1\r\n\r\n",
+])
+def test_read_head_errors(data):
+    with pytest.raises(HTTPError) as error:
+        read(data)
+    assert error.value.status == 400
+
+
+def test_decode():
+    frame = object_frame()
+    ret, png = cv2.imencode(".png", frame)
+    assert np.array_equal(decode(png.tobytes(), "image/png"), frame)
+    assert np.array_equal(decode(npy(frame), NPY_TYPE), frame)
+    gray = decode(npy(frame[:, :, 0].copy()), NPY_TYPE)
+    assert gray.shape == (240, 320, 3)
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b"not an image", "image/png"),
+    (b"", "image/png"),
+    (b"\x93NUMPY garbage", NPY_TYPE),
+    (npy(np.zeros((4, 4), dtype=np.float32)), NPY_TYPE),
+    (npy(np.zeros((4, 4, 4), dtype=np.uint8)), NPY_TYPE),
+    (npy(np.array([{"a": 1}], dtype=object)), NPY_TYPE),
+])
+def test_decode_errors(body, content_type):
+    with pytest.raises(Exception):
+        decode(body, content_type)
+
+
+def test_micro_batcher_groups_queued_frames():
+    batches = []
+
+    def process(frames):
+        batches.append(list(frames))
+        return [frame * 2 for frame in frames]
+
+    async def run():
+        batcher = MicroBatcher(process, max_batch=3)
+        results = await asyncio.gather(*(batcher.submit(value)
+                                         for value in range(5)))
+        return results, batcher
+
+    results, batcher = asyncio.run(run())
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2], [3, 4]]
+    assert (batcher.batches, batcher.frames) == (2, 5)
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"inputs": [], "parameters": {
+        "version": 3, "object_area_min": 5000}}))
+    return str(config)
+
+
+async def request(port, data, replies=1):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    answers = []
+    for _ in range(replies):
+        status = (await reader.readline()).split()[1]
+        headers = {}
+        line = await reader.readline()
+        while line != b"\r\n":
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+            line = await reader.readline()
+        body = await reader.readexactly(int(headers.get("content-length",
+                                                        0)))
+        answers.append((int(status), json.loads(body) if body else None))
+    writer.close()
+    return answers
+
+
+def test_service(config_file):
+    inspector = Inspector(config_file, threads=2)
+    ret, png = cv2.imencode(".png", object_frame())
+    png = png.tobytes()
+
+    async def run():
+        service = InspectionService(inspector, 4, 0, 2)
+        service.batcher = MicroBatcher(inspector.inspect_batch, 4)
+        server = await asyncio.start_server(service._connection,
+                                            "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        head = ("POST /inspect HTTP/1.1\r\nContent-Type: image/png\r\n"
+                "Content-Length: {}\r\n".format(len(png)))
+        answers = await request(port, head.encode() + b"\r\n" + png +
+                                head.encode() + b"\r\n" + png, 2)
+        answers += await request(port, head.encode() +
+                                 b"Expect: 100-continue\r\n\r\n" + png, 2)
+        answers += await request(port, b"POST /inspect HTTP/1.1\r\n"
+                                 b"Transfer-Encoding: chunked\r\n\r\n")
+        answers += await request(port, b"POST /inspect HTTP/1.1\r\n"
+                                 b"Content-Type: image/png\r\n"
+                                 b"Content-Length: 4\r\n\r\nabcd")
+        answers += await request(port, b"GET /inspect HTTP/1.1\r\n\r\n")
+        answers += await request(port, b"GET /stats HTTP/1.1\r\n\r\n")
+        server.close()
+        return answers
+
+    try:
+        answers = asyncio.run(run())
+    finally:
+        inspector.watcher.stop()
+    statuses = [status for status, payload in answers]
+    assert statuses == [200, 200, 100, 200, 411, 400, 405, 200]
+    result = answers[0][1]
+    assert result["param_version"] == 3
+    assert len(result["objects"]) == 1
+    assert result["objects"][0]["box"] == [60, 80, 200, 70]
+    assert answers[-1][1]["frames"] == 3
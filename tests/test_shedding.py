@@ -0,0 +1,83 @@
+"""Tests of the load shedding tiers."""
+import cv2
+import numpy as np
+
+from calibration import CalibrationProfile
+from inspection import NO_DEFECT, inspect_frame, object_defects
+from lanes import Lanes
+from parameters import Parameters
+from shedding import (SHED_CRACK, SHED_CROPS, SHED_DISPLAY, SHED_FRAMES,
+                      LoadShedder)
+
+
+def test_without_budget_nothing_is_shed():
+    shedder = LoadShedder(0)
+    assert not shedder.update(10.0)
+    assert shedder.level == 0
+    assert not shedder.drop_frame()
+    assert shedder.show_frame(3)
+    assert shedder.describe() == "none"
+
+
+def test_tiers_rise_with_every_slow_frame():
+    shedder = LoadShedder(0.1)
+    expected = [SHED_CRACK, SHED_CRACK | SHED_CROPS,
+                SHED_CRACK | SHED_CROPS | SHED_DISPLAY,
+                SHED_CRACK | SHED_CROPS | SHED_DISPLAY | SHED_FRAMES]
+    for actions in expected:
+        assert shedder.update(0.2)
+        assert shedder.actions == actions
+    assert not shedder.update(0.2)
+    assert shedder.describe() == "crack crops display frames"
+
+
+def test_tiers_fall_after_fast_frames_in_a_row():
+    shedder = LoadShedder(0.1, recover_frames=3)
+    shedder.update(0.2)
+    shedder.update(0.2)
+    assert not shedder.update(0.01)
+    assert not shedder.update(0.01)
+    # Within the budget but not fast enough, starts the count again
+    assert not shedder.update(0.08)
+    assert not shedder.update(0.01)
+    assert not shedder.update(0.01)
+    assert shedder.update(0.01)
+    assert shedder.level == 1
+
+
+def test_dropped_frames_and_display_are_counted():
+    shedder = LoadShedder(0.1, display_every=5)
+    for _ in range(4):
+        shedder.update(0.2)
+    assert [shedder.drop_frame() for _ in range(4)] == \
+        [True, False, True, False]
+    assert [shedder.show_frame(count) for count in range(1, 6)] == \
+        [False, False, False, False, True]
+    shedder.count(SHED_CRACK, 3)
+    assert shedder.counts == {"crack": 3, "crops": 0, "display": 4,
+                              "frames": 2}
+
+
+def test_state_round_trip():
+    shedder = LoadShedder(0.1)
+    shedder.update(0.2)
+    shedder.update(0.01)
+    shedder.count(SHED_CROPS)
+    restored = LoadShedder(0.1)
+    restored.restore(shedder.state())
+    assert restored.state() == shedder.state()
+
+
+def test_shed_crack_check_is_not_reported_defect_free():
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    cv2.rectangle(frame, (60, 80), (259, 149), (180, 180, 180), -1)
+    params = Parameters({"object_area_min": 5000})
+    profile = CalibrationProfile((320, 240), 0.25)
+    lanes = Lanes((320, 240))
+    objects, _ = inspect_frame(frame, params, profile, lanes)
+    assert objects[0]["no_defect"]
+    assert object_defects(objects[0]) == [NO_DEFECT[0]]
+    objects, _ = inspect_frame(frame, params, profile, lanes, crack=False)
+    assert not objects[0]["crack"]
+    assert not objects[0]["no_defect"]
+    assert object_defects(objects[0]) == []
@@ -0,0 +1,80 @@
+"""Tests of the soak test harness."""
+import json
+
+import pytest
+
+import soak
+
+
+def samples(count=6, rss=50.0, rss_step=0.0, fds=5, fd_step=0,
+            objects_step=10, crops_per_object=1, p99=5.0, p99_step=0.0):
+    return [{
+        "elapsed": 60.0 * (i + 1),
+        "objects": objects_step * (i + 1),
+        "rss_mb": rss + rss_step * i,
+        "results_mb": 0.01 * i,
+        "fds": fds + fd_step * i,
+        "crop_files": crops_per_object * objects_step * (i + 1),
+        "p99_ms": p99 + p99_step * i,
+    } for i in range(count)]
+
+
+def thresholds(*argv):
+    return soak.build_argparser().parse_args(list(argv))
+
+
+def test_no_drift():
+    assert soak.drift(samples(), 60, thresholds()) == []
+
+
+def test_results_memory_is_not_drift():
+    grown = samples()
+    for sample in grown:
+        sample["rss_mb"] += sample["results_mb"] * 1000
+        sample["results_mb"] *= 1000
+    assert soak.drift(grown, 60, thresholds()) == []
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"rss_step": 1.0}, "RSS grows"),
+    ({"fd_step": 1}, "file descriptors opened"),
+    ({"crops_per_object": 4}, "images saved for"),
+    ({"p99_step": 5.0}, "p99 latency grew"),
+])
+def test_drift(kwargs, message):
+    failures = soak.drift(samples(**kwargs), 60, thresholds())
+    assert len(failures) == 1
+    assert message in failures[0]
+
+
+def test_crop_file_bound():
+    failures = soak.drift(samples(), 60, thresholds("--max_crop_files", "50"))
+    assert failures == ["60 images saved"]
+
+
+def test_samples_before_the_warm_up_are_ignored():
+    assert soak.drift(samples(rss_step=100.0), 400, thresholds()) == \
+        ["Not enough samples after the warm up"]
+
+
+def test_soak_drives_the_detector(tmp_path, capsys):
+    # The detector needs the client of InfluxDB, even when it is not used
+    pytest.importorskip("influxdb")
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"inputs": [], "parameters": {
+        "version": 1, "idle_threshold": 0}}))
+    directory = tmp_path / "crops"
+    args = thresholds("-c", str(config), "-s", "320x240", "-t", "3",
+                      "-wu", "0", "-si", "0.5", "-e", "1", "--top", "0",
+                      "-dir", str(directory), "--max_rss_growth", "1e9",
+                      "--max_latency_drift", "1e9")
+    failures = soak.soak(args)
+    assert failures == []
+    lines = [line for line in capsys.readouterr().out.splitlines()
+             if line.startswith("elapsed=")]
+    assert len(lines) >= 4
+    last = dict(field.split("=") for field in lines[-1].split())
+    assert int(last["objects"]) > 0
+    assert 0 < int(last["crop_files"]) <= 3 * int(last["objects"])
+    assert int(last["crop_files"]) == sum(
+        1 for path in directory.rglob("*") if path.is_file())
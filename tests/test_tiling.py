@@ -0,0 +1,95 @@
+"""Tests of the tiled inspection, which must match the untiled one."""
+import cv2
+import numpy as np
+import pytest
+
+import inspection
+from calibration import CalibrationProfile
+from lanes import Lanes
+from parameters import Parameters
+from tiling import Tiler, benchmark, parse_tile, tile_grid
+
+PARAMS = Parameters({"object_area_min": 2000, "color_area_min": 50,
+                     "canny_low_threshold": 40})
+
+
+def same(first, second):
+    if isinstance(first, np.ndarray):
+        return np.array_equal(first, second)
+    if isinstance(first, (list, tuple)):
+        return len(first) == len(second) and \
+            all(same(a, b) for a, b in zip(first, second))
+    return first == second
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.RandomState(7)
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    for i in range(5):
+        center = (int(rng.randint(40, 280)), int(rng.randint(40, 200)))
+        box = cv2.boxPoints((center, (110, 45), float(rng.randint(0, 180))))
+        cv2.fillPoly(frame, [box.astype(np.int32)],
+                     tuple(int(value) for value in rng.randint(60, 220, 3)))
+    # Long lines and texture, so edges and areas cross the seams
+    for i in range(6):
+        cv2.line(frame, tuple(int(v) for v in rng.randint(0, 320, 2)),
+                 tuple(int(v) for v in rng.randint(0, 240, 2)),
+                 (30, 30, 30), 2)
+    noise = cv2.GaussianBlur(rng.randint(0, 40, frame.shape).astype(np.uint8),
+                             (5, 5), 0)
+    return cv2.add(frame, noise)
+
+
+def test_parse_tile():
+    assert parse_tile("512") == (512, 512)
+    assert parse_tile("1024x0") == (1024, 0)
+    assert parse_tile("0") is None
+
+
+def test_tile_grid_covers_the_frame():
+    assert tile_grid((100, 250, 3), (100, 0)) == [
+        (0, 0, 100, 100), (100, 0, 100, 100), (200, 0, 50, 100)]
+    tiles = tile_grid((240, 320, 3), (64, 100))
+    covered = np.zeros((240, 320), dtype=np.int32)
+    for x, y, w, h in tiles:
+        covered[y:y + h, x:x + w] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize("tile_size", [(64, 64), (100, 0), (0, 37),
+                                       (48, 80)])
+def test_steps_match_the_whole_frame(frame, tile_size):
+    tiler = Tiler(tile_size, 2)
+    try:
+        assert same(tiler.find_objects(frame, PARAMS),
+                    inspection.find_objects(frame, PARAMS))
+        assert same(tiler.detect_color(frame, PARAMS),
+                    inspection.detect_color(frame, PARAMS))
+        tiled = tiler.detect_crack(frame, PARAMS)
+        assert tiled[0]
+        assert same(tiled, inspection.detect_crack(frame, PARAMS))
+    finally:
+        tiler.close()
+
+
+def test_inspect_frame_with_tiles(frame):
+    profile = CalibrationProfile((320, 240), 0.5)
+    lanes = Lanes((320, 240), [[[5, 5], [314, 5], [314, 234], [5, 234]]])
+    crop = lanes.apply(frame)
+    expected, _ = inspection.inspect_frame(crop, PARAMS, profile, lanes)
+    tiler = Tiler((64, 64), 2)
+    try:
+        objects, _ = inspection.inspect_frame(crop, PARAMS, profile, lanes,
+                                              tiler=tiler)
+    finally:
+        tiler.close()
+    assert expected
+    assert same([sorted(obj.items()) for obj in objects],
+                [sorted(obj.items()) for obj in expected])
+
+
+def test_benchmark_without_frames(tmp_path, capsys):
+    item = {"video": str(tmp_path / "missing.mp4")}
+    assert not benchmark(item, {}, (320, 240), [(64, 64)], 1, 5)
+    assert "No frames read" in capsys.readouterr().out
@@ -0,0 +1,121 @@
+"""Tests of the parameter sweep."""
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import tune
+from calibration import load_profile
+from frame_store import _pack_header
+from inspection import inspect_frame
+from lanes import load_lanes
+from parameters import Parameters
+
+FRAME_SIZE = (320, 240)
+BASE = {"object_area_min": 5000}
+
+
+def test_grid():
+    assert tune.settings({"kernel_size": [3, 5], "blur_size": [7]}, 0) == [
+        {"blur_size": 7, "kernel_size": 3}, {"blur_size": 7, "kernel_size": 5}]
+
+
+def test_random_settings_are_reproducible():
+    space = {"canny_low_threshold": {"min": 100, "max": 150},
+             "orientation_angle": {"min": 0.1, "max": 0.9},
+             "object_color_low": {"min": [0, 0, 40], "max": [10, 10, 60]}}
+    settings = tune.settings(space, 20, seed=3)
+    assert settings == tune.settings(space, 20, seed=3)
+    for setting in settings:
+        assert 100 <= setting["canny_low_threshold"] <= 150
+        assert isinstance(setting["canny_low_threshold"], int)
+        assert 0.1 <= setting["orientation_angle"] <= 0.9
+        assert 40 <= setting["object_color_low"][2] <= 60
+
+
+@pytest.mark.parametrize("space, samples", [
+    ({"frame_number": [1, 2]}, 0),
+    ({"unknown": [1]}, 0),
+    ({"kernel_size": {"min": 3, "max": 7}}, 0),
+])
+def test_invalid_spaces(space, samples):
+    with pytest.raises(ValueError):
+        tune.settings(space, samples)
+
+
+def test_score():
+    labels = np.array([[1, 0, 1, 0, 0], [2, 1, 0, 0, 1]])
+    assert tune.score(labels, labels)["f1"] == 1.0
+    counts = np.array([[1, 1, 1, 0, 0], [1, 1, 0, 0, 0]])
+    scores = tune.score(counts, labels)
+    assert scores["objects_fn"] == 1
+    assert scores["orientation_fp"] == 1
+    assert scores["no_defect_fn"] == 1
+    assert scores["f1"] == round(2 * 2 / (2 * 2 + 2), 4)
+
+
+def test_load_labels(tmp_path):
+    path = tmp_path / "results.csv"
+    path.write_text("object_id,frame_index,orientation,color,crack,"
+                    "no_defect\n1,4,1,0,0,0\n2,4,0,0,0,1\n3,9,0,1,0,0\n")
+    labels = tune.load_labels(str(path), np.array([4, 8]))
+    assert labels.tolist() == [[2, 1, 0, 0, 1], [0, 0, 0, 0, 0]]
+
+
+@pytest.fixture
+def frames_store(tmp_path):
+    frames = []
+    for i in range(6):
+        frame = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+        box = cv2.boxPoints(((80 + 20 * i, 120), (150, 70), 40 * (i % 2)))
+        cv2.fillPoly(frame, [box.astype(np.int32)], (180, 180, 180))
+        frames.append(frame)
+    store = str(tmp_path / "clip.frames")
+    with open(store, "wb") as f:
+        f.write(_pack_header({"shape": list(frames[0].shape),
+                              "dtype": "uint8", "fps": 10, "every": 1,
+                              "count": len(frames)}))
+        for frame in frames:
+            f.write(frame.tobytes())
+    return store, frames
+
+
+def test_evaluate_counts_like_the_inspection(frames_store, tmp_path):
+    store, frames = frames_store
+    item = {"video": store}
+    paths = tune.build_cache(store, item, 2, str(tmp_path / "cache"))
+    assert tune.build_cache(store, item, 2, str(tmp_path / "cache")) == paths
+    tune.init_worker(paths, item, Parameters(BASE).values)
+    assert tune.CACHE["index"].tolist() == [2, 4, 6]
+    assert len(tune.CACHE["hsv"]) == 3
+    assert np.array_equal(tune.CACHE["gray"][1],
+                          cv2.cvtColor(frames[3], cv2.COLOR_BGR2GRAY))
+
+    setting = {"orientation_angle": 0.3}
+    params = Parameters(dict(BASE, **setting))
+    lanes = load_lanes(item, FRAME_SIZE)
+    profile = load_profile(item, FRAME_SIZE, 0.5, None, lanes.origin)
+    expected = []
+    for frame in frames[1::2]:
+        objects, _ = inspect_frame(lanes.apply(frame), params, profile,
+                                   lanes)
+        flags = [sum(bool(obj[flag]) for obj in objects)
+                 for flag in tune.FLAGS]
+        expected.append([len(objects)] + flags)
+    result, counts = tune.evaluate(setting)
+    assert result == setting
+    assert counts.tolist() == expected
+    assert counts[:, 0].sum() == 3
+
+    result, error = tune.evaluate({"kernel_size": 0})
+    assert isinstance(error, str)
+
+
+def test_interrupted_cache_is_built_again(frames_store, tmp_path):
+    store, frames = frames_store
+    item = {"video": store}
+    paths = tune.build_cache(store, item, 3, str(tmp_path / "cache"))
+    os.remove(paths["index"])
+    assert tune.build_cache(store, item, 3, str(tmp_path / "cache")) == paths
+    assert np.load(paths["index"]).tolist() == [3, 6]